@@ -0,0 +1 @@
+"""Offline benchmarks for the worker pipeline and API."""
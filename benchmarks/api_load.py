@@ -0,0 +1,331 @@
+"""
+Concurrency load harness for the job creation, status and long-poll endpoints.
+
+Serves the real FastAPI app with uvicorn in a background thread, drives
+POST /jobs followed by GET /jobs/{id} (long-poll or plain polling) from
+a configurable number of concurrent clients, and completes jobs from a
+stub worker on a fixed schedule instead of downloading anything.
+
+Reports request latency percentiles per endpoint, Redis commands/sec and
+event-loop lag inside the server process. Runs are reproducible for a
+given --seed; the report echoes the full configuration.
+
+Usage:
+    uv run python -m benchmarks.api_load --clients 200 --duration 60 --mode wait
+"""
+
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import platform
+import random
+import socket
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import uvicorn
+from redis import Redis
+
+from benchmarks.worker_pipeline import percentile
+from ytdl.config import settings
+from ytdl.models import JobStatus, ProgressStage
+
+LAG_PROBE_INTERVAL = 0.05
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _commands_processed(redis: Redis) -> int | None:
+    try:
+        return int(redis.info("stats")["total_commands_processed"])
+    except Exception:
+        return None
+
+
+async def _probe_lag(lags: list[float]) -> None:
+    """Measure how late the server's event loop wakes up from short sleeps."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LAG_PROBE_INTERVAL
+        await asyncio.sleep(LAG_PROBE_INTERVAL)
+        lags.append(max(loop.time() - expected, 0.0))
+
+
+def serve_app(server: uvicorn.Server, lags: list[float]) -> threading.Thread:
+    """Run uvicorn plus the lag probe on one event loop in a thread."""
+
+    async def main():
+        probe = asyncio.create_task(_probe_lag(lags))
+        try:
+            await server.serve()
+        finally:
+            probe.cancel()
+
+    thread = threading.Thread(target=lambda: asyncio.run(main()), daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return thread
+
+
+def stub_worker(stop: threading.Event, rng: random.Random, duration: float, jitter: float) -> int:
+    """
+    Take jobs off the RQ queues and complete them on a schedule.
+
+    Dispatches from the tenant queues as it goes, as a finishing worker would.
+
+    Returns:
+        Number of jobs completed
+    """
+    from rq import Queue
+    from rq.job import Job
+
+    from ytdl.connections import get_redis, queue_connections
+    from ytdl.jobs import LANES, update_job
+    from ytdl.scheduler import dispatch
+
+    redis = get_redis()
+    # Every lane on every queue shard, lanes in priority order
+    queues = [
+        Queue(lane, connection=connection) for lane in LANES for connection in queue_connections()
+    ]
+    pending: list[tuple[float, str]] = []
+    completed = 0
+
+    while not stop.is_set():
+        while dispatch(redis) or any(queue.count for queue in queues):
+            for queue in queues:
+                if rq_job_id := queue.connection.lpop(queue.key):
+                    break
+            else:
+                break
+            job_id = Job.fetch(rq_job_id.decode(), connection=queue.connection).args[0]
+            update_job(
+                redis,
+                job_id,
+                status=JobStatus.RUNNING.value,
+                progress={"stage": ProgressStage.DOWNLOADING.value, "pct": 0},
+            )
+            due = time.monotonic() + max(duration + rng.uniform(-jitter, jitter), 0.0)
+            heapq.heappush(pending, (due, job_id))
+
+        now = time.monotonic()
+        while pending and pending[0][0] <= now:
+            _, job_id = heapq.heappop(pending)
+            update_job(
+                redis,
+                job_id,
+                status=JobStatus.DONE.value,
+                download_url=f"{settings.base_url}/downloads/videos/{job_id}/video.mp4",
+                filename="video.mp4",
+            )
+            completed += 1
+
+        time.sleep(0.01)
+
+    return completed
+
+
+async def client(
+    http: httpx.AsyncClient,
+    args: argparse.Namespace,
+    deadline: float,
+    latencies: dict[str, list[float]],
+    errors: dict[str, int],
+) -> None:
+    """Create a job, then wait for it, until the deadline passes."""
+    headers = {"X-API-Token": settings.api_token}
+
+    async def timed(name: str, method: str, url: str, **kwargs) -> httpx.Response | None:
+        started = time.monotonic()
+        try:
+            response = await http.request(method, url, headers=headers, **kwargs)
+        except httpx.HTTPError as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            return None
+        latencies.setdefault(name, []).append(time.monotonic() - started)
+        if response.status_code >= 400:
+            errors[str(response.status_code)] = errors.get(str(response.status_code), 0) + 1
+            return None
+        return response
+
+    while time.monotonic() < deadline:
+        response = await timed(
+            "POST /jobs",
+            "POST",
+            "/jobs",
+            json={"url": "https://www.youtube.com/watch?v=loadtest0001", "quality": "720"},
+        )
+        if response is None:
+            await asyncio.sleep(1)
+            continue
+        job_id = response.json()["job_id"]
+
+        if args.mode == "wait":
+            await timed(
+                "GET /jobs/{id}?wait=true",
+                "GET",
+                f"/jobs/{job_id}",
+                params={"wait": "true", "timeout": args.wait_timeout},
+            )
+            continue
+
+        while time.monotonic() < deadline:
+            response = await timed("GET /jobs/{id}", "GET", f"/jobs/{job_id}")
+            if response is not None and response.json()["status"] in ("done", "error"):
+                break
+            await asyncio.sleep(args.poll_interval)
+
+
+async def drive(args: argparse.Namespace, base_url: str) -> tuple[dict, dict, float]:
+    """Run all clients and collect latencies and errors."""
+    latencies: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    timeout = httpx.Timeout(args.wait_timeout + 30)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as http:
+        started = time.monotonic()
+        deadline = started + args.duration
+        tasks = []
+        for _ in range(args.clients):
+            tasks.append(asyncio.create_task(client(http, args, deadline, latencies, errors)))
+            await asyncio.sleep(args.ramp / args.clients)
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+
+    return latencies, errors, elapsed
+
+
+def run(args: argparse.Namespace) -> dict:
+    """Run one load test and return the report."""
+    settings.redis_url = args.redis_url
+    settings.redis_cluster = args.redis_cluster
+    settings.queue_urls = args.queue_url or []
+    settings.rate_limit_per_minute = 10**9
+
+    from ytdl.main import app
+
+    port = _free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+    )
+    lags: list[float] = []
+    server_thread = serve_app(server, lags)
+
+    rng = random.Random(args.seed)
+    stop = threading.Event()
+    completed = [0]
+    worker_thread = threading.Thread(
+        target=lambda: completed.__setitem__(
+            0, stub_worker(stop, rng, args.job_duration, args.job_jitter)
+        ),
+        daemon=True,
+    )
+    worker_thread.start()
+
+    # On a cluster this counts the --redis-url node only
+    redis = Redis.from_url(args.redis_url)
+    commands_before = _commands_processed(redis)
+
+    try:
+        latencies, errors, elapsed = asyncio.run(drive(args, f"http://127.0.0.1:{port}"))
+    finally:
+        commands_after = _commands_processed(redis)
+        stop.set()
+        worker_thread.join()
+        server.should_exit = True
+        server_thread.join()
+
+    commands_per_sec = None
+    if commands_before is not None and commands_after is not None:
+        commands_per_sec = round((commands_after - commands_before) / elapsed, 1)
+
+    return {
+        "config": {
+            key: (str(value) if isinstance(value, Path) else value)
+            for key, value in vars(args).items()
+        },
+        "python": platform.python_version(),
+        "elapsed_s": round(elapsed, 3),
+        "jobs_completed": completed[0],
+        "errors": errors,
+        "redis_commands_per_sec": commands_per_sec,
+        "event_loop_lag_ms": {
+            "p50": round(percentile(lags, 50) * 1000, 2),
+            "p99": round(percentile(lags, 99) * 1000, 2),
+            "max": round(max(lags, default=0.0) * 1000, 2),
+        },
+        "requests": {
+            name: {
+                "count": len(values),
+                "rps": round(len(values) / elapsed, 1),
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+            }
+            for name, values in latencies.items()
+        },
+    }
+
+
+def print_report(report: dict) -> None:
+    """Print a human-readable summary."""
+    config = report["config"]
+    print(
+        f"{config['clients']} clients, mode={config['mode']}, {config['duration']} s, "
+        f"job duration {config['job_duration']}±{config['job_jitter']} s, seed {config['seed']}"
+    )
+    print(f"  jobs completed:   {report['jobs_completed']}")
+    print(f"  errors:           {report['errors'] or 'none'}")
+    print(f"  redis cmds/sec:   {report['redis_commands_per_sec']}")
+    lag = report["event_loop_lag_ms"]
+    print(f"  loop lag ms:      p50 {lag['p50']}  p99 {lag['p99']}  max {lag['max']}")
+    print(f"  {'request':<26} {'count':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stats in report["requests"].items():
+        print(
+            f"  {name:<26} {stats['count']:>7} {stats['rps']:>8} {stats['p50_ms']:>9} "
+            f"{stats['p95_ms']:>9} {stats['p99_ms']:>9}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="API long-poll/status load harness")
+    parser.add_argument("--clients", type=int, default=50, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to generate load")
+    parser.add_argument("--ramp", type=float, default=5, help="Seconds to start all clients")
+    parser.add_argument("--mode", choices=["wait", "poll"], default="wait")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between polls")
+    parser.add_argument("--wait-timeout", type=int, default=120)
+    parser.add_argument("--job-duration", type=float, default=5, help="Stub worker job time")
+    parser.add_argument("--job-jitter", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument(
+        "--redis-cluster", action="store_true", help="--redis-url is a Redis Cluster node"
+    )
+    parser.add_argument(
+        "--queue-url", action="append", help="Standalone Redis for an RQ queue shard (repeatable)"
+    )
+    parser.add_argument("--json", type=Path, help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    logging.getLogger("ytdl").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
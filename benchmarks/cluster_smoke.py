@@ -0,0 +1,219 @@
+"""
+Smoke check of the Redis Cluster code paths against a live cluster.
+
+Runs the calls that need cluster-aware transactions or cross-slot handling
+(update_job, list_jobs, dispatch, and the identity and work area releases)
+against the cluster and queue shards from docker-compose.cluster.yml, and
+exits non-zero if any of them misbehaves. Jobs are written under a tenant of
+their own and removed again, RQ jobs included.
+
+Usage:
+    make smoke-cluster  # starts the cluster, then runs this with CLUSTER_ARGS
+    uv run python -m benchmarks.cluster_smoke --redis-cluster \\
+        --redis-url redis://127.0.0.1:7000/0 --queue-url redis://127.0.0.1:7100/0
+"""
+
+import argparse
+import logging
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import UTC, datetime
+
+from rq import Queue
+
+from ytdl.config import Identity, Tenant, settings
+from ytdl.models import JobStatus
+
+
+class Checks:
+    """Collects pass/fail results so one run reports every broken path."""
+
+    def __init__(self):
+        self.failed = 0
+
+    def check(self, name: str, ok: bool, detail: str = "") -> None:
+        suffix = f" ({detail})" if detail and not ok else ""
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}{suffix}")
+        self.failed += not ok
+
+
+def check_update_job(checks: Checks, redis, job_ids: list[str], writers: int) -> None:
+    """Concurrent updates must all land: WATCH/MULTI on the record's slot."""
+    from ytdl.jobs import get_job_data, update_job
+
+    def write(n: int) -> None:
+        for job_id in job_ids:
+            update_job(redis, job_id, progress={"stage": "downloading", "pct": n})
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    versions = [get_job_data(redis, job_id)["version"] for job_id in job_ids]
+    checks.check(
+        "update_job keeps every concurrent write",
+        all(version == writers + 1 for version in versions),
+        f"versions {sorted(set(versions))}, expected {writers + 1}",
+    )
+
+    for job_id in job_ids[: len(job_ids) // 2]:
+        update_job(redis, job_id, status=JobStatus.RUNNING.value)
+
+
+def check_list_jobs(checks: Checks, redis, tenant: str, job_ids: list[str]) -> None:
+    """Pages and status filters read indexes and records from different slots."""
+    from ytdl.jobs import list_jobs
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = list_jobs(redis, tenant, cursor=cursor, limit=3)
+        seen += [job["job_id"] for job in page]
+        if cursor is None:
+            break
+    checks.check("list_jobs pages through every job", sorted(seen) == sorted(job_ids))
+
+    running, _ = list_jobs(redis, tenant, status=JobStatus.RUNNING.value, limit=len(job_ids))
+    queued, _ = list_jobs(redis, tenant, status=JobStatus.QUEUED.value, limit=len(job_ids))
+    half = len(job_ids) // 2
+    checks.check(
+        "list_jobs filters by status after update_job",
+        {job["job_id"] for job in running} == set(job_ids[:half])
+        and {job["job_id"] for job in queued} == set(job_ids[half:]),
+        f"{len(running)} running, {len(queued)} queued",
+    )
+
+
+def check_dispatch(checks: Checks, redis, tenant: str, job_ids: list[str]) -> None:
+    """Tenant queues live on the cluster, RQ queues on the shards."""
+    from ytdl.connections import queue_connections
+    from ytdl.jobs import LANES
+    from ytdl.scheduler import LOCK_KEY, dispatch, queue_key, submit_job
+
+    for job_id in job_ids:
+        submit_job(redis, job_id, tenant)
+    dispatch(redis)
+
+    enqueued = {}
+    for shard, connection in enumerate(queue_connections()):
+        for lane in LANES:
+            for rq_job in Queue(lane, connection=connection).jobs:
+                if rq_job.args and rq_job.args[0] in job_ids:
+                    enqueued[rq_job.args[0]] = (shard, rq_job)
+
+    checks.check(
+        "dispatch moves every job to an RQ shard",
+        not redis.zcard(queue_key(tenant)) and set(enqueued) == set(job_ids),
+        f"{len(enqueued)} of {len(job_ids)} on RQ",
+    )
+    shards = {shard for shard, _ in enqueued.values()}
+    checks.check(
+        "dispatch spreads jobs over the queue shards",
+        len(shards) == len(queue_connections()),
+        f"used shards {sorted(shards)}",
+    )
+    checks.check("dispatch releases its lock", not redis.exists(LOCK_KEY))
+
+    for _, rq_job in enqueued.values():
+        rq_job.delete()
+
+
+def check_releases(checks: Checks, redis, job_id: str) -> None:
+    """The other WATCH/MULTI call sites: identity stats and work area locks."""
+    from ytdl.identities import leases_key, release_identity, stats_key
+    from ytdl.partials import claim_work_area, lock_key, partial_name
+
+    identity = Identity(name=f"smoke-{uuid.uuid4().hex[:8]}")
+    redis.zadd(leases_key(identity.name), {job_id: time.time() + 60})
+    release_identity(redis, identity, job_id, "ok", latency=1.0)
+    checks.check(
+        "release_identity records the outcome and ends the lease",
+        redis.hget(stats_key(identity.name), "ok") == "1"
+        and not redis.zscore(leases_key(identity.name), job_id),
+    )
+    redis.delete(stats_key(identity.name), leases_key(identity.name))
+
+    url = f"https://www.youtube.com/watch?v={uuid.uuid4().hex[:11]}"
+    with claim_work_area(redis, job_id, url, "720") as path:
+        claimed = path is not None
+    checks.check(
+        "claim_work_area locks and releases the work area",
+        claimed and not redis.exists(lock_key(partial_name(url, "720"))),
+    )
+
+
+def run(args: argparse.Namespace) -> int:
+    """Run every check and return the number that failed."""
+    settings.redis_url = args.redis_url
+    settings.redis_cluster = args.redis_cluster
+    settings.queue_urls = args.queue_url or []
+    settings.download_dir = tempfile.mkdtemp(prefix="ytdl-smoke-")
+    settings.resume_downloads = True
+    # Let dispatch hand out every job without workers attached
+    settings.dispatch_depth = args.jobs
+
+    from ytdl.connections import get_redis
+    from ytdl.jobs import index_key, job_key, set_job_data, version_key
+
+    tenant = f"smoke-{uuid.uuid4().hex[:8]}"
+    settings.tenants = [Tenant(name=tenant, token=uuid.uuid4().hex)]
+    redis = get_redis()
+    job_ids = []
+    # One creation time for all, so list_jobs has to page through ties
+    created_at = datetime.now(UTC).isoformat()
+    for i in range(args.jobs):
+        job_id = str(uuid.uuid4())
+        set_job_data(
+            redis,
+            job_id,
+            {
+                "job_id": job_id,
+                "url": f"https://www.youtube.com/watch?v=smoke{i:06d}",
+                "quality": "720",
+                "status": JobStatus.QUEUED.value,
+                "tenant": tenant,
+                "created_at": created_at,
+            },
+        )
+        job_ids.append(job_id)
+
+    checks = Checks()
+    print(f"Cluster smoke check: {args.jobs} jobs, tenant {tenant}")
+    try:
+        check_update_job(checks, redis, job_ids, args.writers)
+        check_list_jobs(checks, redis, tenant, job_ids)
+        check_dispatch(checks, redis, tenant, job_ids)
+        check_releases(checks, redis, job_ids[0])
+    finally:
+        for job_id in job_ids:
+            redis.delete(job_key(job_id), version_key(job_id))
+        for status in [None, *JobStatus]:
+            redis.delete(index_key(tenant, status and status.value))
+    return checks.failed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Smoke check against a Redis Cluster")
+    parser.add_argument("--jobs", type=int, default=10)
+    parser.add_argument("--writers", type=int, default=4, help="Concurrent update_job threads")
+    parser.add_argument("--redis-url", default="redis://127.0.0.1:7000/0")
+    parser.add_argument(
+        "--redis-cluster", action="store_true", help="--redis-url is a Redis Cluster node"
+    )
+    parser.add_argument(
+        "--queue-url", action="append", help="Standalone Redis for an RQ queue shard (repeatable)"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    failed = run(args)
+    print("All checks passed" if not failed else f"{failed} checks failed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
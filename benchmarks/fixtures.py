@@ -0,0 +1,208 @@
+"""Local stand-ins for YouTube, Cobalt and R2 used by the benchmarks."""
+
+import struct
+import threading
+import time
+import zlib
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+from ytdl.errors import DownloadError, ErrorCode
+from ytdl.metrics import StageCallback, timed_stage
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _atom(atom_type: bytes, body: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(body), atom_type) + body
+
+
+def write_synthetic_mp4(path: Path, size: int) -> Path:
+    """
+    Write an MP4-shaped file of roughly `size` bytes with moov after mdat.
+
+    The layout is what yt-dlp produces when it merges without faststart, so
+    the worker's moov relocation pass does real work on it.
+    """
+    ftyp = _atom(b"ftyp", b"isom\0\0\0\0isomiso2mp41")
+    payload_size = max(size - 256, CHUNK_SIZE)
+    first_chunk = len(ftyp) + 8
+    offsets = range(first_chunk, first_chunk + payload_size, CHUNK_SIZE)
+    stco = _atom(
+        b"stco",
+        struct.pack(">II", 0, len(offsets)) + b"".join(struct.pack(">I", o) for o in offsets),
+    )
+    moov = _atom(b"moov", _atom(b"trak", _atom(b"mdia", _atom(b"minf", _atom(b"stbl", stco)))))
+
+    with open(path, "wb") as f:
+        f.write(ftyp)
+        f.write(struct.pack(">I4s", 8 + payload_size, b"mdat"))
+        block = bytes(CHUNK_SIZE)
+        remaining = payload_size
+        while remaining > 0:
+            f.write(block[: min(CHUNK_SIZE, remaining)])
+            remaining -= CHUNK_SIZE
+        f.write(moov)
+    return path
+
+
+class MediaServer:
+    """
+    Serve synthetic media over HTTP with a per-connection bandwidth cap.
+
+    GET /media?size=<bytes>&bandwidth=<bytes per second> (0 = unlimited)
+    """
+
+    def __init__(self, media_dir: Path, host: str = "127.0.0.1", port: int = 0):
+        self.media_dir = media_dir
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):  # noqa: N802
+                query = parse_qs(urlparse(self.path).query)
+                size = int(query.get("size", ["1048576"])[0])
+                bandwidth = int(query.get("bandwidth", ["0"])[0])
+                path = server.media_file(size)
+
+                self.send_response(200)
+                self.send_header("Content-Type", "video/mp4")
+                self.send_header("Content-Length", str(path.stat().st_size))
+                self.end_headers()
+
+                started = time.monotonic()
+                sent = 0
+                with open(path, "rb") as f:
+                    while chunk := f.read(CHUNK_SIZE):
+                        self.wfile.write(chunk)
+                        sent += len(chunk)
+                        if bandwidth:
+                            ahead = sent / bandwidth - (time.monotonic() - started)
+                            if ahead > 0:
+                                time.sleep(ahead)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def media_file(self, size: int) -> Path:
+        """Get (creating once) the synthetic file for a given size."""
+        path = self.media_dir / f"synthetic_{size}.mp4"
+        with self._lock:
+            if not path.exists():
+                write_synthetic_mp4(path, size)
+        return path
+
+    def media_url(self, size: int, bandwidth: int = 0) -> str:
+        return f"{self.url}/media?size={size}&bandwidth={bandwidth}"
+
+    def start(self) -> "MediaServer":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+
+
+def start_s3_stand_in(bucket: str, port: int = 0) -> tuple[Callable[[], None], str]:
+    """
+    Start a moto S3 server with an empty bucket.
+
+    Returns:
+        Tuple of (stop function, endpoint URL)
+    """
+    import boto3
+    from moto.server import ThreadedMotoServer
+
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    endpoint = f"http://{host}:{port}"
+
+    boto3.client(
+        "s3",
+        endpoint_url=endpoint,
+        aws_access_key_id="bench",
+        aws_secret_access_key="bench",
+        region_name="us-east-1",
+    ).create_bucket(Bucket=bucket)
+    return server.stop, endpoint
+
+
+def _fetch(
+    media_url: str,
+    output_path: Path,
+    progress_callback: Callable[[str, int], None] | None,
+    stage_callback: StageCallback | None,
+) -> Path:
+    """Download synthetic media, reporting progress and stage timings."""
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with timed_stage("extract", stage_callback):
+        pass  # No metadata round trip offline
+
+    with timed_stage("download", stage_callback):
+        with httpx.stream("GET", media_url, timeout=300.0) as response:
+            response.raise_for_status()
+            total = int(response.headers.get("content-length", 0))
+            downloaded = 0
+            last_pct = -1
+            with open(output_path, "wb") as f:
+                for chunk in response.iter_bytes(CHUNK_SIZE):
+                    f.write(chunk)
+                    downloaded += len(chunk)
+                    pct = int(downloaded * 100 / total) if total else 0
+                    if progress_callback and pct != last_pct:
+                        progress_callback("downloading", pct)
+                        last_pct = pct
+
+    return output_path
+
+
+def make_fake_backends(
+    media_url: str,
+    cobalt_fraction: float = 0.0,
+) -> tuple[Callable[..., Path], Callable[..., Path]]:
+    """
+    Build drop-in replacements for download_video and download_with_cobalt.
+
+    A deterministic `cobalt_fraction` of URLs fail in the yt-dlp stand-in
+    with a bot-detection error, so the worker exercises its Cobalt fallback.
+    """
+
+    def fake_download_video(url, quality, output_dir, progress_callback=None, **kwargs):
+        if zlib.crc32(url.encode()) % 1000 < cobalt_fraction * 1000:
+            raise DownloadError(ErrorCode.DOWNLOAD_FAILED, "Sign in to confirm you're not a bot")
+        return _fetch(
+            media_url,
+            output_dir / "video.mp4",
+            progress_callback,
+            kwargs.get("stage_callback"),
+        )
+
+    def fake_download_with_cobalt(
+        url,
+        quality,
+        output_dir,
+        progress_callback=None,
+        file_callback=None,
+        stage_callback=None,
+        **kwargs,
+    ):
+        return _fetch(media_url, output_dir / "cobalt_video.mp4", progress_callback, stage_callback)
+
+    return fake_download_video, fake_download_with_cobalt
@@ -0,0 +1,421 @@
+"""
+Offline end-to-end benchmark of the worker pipeline.
+
+Runs real process_job calls in parallel worker processes against a local
+Redis and a local S3 stand-in (moto). download_video and
+download_with_cobalt are swapped for fetches from a local fixture server
+that serves synthetic media at a configurable size and bandwidth, so
+nothing touches YouTube.
+
+With --pipeline, the same jobs go through RQ to one staged pipeline worker
+(ytdl.pipeline) with --workers download threads instead of --workers
+process_job workers, for comparing the two.
+
+With --redis-cluster, shared state goes to the Redis Cluster at --redis-url;
+--queue-url (repeatable) puts RQ queues on those standalone shards, with
+jobs spread round-robin and one pipeline worker per shard under --pipeline.
+
+With --memory-mb, jobs whose estimated output fits are staged in RAM
+(/dev/shm) instead of the work directory on disk; job records carry the
+duration a metadata probe would have found.
+
+With --cache-mb, finished videos also go into the node-local object cache,
+and --reads requests are then replayed against it with Zipf-distributed
+popularity (misses on hot objects are fetched back from the S3 stand-in).
+
+Usage:
+    uv run --extra bench python -m benchmarks.worker_pipeline --jobs 40 --workers 4
+    uv run --extra bench python -m benchmarks.worker_pipeline --jobs 40 --workers 4 --pipeline
+    uv run --extra bench python -m benchmarks.worker_pipeline --cache-mb 100 --reads 500
+    uv run --extra bench python -m benchmarks.worker_pipeline --pipeline \
+        --redis-cluster --redis-url redis://localhost:7000/0 \
+        --queue-url redis://localhost:7100/0 --queue-url redis://localhost:7101/0
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import UTC, datetime
+from pathlib import Path
+
+from redis import Redis
+
+from benchmarks.fixtures import MediaServer, make_fake_backends, start_s3_stand_in
+from ytdl.config import StorageMode, settings
+from ytdl.connections import get_redis, queue_urls
+from ytdl.jobs import LANES, enqueue_job, get_job_data, job_key, set_job_data, version_key
+from ytdl.models import JobStatus
+
+BUCKET = "ytdl-bench"
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def configure(args: argparse.Namespace, work_root: Path, s3_endpoint: str | None) -> None:
+    """Point the shared settings object at the local stand-ins."""
+    settings.redis_url = args.redis_url
+    settings.redis_cluster = args.redis_cluster
+    settings.queue_urls = args.queue_url or []
+    settings.download_dir = str(work_root / "work")
+    settings.local_storage_dir = str(work_root / "storage")
+    settings.otlp_traces_url = ""
+    settings.cache_dir = str(work_root / "cache")
+    settings.cache_max_mb = args.cache_mb
+    settings.memory_staging_max_mb = args.memory_mb
+    settings.memory_staging_dir = str(memory_root(work_root))
+
+    if s3_endpoint:
+        settings.storage_mode = StorageMode.R2
+        settings.r2_endpoint = s3_endpoint
+        settings.r2_account_id = "bench"
+        settings.r2_access_key_id = "bench"
+        settings.r2_secret_access_key = "bench"
+        settings.r2_bucket_name = BUCKET
+    else:
+        settings.storage_mode = StorageMode.LOCAL
+
+
+def memory_root(work_root: Path) -> Path:
+    """RAM-backed staging directory for a run (falls back to disk off Linux)."""
+    shm = Path("/dev/shm")
+    return (shm if shm.is_dir() else work_root) / f"{work_root.name}-memory"
+
+
+def worker_loop(job_ids: multiprocessing.Queue, media_url: str, cobalt_fraction: float) -> None:
+    """Run process_job for job IDs until a None sentinel arrives."""
+    from ytdl import worker
+
+    worker.download_video, worker.download_with_cobalt = make_fake_backends(
+        media_url, cobalt_fraction
+    )
+    while (job_id := job_ids.get()) is not None:
+        worker.process_job(job_id)
+
+
+def pipeline_loop(
+    media_url: str, cobalt_fraction: float, download_workers: int, shard: int = 0
+) -> None:
+    """Run a staged pipeline worker on a queue shard until SIGTERM, then let it drain."""
+    from ytdl import worker
+    from ytdl.pipeline import Pipeline
+
+    worker.download_video, worker.download_with_cobalt = make_fake_backends(
+        media_url, cobalt_fraction
+    )
+    pipeline = Pipeline(
+        list(LANES),
+        download_workers,
+        settings.pipeline_process_workers,
+        settings.pipeline_upload_workers,
+        settings.pipeline_queue_depth,
+        shard,
+    )
+    signal.signal(signal.SIGTERM, lambda *_: pipeline.stop())
+    pipeline.run()
+
+
+def wait_for_jobs(redis: Redis, job_ids: list[str]) -> None:
+    """Poll until every job is done or has failed."""
+    finished = {JobStatus.DONE.value, JobStatus.ERROR.value}
+    pending = set(job_ids)
+    while pending:
+        pending = {
+            job_id for job_id in pending if get_job_data(redis, job_id)["status"] not in finished
+        }
+        time.sleep(0.05)
+
+
+def sample_disk(path: Path, stop: threading.Event, peak: list[int]) -> None:
+    """Track peak bytes under path until stopped."""
+    while not stop.is_set():
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        peak[0] = max(peak[0], total)
+        time.sleep(0.1)
+
+
+def create_jobs(redis: Redis, count: int, quality: str, size: int) -> list[str]:
+    """Write job records the way the API does, without enqueueing to RQ."""
+    from ytdl.staging import BYTES_PER_SECOND
+
+    job_ids = []
+    for i in range(count):
+        job_id = str(uuid.uuid4())
+        job_data = {
+            "job_id": job_id,
+            "url": f"https://www.youtube.com/watch?v=bench{i:06d}",
+            "quality": quality,
+            "status": JobStatus.QUEUED.value,
+            "created_at": datetime.now(UTC).isoformat(),
+            "duration": size / BYTES_PER_SECOND[quality],
+        }
+        set_job_data(redis, job_id, job_data)
+        job_ids.append(job_id)
+    return job_ids
+
+
+def replay_reads(redis: Redis, object_keys: list[str], reads: int, seed: int) -> dict:
+    """
+    Request cached objects with Zipf-like popularity and count hits.
+
+    Returns:
+        Hit/miss/fill counts and hit ratio
+    """
+    from ytdl import cache
+    from ytdl.storage import warm_cache
+
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, len(object_keys) + 1)]
+    stats = {"hits": 0, "misses": 0, "fills": 0}
+    for object_key in rng.choices(object_keys, weights=weights, k=reads):
+        if cache.lookup(redis, object_key):
+            stats["hits"] += 1
+            continue
+        stats["misses"] += 1
+        if cache.should_fill(redis, object_key):
+            warm_cache(redis, object_key)
+            stats["fills"] += 1
+    stats["hit_ratio"] = round(stats["hits"] / reads, 3) if reads else 0.0
+    stats["cached_mb"] = round(cache.cached_bytes() / (1024 * 1024), 1)
+    return stats
+
+
+def run(args: argparse.Namespace) -> dict:
+    """Run one benchmark and return the report."""
+    work_root = Path(tempfile.mkdtemp(prefix="ytdl-bench-"))
+    media = MediaServer(work_root).start()
+    stop_s3, s3_endpoint = start_s3_stand_in(BUCKET) if args.storage == "s3" else (None, None)
+
+    try:
+        configure(args, work_root, s3_endpoint)
+        Path(settings.download_dir).mkdir(parents=True, exist_ok=True)
+        media_url = media.media_url(args.size_mb * 1024 * 1024, args.bandwidth_mbps * 125_000)
+        media.media_file(args.size_mb * 1024 * 1024)  # Build the fixture outside the timed run
+
+        redis = get_redis()
+        job_ids = create_jobs(redis, args.jobs, args.quality, args.size_mb * 1024 * 1024)
+
+        ctx = multiprocessing.get_context("fork")
+        queue = ctx.Queue()
+        shards = len(queue_urls())
+        if args.pipeline:
+            for i, job_id in enumerate(job_ids):
+                enqueue_job(job_id, shard=i % shards)
+        else:
+            for job_id in job_ids:
+                queue.put(job_id)
+            for _ in range(args.workers):
+                queue.put(None)
+
+        stop = threading.Event()
+        peak_disk = [0]
+        sampler = threading.Thread(
+            target=sample_disk, args=(Path(settings.download_dir), stop, peak_disk), daemon=True
+        )
+        sampler.start()
+
+        started = time.monotonic()
+        if args.pipeline:
+            pipelines = [
+                ctx.Process(
+                    target=pipeline_loop,
+                    args=(media_url, args.cobalt_fraction, args.workers, shard),
+                )
+                for shard in range(shards)
+            ]
+            for process in pipelines:
+                process.start()
+            wait_for_jobs(redis, job_ids)
+            elapsed = time.monotonic() - started
+            for process in pipelines:
+                process.terminate()
+            for process in pipelines:
+                process.join()
+        else:
+            workers = [
+                ctx.Process(target=worker_loop, args=(queue, media_url, args.cobalt_fraction))
+                for _ in range(args.workers)
+            ]
+            for process in workers:
+                process.start()
+            for process in workers:
+                process.join()
+            elapsed = time.monotonic() - started
+
+        stop.set()
+        sampler.join()
+
+        stages: dict[str, list[float]] = {}
+        latencies = []
+        statuses: dict[str, int] = {}
+        object_keys = []
+        for job_id in job_ids:
+            job_data = get_job_data(redis, job_id)
+            if job_data.get("object_key"):
+                object_keys.append(job_data["object_key"])
+            statuses[job_data["status"]] = statuses.get(job_data["status"], 0) + 1
+            if job_data.get("started_at"):
+                stages.setdefault("queue", []).append(
+                    (
+                        datetime.fromisoformat(job_data["started_at"])
+                        - datetime.fromisoformat(job_data["created_at"])
+                    ).total_seconds()
+                )
+            for timing in job_data.get("timings", []):
+                stages.setdefault(timing["stage"], []).append(timing["end"] - timing["start"])
+            if job_data.get("completed_at"):
+                latencies.append(
+                    (
+                        datetime.fromisoformat(job_data["completed_at"])
+                        - datetime.fromisoformat(job_data["created_at"])
+                    ).total_seconds()
+                )
+            redis.delete(job_key(job_id), version_key(job_id))
+
+        stages["end_to_end"] = latencies
+        cache_stats = None
+        if args.cache_mb and args.reads and object_keys:
+            rng = random.Random(args.seed)
+            rng.shuffle(object_keys)
+            cache_stats = replay_reads(redis, object_keys, args.reads, args.seed)
+        return {
+            "config": {
+                "jobs": args.jobs,
+                "workers": args.workers,
+                "size_mb": args.size_mb,
+                "bandwidth_mbps": args.bandwidth_mbps,
+                "cobalt_fraction": args.cobalt_fraction,
+                "storage": args.storage,
+                "cache_mb": args.cache_mb,
+                "pipeline": args.pipeline,
+                "memory_mb": args.memory_mb,
+                "redis_cluster": args.redis_cluster,
+                "queue_shards": shards,
+            },
+            "elapsed_s": round(elapsed, 3),
+            "jobs_per_min": round(args.jobs / elapsed * 60, 2),
+            "statuses": statuses,
+            "stages": {
+                stage: {
+                    "count": len(values),
+                    "p50_ms": round(percentile(values, 50) * 1000, 1),
+                    "p95_ms": round(percentile(values, 95) * 1000, 1),
+                    "p99_ms": round(percentile(values, 99) * 1000, 1),
+                }
+                for stage, values in stages.items()
+            },
+            # ru_maxrss is KiB on Linux, bytes on macOS
+            "peak_rss_mb": round(
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+                / (1024 * 1024 if sys.platform == "darwin" else 1024),
+                1,
+            ),
+            "peak_disk_mb": round(peak_disk[0] / (1024 * 1024), 1),
+            "cache": cache_stats,
+        }
+    finally:
+        media.stop()
+        if stop_s3:
+            stop_s3()
+        shutil.rmtree(work_root, ignore_errors=True)
+        shutil.rmtree(memory_root(work_root), ignore_errors=True)
+
+
+def print_report(report: dict) -> None:
+    """Print a human-readable summary."""
+    config = report["config"]
+    print(
+        f"{config['jobs']} jobs, {config['workers']} workers, {config['size_mb']} MB "
+        f"@ {config['bandwidth_mbps'] or 'unlimited'} Mbps, storage={config['storage']}"
+        + (" (staged pipeline)" if config["pipeline"] else "")
+        + (f", memory staging <= {config['memory_mb']} MB" if config["memory_mb"] else "")
+        + (", Redis Cluster" if config["redis_cluster"] else "")
+        + (f", {config['queue_shards']} queue shards" if config["queue_shards"] > 1 else "")
+    )
+    print(f"  elapsed:     {report['elapsed_s']} s")
+    print(f"  throughput:  {report['jobs_per_min']} jobs/min")
+    print(f"  statuses:    {report['statuses']}")
+    print(f"  peak RSS:    {report['peak_rss_mb']} MB (largest worker)")
+    print(f"  peak disk:   {report['peak_disk_mb']} MB")
+    if report["cache"]:
+        cache = report["cache"]
+        print(
+            f"  cache:       {cache['hit_ratio']:.1%} hits ({cache['hits']} hits, "
+            f"{cache['misses']} misses, {cache['fills']} fills), {cache['cached_mb']} MB cached"
+        )
+    print(f"  {'stage':<12} {'count':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for stage, stats in report["stages"].items():
+        print(
+            f"  {stage:<12} {stats['count']:>6} {stats['p50_ms']:>10} "
+            f"{stats['p95_ms']:>10} {stats['p99_ms']:>10}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline worker pipeline benchmark")
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=settings.max_concurrent_jobs)
+    parser.add_argument("--size-mb", type=int, default=20, help="Synthetic video size")
+    parser.add_argument(
+        "--bandwidth-mbps", type=int, default=0, help="Per-download cap (0 = unlimited)"
+    )
+    parser.add_argument(
+        "--cobalt-fraction", type=float, default=0.0, help="Share of jobs that fall back to Cobalt"
+    )
+    parser.add_argument("--quality", default="720")
+    parser.add_argument("--storage", choices=["s3", "local"], default="s3")
+    parser.add_argument(
+        "--pipeline", action="store_true", help="Use one staged pipeline worker (ytdl.pipeline)"
+    )
+    parser.add_argument(
+        "--memory-mb", type=int, default=0, help="Stage outputs up to this size in RAM"
+    )
+    parser.add_argument("--cache-mb", type=int, default=0, help="Object cache size (s3 only)")
+    parser.add_argument("--reads", type=int, default=0, help="Cache reads to replay after the run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument(
+        "--redis-cluster", action="store_true", help="--redis-url is a Redis Cluster node"
+    )
+    parser.add_argument(
+        "--queue-url", action="append", help="Standalone Redis for an RQ queue shard (repeatable)"
+    )
+    parser.add_argument("--json", type=Path, help="Also write the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show worker logs")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger("ytdl").setLevel(logging.WARNING)
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
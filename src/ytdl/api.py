@@ -1,39 +1,75 @@
 """API routes for the YouTube downloader."""
 
 import asyncio
-import json
+import math
 import uuid
-from datetime import datetime, timedelta, timezone
-from typing import Annotated
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Annotated, BinaryIO, Literal
 
-from fastapi import APIRouter, Depends, Header, HTTPException, status
-from pydantic import ValidationError
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
 from redis import Redis
-from rq import Queue
 
+from ytdl import cache, degrade, prefetch
 from ytdl.config import settings
+from ytdl.connections import get_redis, mget
+from ytdl.downloader import probe_duration
 from ytdl.errors import ERROR_MESSAGES, ErrorCode
+from ytdl.jobs import (
+    DEFAULT_TENANT,
+    get_job_data,
+    get_job_version,
+    list_jobs,
+    set_job_data,
+    version_key,
+)
+from ytdl.metrics import gauge_add, inc
 from ytdl.models import (
     CreateJobRequest,
     CreateJobResponse,
     ErrorResponse,
-    JobProgress,
+    JobListResponse,
     JobStatus,
     JobStatusResponse,
+    JobTimingsResponse,
+    PrefetchRequest,
+    PrefetchResponse,
     ProgressStage,
+    StageTiming,
+)
+from ytdl.scheduler import (
+    SEQUENCE_KEY,
+    classify_job,
+    estimate_wait,
+    get_dispatch_sequence,
+    submit_job,
+    tenant_for_token,
+)
+from ytdl.status import build_status_response
+from ytdl.storage import (
+    generate_origin_url,
+    generate_presigned_url,
+    verify_signature,
+    warm_cache,
 )
+from ytdl.tracing import build_spans, build_waterfall
 
 router = APIRouter()
 
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_POLL_INTERVAL = 0.5
+STREAM_IDLE_TIMEOUT = 60
+CURSOR_PATTERN = r"^\d+(\.\d+)?:[0-9a-f-]+$"  # next_cursor of GET /jobs: "<created_at>:<job_id>"
 
-def get_redis() -> Redis:
-    """Get Redis connection."""
-    return Redis.from_url(settings.redis_url, decode_responses=True)
+# Keep references to fire-and-forget tasks so they are not garbage collected
+_background_tasks: set[asyncio.Task] = set()
 
 
 def verify_token(x_api_token: Annotated[str | None, Header()] = None) -> str:
-    """Verify API token from header."""
-    if not x_api_token or x_api_token != settings.api_token:
+    """Verify API token from header against the configured tenants."""
+    if not x_api_token or tenant_for_token(x_api_token) is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=ErrorResponse(
@@ -44,17 +80,44 @@ def verify_token(x_api_token: Annotated[str | None, Header()] = None) -> str:
     return x_api_token
 
 
-def get_job_data(redis: Redis, job_id: str) -> dict | None:
-    """Get job data from Redis."""
-    data = redis.get(f"job:{job_id}")
-    if data:
-        return json.loads(data)
-    return None
+async def _probe_job(redis: Redis, job_id: str, url: str, tenant: str) -> None:
+    """Look up a new job's duration so the scheduler can size it."""
+    duration = await asyncio.to_thread(probe_duration, url)
+    if duration is not None:
+        await asyncio.to_thread(classify_job, redis, job_id, tenant, duration)
 
 
-def set_job_data(redis: Redis, job_id: str, data: dict) -> None:
-    """Set job data in Redis with 24h TTL."""
-    redis.setex(f"job:{job_id}", 86400, json.dumps(data, default=str))
+def _get_tenant_job(redis: Redis, job_id: str, token: str) -> dict:
+    """
+    Read a job on behalf of a token's tenant.
+
+    Raises:
+        HTTPException: 404 if the job does not exist or belongs to another
+            tenant, so job IDs of other tenants cannot be probed
+    """
+    job_data = get_job_data(redis, job_id)
+    if not job_data or job_data.get("tenant", DEFAULT_TENANT) != tenant_for_token(token).name:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=ErrorResponse(
+                error_code=ErrorCode.JOB_NOT_FOUND,
+                message=ERROR_MESSAGES[ErrorCode.JOB_NOT_FOUND],
+            ).model_dump(),
+        )
+    return job_data
+
+
+def _etag(version: int, sequence: int | None = None) -> str:
+    """Strong ETag for a job record version, plus the dispatch sequence for queued jobs."""
+    if sequence is None:
+        return f'"{version}"'
+    return f'"{version}.{sequence}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Check an If-None-Match header value against an ETag."""
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
 
 
 @router.post(
@@ -64,6 +127,7 @@ def set_job_data(redis: Redis, job_id: str, data: dict) -> None:
         400: {"model": ErrorResponse},
         401: {"model": ErrorResponse},
         429: {"model": ErrorResponse},
+        503: {"model": ErrorResponse},
     },
 )
 async def create_job(
@@ -74,6 +138,15 @@ async def create_job(
     Create a new video download job.
 
     Pass wait=true in JSON body to wait for completion and get download_url directly.
+
+    Jobs the current backlog would not start within ADMISSION_MAX_LATENCY
+    are refused with 503 and a Retry-After of the time the backlog needs to
+    drain, instead of queueing work the client will give up on. A wait=true
+    job that would not start within its timeout is refused the same way, with
+    a Retry-After of how much longer than the timeout the backlog needs.
+
+    A video that was prefetched at the requested quality (see ytdl.prefetch)
+    is not downloaded again: the job is created as done, with a fresh link.
     """
     redis = get_redis()
 
@@ -81,6 +154,7 @@ async def create_job(
     rate_key = f"rate:{_token}"
     current = redis.get(rate_key)
     if current and int(current) >= settings.rate_limit_per_minute:
+        inc(redis, "ytdl_rate_limited_total")
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail=ErrorResponse(
@@ -89,6 +163,31 @@ async def create_job(
             ).model_dump(),
         )
 
+    tenant = tenant_for_token(_token)
+    quality = request.quality.value
+    prefetched = None if request.stream else prefetch.lookup(redis, request.url, quality)
+    prefetch.record_request(redis, request.url, quality)
+
+    # Admission control: refuse jobs the backlog would not start in time. Only
+    # the queue counts; a job's own run time is the client's to wait out
+    backlog = 0.0 if prefetched else estimate_wait(redis, tenant.name)
+    retry_after = None
+    if settings.admission_max_latency and backlog > settings.admission_max_latency:
+        retry_after = backlog
+    elif request.wait and backlog > request.timeout:
+        # A waiting client would time out before the job even starts
+        retry_after = backlog - request.timeout
+    if retry_after is not None:
+        inc(redis, "ytdl_admission_rejected_total")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=ErrorResponse(
+                error_code=ErrorCode.OVERLOADED,
+                message=ERROR_MESSAGES[ErrorCode.OVERLOADED],
+            ).model_dump(),
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
     # Increment rate limit counter
     pipe = redis.pipeline()
     pipe.incr(rate_key)
@@ -99,20 +198,45 @@ async def create_job(
     job_id = str(uuid.uuid4())
     job_data = {
         "job_id": job_id,
+        "tenant": tenant.name,
         "url": request.url,
-        "quality": request.quality.value,
+        "quality": quality,
         "status": JobStatus.QUEUED.value,
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "stream": request.stream,
+        "callback_url": request.callback_url,
+        "min_quality": request.min_quality.value if request.min_quality else None,
+        "created_at": datetime.now(UTC).isoformat(),
     }
+
+    # Already prefetched: answer from the stored file instead of queueing
+    if prefetched:
+        download_url, expires_at = generate_presigned_url(prefetched["object_key"])
+        job_data.update(
+            status=JobStatus.DONE.value,
+            download_url=download_url,
+            expires_at=expires_at.isoformat(),
+            filename=prefetched["filename"],
+            object_key=prefetched["object_key"],
+            started_at=job_data["created_at"],
+            completed_at=job_data["created_at"],
+            prefetched_by=prefetched["job_id"],
+        )
+        set_job_data(redis, job_id, job_data)
+        inc(redis, "ytdl_jobs_total", status=JobStatus.DONE.value)
+        inc(redis, "ytdl_prefetch_total", result="hit")
+        if not request.wait:
+            return CreateJobResponse(job_id=job_id, status=JobStatus.DONE)
+        return build_status_response(job_data)
+
     set_job_data(redis, job_id, job_data)
+    inc(redis, "ytdl_jobs_total", status=JobStatus.QUEUED.value)
 
-    # Enqueue job for processing
-    queue = Queue(connection=Redis.from_url(settings.redis_url))
-    queue.enqueue(
-        "ytdl.worker.process_job",
-        job_id,
-        job_timeout=600,  # 10 minutes timeout
-    )
+    # Queue job behind the tenant's other jobs, then size it for shortest-job-first
+    submit_job(redis, job_id, tenant.name)
+    if settings.probe_metadata:
+        task = asyncio.create_task(_probe_job(redis, job_id, request.url, tenant.name))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
 
     # If not waiting, return immediately
     if not request.wait:
@@ -123,32 +247,141 @@ async def create_job(
     elapsed = 0
     poll_interval = 2
 
-    while elapsed < timeout:
-        await asyncio.sleep(poll_interval)
-        elapsed += poll_interval
+    gauge_add(redis, "ytdl_long_poll_waiters", 1)
+    try:
+        while elapsed < timeout:
+            await asyncio.sleep(poll_interval)
+            elapsed += poll_interval
 
-        job_data = get_job_data(redis, job_id)
-        if job_data and job_data["status"] in [JobStatus.DONE.value, JobStatus.ERROR.value]:
-            break
+            job_data = get_job_data(redis, job_id)
+            if job_data and job_data["status"] in [JobStatus.DONE.value, JobStatus.ERROR.value]:
+                break
+    finally:
+        gauge_add(redis, "ytdl_long_poll_waiters", -1)
 
     # Get final job data and return full status
-    job_data = get_job_data(redis, job_id)
-    response = JobStatusResponse(
-        job_id=job_data["job_id"],
-        status=JobStatus(job_data["status"]),
+    return build_status_response(get_job_data(redis, job_id), redis)
+
+
+@router.post(
+    "/jobs/{job_id}/upgrade",
+    response_model=CreateJobResponse,
+    responses={
+        401: {"model": ErrorResponse},
+        404: {"model": ErrorResponse},
+        409: {"model": ErrorResponse},
+        429: {"model": ErrorResponse},
+        503: {"model": ErrorResponse},
+    },
+)
+async def upgrade_job(
+    job_id: str,
+    _token: Annotated[str, Depends(verify_token)],
+) -> CreateJobResponse:
+    """
+    Fetch a job that was lowered under load again, at the quality it asked for.
+
+    Submits a new job for the same video at the requested quality, without
+    min_quality, as POST /jobs would (rate limits and admission control
+    apply). The original job and its download link are left as they are.
+    """
+    redis = get_redis()
+    job_data = _get_tenant_job(redis, job_id, _token)
+    if not degrade.degraded(job_data):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=ErrorResponse(
+                error_code=ErrorCode.NOT_DEGRADED,
+                message=ERROR_MESSAGES[ErrorCode.NOT_DEGRADED],
+            ).model_dump(),
+        )
+
+    request = CreateJobRequest(
+        url=job_data["url"],
+        quality=job_data["requested_quality"],
+        stream=job_data.get("stream", False),
+        callback_url=job_data.get("callback_url"),
     )
+    return await create_job(request, _token)
+
 
-    if job_data["status"] == JobStatus.DONE.value:
-        response.download_url = job_data.get("download_url")
-        if "expires_at" in job_data:
-            response.expires_at = datetime.fromisoformat(job_data["expires_at"])
-        response.filename = job_data.get("filename")
+@router.post(
+    "/prefetch",
+    response_model=PrefetchResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    responses={
+        400: {"model": ErrorResponse},
+        401: {"model": ErrorResponse},
+    },
+)
+async def create_prefetch(
+    request: PrefetchRequest,
+    _token: Annotated[str, Depends(verify_token)],
+) -> PrefetchResponse:
+    """
+    Queue a video to be downloaded on idle workers before anyone asks for it.
 
-    if job_data["status"] == JobStatus.ERROR.value:
-        response.error_code = ErrorCode(job_data.get("error_code", ErrorCode.INTERNAL_ERROR))
-        response.message = job_data.get("message", ERROR_MESSAGES[response.error_code])
+    It ranks like a video requested PREFETCH_MIN_REQUESTS times. Nothing runs
+    unless PREFETCH_MAX_JOBS is set.
+    """
+    redis = get_redis()
+    quality = request.quality.value
+    if prefetch.prefetch_name(request.url, quality) is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=ErrorResponse(
+                error_code=ErrorCode.INVALID_URL,
+                message=ERROR_MESSAGES[ErrorCode.INVALID_URL],
+            ).model_dump(),
+        )
 
-    return response
+    queued = prefetch.add_candidate(redis, request.url, quality, settings.prefetch_min_requests)
+    return PrefetchResponse(status="queued" if queued else "stored")
+
+
+@router.get(
+    "/jobs",
+    response_model=JobListResponse,
+    responses={
+        401: {"model": ErrorResponse},
+    },
+)
+async def get_jobs(
+    _token: Annotated[str, Depends(verify_token)],
+    status_filter: Annotated[JobStatus | None, Query(alias="status")] = None,
+    since: datetime | None = None,
+    cursor: Annotated[str | None, Query(pattern=CURSOR_PATTERN)] = None,
+    limit: Annotated[int, Query(ge=1, le=200)] = 50,
+) -> JobListResponse:
+    """
+    List the tenant's jobs, newest first.
+
+    Pages are read from per-tenant indexes, so the cost depends on the page
+    size, not on how many jobs exist.
+
+    Args:
+        status_filter: Only jobs currently in this status
+        since: Only jobs created at or after this time
+        cursor: next_cursor from the previous page
+        limit: Page size (max 200)
+    """
+    redis = get_redis()
+    tenant = tenant_for_token(_token)
+    if since is not None and since.tzinfo is None:
+        since = since.replace(tzinfo=UTC)
+
+    jobs, next_cursor = list_jobs(
+        redis,
+        tenant.name,
+        status=status_filter.value if status_filter else None,
+        since=since.timestamp() if since else None,
+        cursor=cursor,
+        limit=limit,
+    )
+    return JobListResponse(
+        jobs=[build_status_response(job_data) for job_data in jobs],
+        next_cursor=next_cursor,
+    )
 
 
 @router.get(
@@ -162,18 +395,28 @@ async def create_job(
 async def get_job_status(
     job_id: str,
     _token: Annotated[str, Depends(verify_token)],
+    response: Response,
     wait: bool = False,
     timeout: int = 300,
-) -> JobStatusResponse:
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> JobStatusResponse | Response:
     """
     Get the status of a download job.
 
+    Responses carry an ETag (the job record's version; for queued jobs also
+    the dispatch sequence, which moves with queue positions). Polling clients
+    that send it back in If-None-Match get an empty 304 while nothing has
+    changed, without building the status response.
+
     Args:
         job_id: The job ID to check
         wait: If True, wait until job is done or error (long-polling)
         timeout: Max seconds to wait (default 300 = 5 minutes, max 600)
+        if_none_match: ETag from a previous response
     """
     redis = get_redis()
+    # Tenants only see their own jobs; the tenant of a job never changes
+    _get_tenant_job(redis, job_id, _token)
 
     # Cap timeout at 10 minutes
     timeout = min(timeout, 600)
@@ -182,26 +425,50 @@ async def get_job_status(
     if wait:
         elapsed = 0
         poll_interval = 2  # Check every 2 seconds
-
-        while elapsed < timeout:
-            job_data = get_job_data(redis, job_id)
-
-            if not job_data:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=ErrorResponse(
-                        error_code=ErrorCode.JOB_NOT_FOUND,
-                        message=ERROR_MESSAGES[ErrorCode.JOB_NOT_FOUND],
-                    ).model_dump(),
-                )
-
-            # If job is done or error, return immediately
-            if job_data["status"] in [JobStatus.DONE.value, JobStatus.ERROR.value]:
-                break
-
-            # Wait and try again
-            await asyncio.sleep(poll_interval)
-            elapsed += poll_interval
+        last_version = None
+
+        gauge_add(redis, "ytdl_long_poll_waiters", 1)
+        try:
+            while elapsed < timeout:
+                version = get_job_version(redis, job_id)
+
+                if version is None:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail=ErrorResponse(
+                            error_code=ErrorCode.JOB_NOT_FOUND,
+                            message=ERROR_MESSAGES[ErrorCode.JOB_NOT_FOUND],
+                        ).model_dump(),
+                    )
+
+                # Only re-read the record when it changed
+                if version != last_version:
+                    last_version = version
+                    job_data = get_job_data(redis, job_id)
+
+                    # If job is done or error, return immediately
+                    if job_data and job_data["status"] in [
+                        JobStatus.DONE.value,
+                        JobStatus.ERROR.value,
+                    ]:
+                        break
+
+                # Wait and try again
+                await asyncio.sleep(poll_interval)
+                elapsed += poll_interval
+        finally:
+            gauge_add(redis, "ytdl_long_poll_waiters", -1)
+
+    # Unchanged since the client's last poll: answer from the counters alone
+    if if_none_match:
+        version, sequence = mget(redis, [version_key(job_id), SEQUENCE_KEY])
+        if version is not None:
+            for etag in (_etag(int(version)), _etag(int(version), int(sequence or 0))):
+                if _etag_matches(if_none_match, etag):
+                    return Response(
+                        status_code=status.HTTP_304_NOT_MODIFIED,
+                        headers={"ETag": etag, "Cache-Control": "no-cache"},
+                    )
 
     job_data = get_job_data(redis, job_id)
 
@@ -214,28 +481,189 @@ async def get_job_status(
             ).model_dump(),
         )
 
-    response = JobStatusResponse(
+    if "version" in job_data:
+        sequence = None
+        if job_data["status"] == JobStatus.QUEUED.value:
+            sequence = get_dispatch_sequence(redis)
+        response.headers["ETag"] = _etag(job_data["version"], sequence)
+        response.headers["Cache-Control"] = "no-cache"
+
+    return build_status_response(job_data, redis)
+
+
+def _is_downloading(job_data: dict | None) -> bool:
+    """Check whether the worker may still append to the streamed file."""
+    if not job_data or job_data["status"] != JobStatus.RUNNING.value:
+        return False
+    return job_data.get("progress", {}).get("stage") == ProgressStage.DOWNLOADING.value
+
+
+async def _tail_file(redis: Redis, job_id: str, f: BinaryIO) -> AsyncIterator[bytes]:
+    """Yield bytes from a growing file until the job stops downloading."""
+    idle = 0.0
+    try:
+        while True:
+            chunk = f.read(STREAM_CHUNK_SIZE)
+            if chunk:
+                idle = 0.0
+                yield chunk
+                continue
+
+            if not _is_downloading(get_job_data(redis, job_id)):
+                # Drain anything written between the last read and the status check
+                while chunk := f.read(STREAM_CHUNK_SIZE):
+                    yield chunk
+                break
+
+            if idle >= STREAM_IDLE_TIMEOUT:
+                break
+
+            await asyncio.sleep(STREAM_POLL_INTERVAL)
+            idle += STREAM_POLL_INTERVAL
+    finally:
+        f.close()
+
+
+@router.get(
+    "/jobs/{job_id}/stream",
+    response_model=None,
+    responses={
+        401: {"model": ErrorResponse},
+        404: {"model": ErrorResponse},
+        409: {"model": ErrorResponse},
+    },
+)
+async def stream_job(
+    job_id: str,
+    _token: Annotated[str, Depends(verify_token)],
+) -> StreamingResponse | RedirectResponse:
+    """
+    Stream a job's video while it is still downloading.
+
+    Tails the worker's output file with chunked transfer, so the API must
+    share download_dir with the worker (single-container deploys).
+    Finished jobs redirect to their download_url.
+    """
+    redis = get_redis()
+    job_data = _get_tenant_job(redis, job_id, _token)
+
+    if job_data["status"] == JobStatus.DONE.value and job_data.get("download_url"):
+        return RedirectResponse(job_data["download_url"])
+
+    stream_path = job_data.get("stream_path")
+    if job_data["status"] != JobStatus.RUNNING.value or not stream_path:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=ErrorResponse(
+                error_code=ErrorCode.STREAM_UNAVAILABLE,
+                message=ERROR_MESSAGES[ErrorCode.STREAM_UNAVAILABLE],
+            ).model_dump(),
+        )
+
+    try:
+        f = open(Path(stream_path), "rb")
+    except OSError as e:
+        # File lives on another host, or the job already cleaned up
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=ErrorResponse(
+                error_code=ErrorCode.STREAM_UNAVAILABLE,
+                message=ERROR_MESSAGES[ErrorCode.STREAM_UNAVAILABLE],
+            ).model_dump(),
+        ) from e
+
+    return StreamingResponse(_tail_file(redis, job_id, f), media_type="video/mp4")
+
+
+@router.get(
+    "/jobs/{job_id}/timings",
+    response_model=None,
+    responses={
+        200: {"model": JobTimingsResponse},
+        401: {"model": ErrorResponse},
+        404: {"model": ErrorResponse},
+    },
+)
+async def get_job_timings(
+    job_id: str,
+    _token: Annotated[str, Depends(verify_token)],
+    format: Literal["waterfall", "otlp"] = "waterfall",
+) -> JobTimingsResponse | dict:
+    """
+    Get the stage timing waterfall for a job.
+
+    Args:
+        job_id: The job ID to check
+        format: "waterfall" (default) or "otlp" for an OTLP/JSON trace export body
+    """
+    redis = get_redis()
+    job_data = _get_tenant_job(redis, job_id, _token)
+
+    if format == "otlp":
+        return build_spans(job_data)
+
+    waterfall = build_waterfall(job_data)
+    return JobTimingsResponse(
         job_id=job_data["job_id"],
         status=JobStatus(job_data["status"]),
+        total_ms=int(max(stage["end"] for stage in waterfall) * 1000),
+        stages=[
+            StageTiming(
+                stage=stage["stage"],
+                start_ms=int(stage["start"] * 1000),
+                duration_ms=int((stage["end"] - stage["start"]) * 1000),
+            )
+            for stage in waterfall
+        ],
     )
 
-    # Add progress info if running
-    if job_data["status"] == JobStatus.RUNNING.value and "progress" in job_data:
-        response.progress = JobProgress(
-            stage=ProgressStage(job_data["progress"]["stage"]),
-            pct=job_data["progress"]["pct"],
-        )
 
-    # Add download URL if done
-    if job_data["status"] == JobStatus.DONE.value:
-        response.download_url = job_data.get("download_url")
-        if "expires_at" in job_data:
-            response.expires_at = datetime.fromisoformat(job_data["expires_at"])
-        response.filename = job_data.get("filename")
+@router.get(
+    "/files/{object_key:path}",
+    response_model=None,
+    responses={
+        403: {"model": ErrorResponse},
+        404: {"model": ErrorResponse},
+    },
+)
+async def get_file(object_key: str, expires: int, sig: str) -> FileResponse | RedirectResponse:
+    """
+    Serve a finished video from this node's cache, or redirect to R2.
 
-    # Add error info if failed
-    if job_data["status"] == JobStatus.ERROR.value:
-        response.error_code = ErrorCode(job_data.get("error_code", ErrorCode.INTERNAL_ERROR))
-        response.message = job_data.get("message", ERROR_MESSAGES[response.error_code])
+    Download URLs point here when the cache tier is enabled. They are
+    signed instead of requiring the API token, so they can be handed to
+    any HTTP client like a presigned R2 URL.
+
+    Args:
+        object_key: Storage key of the video
+        expires: Unix time the link expires at
+        sig: HMAC signature of the key and expiry
+    """
+    if not cache.enabled():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=ErrorResponse(
+                error_code=ErrorCode.JOB_NOT_FOUND,
+                message=ERROR_MESSAGES[ErrorCode.JOB_NOT_FOUND],
+            ).model_dump(),
+        )
+    if not verify_signature(object_key, expires, sig):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=ErrorResponse(
+                error_code=ErrorCode.LINK_EXPIRED,
+                message=ERROR_MESSAGES[ErrorCode.LINK_EXPIRED],
+            ).model_dump(),
+        )
 
-    return response
+    redis = get_redis()
+    path = await asyncio.to_thread(cache.lookup, redis, object_key)
+    if path is not None:
+        return FileResponse(path, media_type="video/mp4")
+
+    # Cold: send the client to R2, and bring the object in if it is getting popular
+    if await asyncio.to_thread(cache.should_fill, redis, object_key):
+        task = asyncio.create_task(asyncio.to_thread(warm_cache, redis, object_key))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    return RedirectResponse(await asyncio.to_thread(generate_origin_url, object_key))
@@ -0,0 +1,156 @@
+"""Node-wide bandwidth allocation shared by concurrent downloads.
+
+RQ runs each job in its own process, so downloads on one node cannot see
+each other directly. Each active download registers in a per-node Redis
+hash (bandwidth:{node}) with a weight and splits NODE_BANDWIDTH_MBPS with
+the others in proportion to the weights. Downloads with little left
+(Shorts, or jobs about to finish) weigh more, so a large `best` job cannot
+starve the small jobs users are waiting on. Background downloads
+(prefetches, see ytdl.prefetch) weigh a tenth as much, so they mostly use
+bandwidth nobody else wants.
+
+Limits are enforced through yt-dlp's ratelimit (read live by its own
+downloader), aria2c's --max-overall-download-limit (fixed per aria2c run)
+and a token bucket in the Cobalt downloader.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from ytdl.config import settings
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = 1.0  # Seconds between share recalculations per download
+STALE_AFTER = 10.0  # Entries not refreshed for this long are dropped
+PRIORITY_BOOST = 4.0  # Extra weight for a download with nothing left
+PRIORITY_BYTES = 50 * 1024 * 1024  # Remaining size at which the boost halves
+MIN_RATE = 64 * 1024  # Never throttle a download below this (bytes/s)
+BACKGROUND_WEIGHT = 0.1  # Weight factor for downloads nobody is waiting on
+
+
+def _node_key() -> str:
+    return f"bandwidth:{settings.node_id}"
+
+
+def download_weight(remaining_bytes: int | None) -> float:
+    """Share weight: 1 plus a boost that grows as the remaining download shrinks."""
+    if remaining_bytes is None:
+        return 1.0
+    return 1.0 + PRIORITY_BOOST * PRIORITY_BYTES / (PRIORITY_BYTES + max(remaining_bytes, 0))
+
+
+class BandwidthShare:
+    """One download's share of the node's ingress budget."""
+
+    def __init__(self, redis: Redis, job_id: str, background: bool = False):
+        self.redis = redis
+        self.job_id = job_id
+        self.factor = BACKGROUND_WEIGHT if background else 1.0
+        self.capacity = settings.node_bandwidth_mbps * 125_000  # bytes/s
+        self.rate: float | None = None
+        self._refreshed = 0.0
+
+    def update(self, remaining_bytes: int | None = None, force: bool = False) -> float | None:
+        """
+        Report how much is left and get the current rate limit.
+
+        Recalculates at most once per REFRESH_INTERVAL unless forced.
+
+        Returns:
+            Rate limit in bytes/s
+        """
+        now = time.time()
+        if not force and now - self._refreshed < REFRESH_INTERVAL:
+            return self.rate
+        self._refreshed = now
+
+        key = _node_key()
+        entry = json.dumps({"weight": self.factor * download_weight(remaining_bytes), "ts": now})
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hset(key, self.job_id, entry)
+            pipe.hgetall(key)
+            _, entries = pipe.execute()
+        except RedisError as e:
+            logger.debug(f"Bandwidth share unavailable: {e}")
+            return self.rate
+
+        weights = {}
+        stale = []
+        for job_id, raw in entries.items():
+            data = json.loads(raw)
+            if now - data["ts"] > STALE_AFTER:
+                stale.append(job_id)
+            else:
+                weights[job_id] = data["weight"]
+        if stale:
+            self.redis.hdel(key, *stale)
+
+        self.rate = max(self.capacity * weights[self.job_id] / sum(weights.values()), MIN_RATE)
+        return self.rate
+
+    def close(self) -> None:
+        """Give the share back to the other downloads."""
+        try:
+            self.redis.hdel(_node_key(), self.job_id)
+        except RedisError as e:
+            logger.debug(f"Failed to release bandwidth share: {e}")
+
+
+def fair_share(redis: Redis) -> float | None:
+    """
+    Rate a new download would get next to the ones running on this node.
+
+    Returns:
+        Bytes/s of an equal share of NODE_BANDWIDTH_MBPS, or None with no cap
+    """
+    if not settings.node_bandwidth_mbps:
+        return None
+    try:
+        active = redis.hlen(_node_key())
+    except RedisError as e:
+        logger.debug(f"Bandwidth share unavailable: {e}")
+        active = 0
+    return settings.node_bandwidth_mbps * 125_000 / (active + 1)
+
+
+@contextmanager
+def bandwidth_share(
+    redis: Redis, job_id: str, background: bool = False
+) -> Iterator[BandwidthShare | None]:
+    """Hold a bandwidth share for the block; None when no node limit is set."""
+    if not settings.node_bandwidth_mbps:
+        yield None
+        return
+
+    share = BandwidthShare(redis, job_id, background)
+    try:
+        yield share
+    finally:
+        share.close()
+
+
+class TokenBucket:
+    """Async token bucket limiting bytes per second, with up to a second of burst."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    async def consume(self, amount: int) -> None:
+        """Wait until `amount` bytes may be taken."""
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.rate)
+        self.updated = now
+        self.tokens -= amount
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
@@ -0,0 +1,187 @@
+"""Node-local disk cache of hot objects in front of R2.
+
+A few popular videos make up most downloads, so in R2 mode a node can keep
+copies on local disk (CACHE_DIR, shared by the API and workers on the
+node) and serve them itself. Workers add each file as they upload it; the
+API serves from the cache on a hit and redirects to R2 on a miss, fetching
+objects back in once they have been requested CACHE_ADMIT_HITS times.
+
+When the cache grows past CACHE_MAX_MB, files are evicted by last access
+time, with each doubling of an object's request count (kept in Redis)
+buying it another HIT_BONUS seconds: plain LRU for one-off downloads,
+closer to LFU for the videos everyone asks for.
+"""
+
+import logging
+import math
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from ytdl.config import StorageMode, settings
+from ytdl.metrics import inc
+
+logger = logging.getLogger(__name__)
+
+HITS_KEY = "cache:hits"  # Sorted set of object keys by request count
+FILL_LOCK_PREFIX = "cache:fill:"
+HIT_BONUS = 3600.0  # Seconds of recency credited per doubling of requests
+MAX_TRACKED = 10_000  # Request counts kept for this many objects
+HITS_TTL = 7 * 86400
+
+
+def enabled() -> bool:
+    """Whether the cache tier is in use (R2 storage with a size budget)."""
+    return settings.storage_mode == StorageMode.R2 and settings.cache_max_mb > 0
+
+
+def _root() -> Path:
+    return Path(settings.cache_dir)
+
+
+def cache_path(object_key: str) -> Path | None:
+    """Cache location for an object key, or None if the key escapes the cache dir."""
+    root = _root().resolve()
+    path = (root / object_key).resolve()
+    return path if path.is_relative_to(root) and path != root else None
+
+
+def lookup(redis: Redis, object_key: str) -> Path | None:
+    """
+    Count a request for an object and find it in the cache.
+
+    Returns:
+        Path to the cached file, or None on a miss
+    """
+    try:
+        pipe = redis.pipeline()
+        pipe.zincrby(HITS_KEY, 1, object_key)
+        pipe.expire(HITS_KEY, HITS_TTL)
+        pipe.execute()
+    except RedisError as e:
+        logger.debug(f"Failed to count cache request: {e}")
+
+    path = cache_path(object_key)
+    if path is None or not path.is_file():
+        inc(redis, "ytdl_cache_requests_total", result="miss")
+        return None
+
+    # Access time drives eviction; don't rely on the filesystem's atime mode
+    try:
+        os.utime(path)
+    except OSError:
+        pass  # Evicted between the check and now; still readable if open
+    inc(redis, "ytdl_cache_requests_total", result="hit")
+    return path
+
+
+def should_fill(redis: Redis, object_key: str) -> bool:
+    """
+    Decide whether a missed object is hot enough to fetch back into the cache.
+
+    Only one caller per object gets True while a fetch is in flight.
+    """
+    hits = redis.zscore(HITS_KEY, object_key) or 0
+    if hits < settings.cache_admit_hits:
+        return False
+    return bool(redis.set(f"{FILL_LOCK_PREFIX}{object_key}", 1, nx=True, ex=300))
+
+
+def put(redis: Redis, local_path: Path, object_key: str, move: bool = False) -> None:
+    """
+    Copy a file into the cache, then evict down to the size budget.
+
+    Args:
+        redis: Redis connection
+        local_path: File to cache
+        object_key: Key the object is stored under in R2
+        move: Move the file in instead of copying (same filesystem only)
+    """
+    path = cache_path(object_key)
+    if path is None:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write under a temporary name so readers never see a partial file
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".", suffix=".tmp")
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    try:
+        if move:
+            os.replace(local_path, path)
+        else:
+            shutil.copyfile(local_path, tmp_path)
+            os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Failed to cache {object_key}: {e}")
+        return
+    finally:
+        tmp_path.unlink(missing_ok=True)
+        redis.delete(f"{FILL_LOCK_PREFIX}{object_key}")
+
+    logger.info(f"Cached {object_key}")
+    evict(redis)
+
+
+def _entries() -> list[tuple[Path, str, int, float]]:
+    """Cached files as (path, object key, size, last access), skipping in-progress writes."""
+    root = _root()
+    if not root.is_dir():
+        return []
+
+    entries = []
+    for path in root.rglob("*"):
+        key = path.relative_to(root)
+        if any(part.startswith(".") for part in key.parts):
+            continue
+        try:
+            stat = path.stat()
+        except OSError:
+            continue  # Evicted by another process while we looked
+        if path.is_file():
+            entries.append((path, key.as_posix(), stat.st_size, stat.st_mtime))
+    return entries
+
+
+def evict(redis: Redis) -> int:
+    """
+    Remove the least valuable files until the cache fits CACHE_MAX_MB.
+
+    Returns:
+        Number of files evicted
+    """
+    entries = _entries()
+    budget = settings.cache_max_mb * 1024 * 1024
+    total = sum(size for _, _, size, _ in entries)
+    if total <= budget:
+        return 0
+
+    hits = redis.zmscore(HITS_KEY, [key for _, key, _, _ in entries])
+    entries = sorted(
+        zip(entries, hits, strict=True),
+        key=lambda item: item[0][3] + HIT_BONUS * math.log2(1 + (item[1] or 0)),
+    )
+
+    evicted = 0
+    for (path, key, size, _), _ in entries:
+        if total <= budget:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        evicted += 1
+        inc(redis, "ytdl_cache_evictions_total")
+        inc(redis, "ytdl_cache_evicted_bytes_total", size)
+        logger.info(f"Evicted {key} from cache")
+
+    # Forget request counts for the long tail
+    redis.zremrangebyrank(HITS_KEY, 0, -MAX_TRACKED - 1)
+    return evicted
+
+
+def cached_bytes() -> int:
+    """Total size of the cached files, for the metrics scrape."""
+    return sum(size for _, _, size, _ in _entries())
@@ -1,5 +1,6 @@
 """Cobalt API fallback downloader for when yt-dlp fails."""
 
+import json
 import logging
 import re
 from collections.abc import Callable
@@ -7,8 +8,10 @@ from pathlib import Path
 
 import httpx
 
+from ytdl.bandwidth import BandwidthShare, TokenBucket
 from ytdl.config import settings
-from ytdl.errors import DownloadError, ErrorCode
+from ytdl.errors import DownloadError, ErrorCode, YTDLError
+from ytdl.metrics import StageCallback, timed_stage
 
 logger = logging.getLogger(__name__)
 
@@ -114,31 +117,122 @@ async def _fetch_cobalt_download_url(url: str, quality: str) -> str:
             ) from e
 
 
+def _validator_path(output_path: Path) -> Path:
+    """Sidecar recording which version of the file a partial download belongs to."""
+    return output_path.with_name(f"{output_path.name}.validator")
+
+
+def _validator(response: httpx.Response, total_size: int | None) -> dict:
+    """ETag, Last-Modified and total length of a response, where the server sent them."""
+    return {
+        "etag": response.headers.get("etag"),
+        "last_modified": response.headers.get("last-modified"),
+        "length": total_size or None,
+    }
+
+
+def _same_file(stored: dict, current: dict) -> bool:
+    """Whether two validators describe the same file: every field both have must agree."""
+    shared = [key for key, value in stored.items() if value and current.get(key)]
+    return bool(shared) and all(stored[key] == current[key] for key in shared)
+
+
 async def _download_file(
     download_url: str,
     output_path: Path,
     progress_callback: Callable[[str, int], None] | None = None,
+    bandwidth: BandwidthShare | None = None,
 ) -> None:
     """
     Download file from URL to local path.
 
+    Resumes an existing partial file with a Range request when the server
+    supports it, otherwise starts over. The ETag, Last-Modified and length of
+    the file are kept next to the partial, and a partial is only appended to
+    when the server still describes the same file.
+
     Args:
         download_url: URL to download from
         output_path: Local file path to save to
         progress_callback: Optional callback(stage, percentage)
+        bandwidth: Optional share of the node's bandwidth, enforced with a token bucket
     """
+    validator_path = _validator_path(output_path)
+    stored = None
+    if output_path.exists() and validator_path.exists():
+        stored = json.loads(validator_path.read_text())
+    existing = output_path.stat().st_size if stored else 0
+
+    headers = {}
+    if existing:
+        headers["Range"] = f"bytes={existing}-"
+        # Ask for the whole file instead if it changed since the partial was written
+        etag = stored.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["If-Range"] = etag
+        elif stored.get("last_modified"):
+            headers["If-Range"] = stored["last_modified"]
+
+    def start_over(reason: str):
+        logger.warning(f"Cannot resume {output_path} ({reason}), starting over")
+        output_path.unlink(missing_ok=True)
+        validator_path.unlink(missing_ok=True)
+        return _download_file(download_url, output_path, progress_callback, bandwidth)
+
     async with httpx.AsyncClient(timeout=300.0, follow_redirects=True) as client:
-        async with client.stream("GET", download_url) as response:
+        async with client.stream("GET", download_url, headers=headers) as response:
+            if existing and response.status_code == 416:
+                # Nothing past our offset: either the partial is already the whole
+                # file, or it is longer than the file the server has now
+                match = re.match(r"bytes \*/(\d+)", response.headers.get("content-range", ""))
+                total = int(match.group(1)) if match else None
+                if total == existing and stored.get("length") in (None, total):
+                    logger.info(f"{output_path} was already complete at {existing} bytes")
+                    return
+                return await start_over(f"416 with Content-Range total {total}")
             response.raise_for_status()
 
             total_size = int(response.headers.get("content-length", 0))
             downloaded = 0
-
-            with open(output_path, "wb") as f:
+            mode = "wb"
+
+            if response.status_code == 206:
+                # Content-Range: bytes <start>-<end>/<total>
+                content_range = response.headers.get("content-range", "")
+                match = re.match(r"bytes (\d+)-\d+/(\d+|\*)", content_range)
+                if not match or int(match.group(1)) != existing:
+                    raise DownloadError(
+                        ErrorCode.DOWNLOAD_FAILED,
+                        f"Unexpected Content-Range when resuming: {content_range!r}",
+                    )
+                total = int(match.group(2)) if match.group(2) != "*" else None
+                if existing:
+                    if not _same_file(stored, _validator(response, total)):
+                        return await start_over("the file changed on the server")
+                    logger.info(f"Resuming {output_path} at {existing} bytes")
+                    mode = "ab"
+                    downloaded = existing
+                    total_size += existing
+
+            if mode == "wb":
+                validator_path.write_text(json.dumps(_validator(response, total_size)))
+
+            bucket = None
+            if bandwidth:
+                remaining = total_size - downloaded if total_size else None
+                rate = bandwidth.update(remaining, force=True)
+                bucket = TokenBucket(rate) if rate else None
+
+            with open(output_path, mode) as f:
                 async for chunk in response.aiter_bytes(chunk_size=8192):
                     f.write(chunk)
                     downloaded += len(chunk)
 
+                    if bucket:
+                        remaining = total_size - downloaded if total_size else None
+                        bucket.rate = bandwidth.update(remaining) or bucket.rate
+                        await bucket.consume(len(chunk))
+
                     if progress_callback and total_size > 0:
                         pct = int(downloaded * 100 / total_size)
                         progress_callback("downloading", pct)
@@ -149,6 +243,9 @@ def download_with_cobalt(
     quality: str,
     output_dir: Path,
     progress_callback: Callable[[str, int], None] | None = None,
+    file_callback: Callable[[Path], None] | None = None,
+    stage_callback: StageCallback | None = None,
+    bandwidth: BandwidthShare | None = None,
 ) -> Path:
     """
     Download a YouTube video using Cobalt API (synchronous wrapper).
@@ -158,6 +255,10 @@ def download_with_cobalt(
         quality: Video quality (480, 720, 1080, best)
         output_dir: Directory to save the video
         progress_callback: Optional callback(stage, percentage)
+        file_callback: Optional callback(path) called with the growing output file
+        stage_callback: Optional callback(stage, started, ended) for extract and
+            download timings
+        bandwidth: Optional share of the node's bandwidth budget to stay within
 
     Returns:
         Path to the downloaded video file
@@ -168,7 +269,9 @@ def download_with_cobalt(
     import asyncio
 
     return asyncio.run(
-        _download_with_cobalt_async(url, quality, output_dir, progress_callback)
+        _download_with_cobalt_async(
+            url, quality, output_dir, progress_callback, file_callback, stage_callback, bandwidth
+        )
     )
 
 
@@ -177,6 +280,9 @@ async def _download_with_cobalt_async(
     quality: str,
     output_dir: Path,
     progress_callback: Callable[[str, int], None] | None = None,
+    file_callback: Callable[[Path], None] | None = None,
+    stage_callback: StageCallback | None = None,
+    bandwidth: BandwidthShare | None = None,
 ) -> Path:
     """
     Download a YouTube video using Cobalt API.
@@ -186,6 +292,10 @@ async def _download_with_cobalt_async(
         quality: Video quality (480, 720, 1080, best)
         output_dir: Directory to save the video
         progress_callback: Optional callback(stage, percentage)
+        file_callback: Optional callback(path) called with the growing output file
+        stage_callback: Optional callback(stage, started, ended) for extract and
+            download timings
+        bandwidth: Optional share of the node's bandwidth budget to stay within
 
     Returns:
         Path to the downloaded video file
@@ -197,28 +307,40 @@ async def _download_with_cobalt_async(
 
     try:
         # Get download URL from Cobalt
-        download_url = await _fetch_cobalt_download_url(url, quality)
+        with timed_stage("extract", stage_callback):
+            download_url = await _fetch_cobalt_download_url(url, quality)
 
         # Generate output filename
         # Extract video ID from URL for consistent naming
-        video_id = _extract_video_id(url) or "video"
+        video_id = extract_video_id(url) or "video"
         output_path = output_dir / f"cobalt_{video_id}.mp4"
+        # Kept across retries when output_dir is a resumable work area
+        part_path = output_dir / f"{output_path.name}.part"
 
         logger.info(f"Downloading from Cobalt to: {output_path}")
 
+        # Cobalt always returns a single muxed file, so it can be tailed as it grows
+        if file_callback:
+            part_path.touch()
+            file_callback(part_path)
+
         # Download the file
-        await _download_file(download_url, output_path, progress_callback)
+        with timed_stage("download", stage_callback):
+            await _download_file(download_url, part_path, progress_callback, bandwidth)
 
-        if not output_path.exists() or output_path.stat().st_size == 0:
+        if not part_path.exists() or part_path.stat().st_size == 0:
             raise DownloadError(
                 ErrorCode.DOWNLOAD_FAILED,
                 "Downloaded file is empty or missing",
             )
+        part_path.rename(output_path)
+        _validator_path(part_path).unlink(missing_ok=True)
 
         logger.info(f"Cobalt download complete: {output_path}")
         return output_path
 
-    except DownloadError:
+    except YTDLError:
+        # Ours already, including preemption and cancellation from the progress hooks
         raise
     except Exception as e:
         logger.error(f"Cobalt download failed: {e}")
@@ -228,7 +350,7 @@ async def _download_with_cobalt_async(
         ) from e
 
 
-def _extract_video_id(url: str) -> str | None:
+def extract_video_id(url: str) -> str | None:
     """Extract YouTube video ID from URL."""
     patterns = [
         r"(?:v=|/v/|youtu\.be/)([a-zA-Z0-9_-]{11})",
@@ -243,6 +365,30 @@ def _extract_video_id(url: str) -> str | None:
     return None
 
 
+# Bot detection / sign-in required errors
+BOT_DETECTION_PATTERNS = [
+    "sign in",
+    "signin",
+    "bot",
+    "confirm you",
+    "verify",
+    "captcha",
+    "unusual traffic",
+    "blocked",
+]
+
+
+def _bot_detection_pattern(error: Exception) -> str | None:
+    """The bot detection pattern an error matches, if any."""
+    error_str = str(error).lower()
+    return next((pattern for pattern in BOT_DETECTION_PATTERNS if pattern in error_str), None)
+
+
+def is_bot_detection(error: Exception) -> bool:
+    """Whether a yt-dlp error means YouTube took us for a bot or wants a sign-in."""
+    return _bot_detection_pattern(error) is not None
+
+
 def should_fallback_to_cobalt(error: Exception) -> bool:
     """
     Determine if we should try Cobalt fallback based on the error.
@@ -253,23 +399,8 @@ def should_fallback_to_cobalt(error: Exception) -> bool:
     Returns:
         True if we should try Cobalt fallback
     """
-    error_str = str(error).lower()
-
-    # Bot detection / sign-in required errors
-    bot_detection_patterns = [
-        "sign in",
-        "signin",
-        "bot",
-        "confirm you",
-        "verify",
-        "captcha",
-        "unusual traffic",
-        "blocked",
-    ]
-
-    for pattern in bot_detection_patterns:
-        if pattern in error_str:
-            logger.info(f"Detected bot/sign-in error, will try Cobalt fallback: {pattern}")
-            return True
-
-    return False
+    pattern = _bot_detection_pattern(error)
+    if pattern is None:
+        return False
+    logger.info(f"Detected bot/sign-in error, will try Cobalt fallback: {pattern}")
+    return True
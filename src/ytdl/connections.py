@@ -0,0 +1,78 @@
+"""Redis connections: shared state (standalone or Redis Cluster) and RQ queue shards.
+
+Job records, tenant queues, metrics and the rest of the shared state live in
+one logical Redis at REDIS_URL. With REDIS_CLUSTER=true, that URL is any
+node of a Redis Cluster and the keyspace is spread over its masters. Keys
+that are read or written together carry a hash tag (the part in braces), so
+they map to the same slot, as WATCH/MULTI requires on a cluster:
+
+    job:{<id>}, job:{<id>}:version                  one job's record and version
+    jobs:index:{<tenant>}, jobs:index:{<tenant>}:<status>
+    queue:{<tenant>}                                a tenant's waiting jobs
+    identity:{<name>}, identity:{<name>}:leases     an identity's health and leases
+
+Pipelines that span several tags are split per node and sent without MULTI,
+and multi-key reads go through mget() below.
+
+RQ is not cluster-aware (it moves jobs between a queue, its registries and
+the job hashes with multi-key commands), so queues are sharded on the
+client instead: QUEUE_URLS lists standalone Redis instances, each holding
+its own copy of every lane. Dispatch puts a job on the shard with the most
+free slots for its lane, and every worker consumes from one shard
+(`rq worker --url <shard>` or `python -m ytdl.pipeline --shard <n>`).
+Without QUEUE_URLS, queues live next to the state at REDIS_URL.
+"""
+
+from redis import Redis
+from redis.cluster import RedisCluster
+
+from ytdl.config import settings
+
+# Clients are thread-safe and survive fork (pools reconnect in the child), so
+# each process keeps one per URL instead of opening a pool per call
+_clients: dict[tuple[str, bool, bool], Redis | RedisCluster] = {}
+
+
+def _client(url: str, cluster: bool = False, decode_responses: bool = True) -> Redis:
+    key = (url, cluster, decode_responses)
+    client = _clients.get(key)
+    if client is None:
+        factory = RedisCluster if cluster else Redis
+        client = factory.from_url(url, decode_responses=decode_responses)
+        _clients[key] = client
+    return client
+
+
+def get_redis() -> Redis:
+    """Connection to the shared state (a RedisCluster with REDIS_CLUSTER=true)."""
+    return _client(settings.redis_url, settings.redis_cluster)
+
+
+def is_cluster(redis: Redis) -> bool:
+    """Whether a connection talks to a Redis Cluster."""
+    return isinstance(redis, RedisCluster)
+
+
+def mget(redis: Redis, keys: list[str]) -> list[str | None]:
+    """MGET that also works for keys in different cluster slots (not atomic there)."""
+    if is_cluster(redis):
+        return redis.mget_nonatomic(keys)
+    return redis.mget(keys)
+
+
+def queue_urls() -> list[str]:
+    """Redis instances holding the RQ queues, in shard order."""
+    if settings.queue_urls:
+        return settings.queue_urls
+    if settings.redis_cluster:
+        raise ValueError("QUEUE_URLS is required with REDIS_CLUSTER: RQ needs standalone Redis")
+    return [settings.redis_url]
+
+
+def queue_connections() -> list[Redis]:
+    """
+    Connections to each queue shard.
+
+    RQ stores pickled payloads, so these do not decode responses.
+    """
+    return [_client(url, decode_responses=False) for url in queue_urls()]
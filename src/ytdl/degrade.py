@@ -0,0 +1,137 @@
+"""Load-adaptive quality for jobs that treat quality as a preference.
+
+A job created with min_quality accepts anything from min_quality up to its
+requested quality. When a worker picks such a job up, it checks how long the
+job has already waited and how fast this node is downloading. It then keeps
+the best quality that is still expected to finish within QUALITY_TARGET_SECONDS
+of submission. Under a deep queue, a `best` request at the head of the line
+therefore takes minutes less and frees its worker sooner.
+
+Expected run time is the video's duration at a typical bitrate for each tier
+(see ytdl.staging), divided by the node's download rate, plus a margin for
+faststart and upload. The rate is the node's recent average throughput
+(stats:download_bps:{node}), capped by this download's share of
+NODE_BANDWIDTH_MBPS when one is set. Without a duration or any rate, only the
+queue wait counts: a job that has already used up its target drops straight
+to min_quality.
+
+The quality picked is written to the job record's `quality`, so download,
+RAM staging and resumable partials all follow it. The original request is
+kept in `requested_quality`, and every attempt chooses again from there.
+A degraded job can be upgraded later (POST /jobs/{id}/upgrade), which
+submits a new job for the requested quality without min_quality.
+"""
+
+import logging
+from datetime import UTC, datetime
+
+from redis import Redis
+
+from ytdl.bandwidth import fair_share
+from ytdl.config import settings
+from ytdl.jobs import update_job
+from ytdl.metrics import inc
+from ytdl.models import Quality
+from ytdl.staging import BYTES_PER_SECOND
+
+logger = logging.getLogger(__name__)
+
+THROUGHPUT_ALPHA = 0.2
+OVERHEAD = 1.5  # Run time per second of download, for faststart and upload
+
+TIERS = [quality.value for quality in Quality]  # Lowest first
+
+
+def _throughput_key() -> str:
+    return f"stats:download_bps:{settings.node_id}"
+
+
+def enabled() -> bool:
+    """Whether load-adaptive quality is on (QUALITY_TARGET_SECONDS > 0)."""
+    return settings.quality_target_seconds > 0
+
+
+def record_throughput(redis: Redis, bytes_per_second: float) -> None:
+    """Fold a finished download's throughput into this node's average."""
+    key = _throughput_key()
+    previous = float(redis.get(key) or bytes_per_second)
+    redis.set(key, (1 - THROUGHPUT_ALPHA) * previous + THROUGHPUT_ALPHA * bytes_per_second)
+
+
+def _download_rate(redis: Redis) -> float | None:
+    """Bytes/s a new download on this node can expect, if anything is known."""
+    measured = redis.get(_throughput_key())
+    rate = float(measured) if measured else None
+    share = fair_share(redis)
+    if share is not None:
+        rate = min(rate, share) if rate else share
+    return rate
+
+
+def expected_seconds(duration: float, quality: str, rate: float) -> float:
+    """Expected run time of a job at a quality, at a download rate in bytes/s."""
+    size = duration * BYTES_PER_SECOND.get(quality, BYTES_PER_SECOND["best"])
+    return size / rate * OVERHEAD
+
+
+def choose_quality(redis: Redis, job_data: dict) -> str:
+    """
+    Pick the quality to download a job at, given the load right now.
+
+    Args:
+        redis: Redis connection
+        job_data: The job record
+
+    Returns:
+        The best tier between min_quality and the requested quality expected
+        to finish within the target; the requested quality for jobs without
+        min_quality or with the policy off
+    """
+    requested = job_data.get("requested_quality", job_data["quality"])
+    minimum = job_data.get("min_quality")
+    if not enabled() or not minimum or minimum not in TIERS or requested not in TIERS:
+        return requested
+
+    created_at = datetime.fromisoformat(job_data["created_at"])
+    waited = (datetime.now(UTC) - created_at).total_seconds()
+    budget = settings.quality_target_seconds - waited
+    if budget <= 0:
+        return minimum
+
+    duration = job_data.get("duration")
+    rate = _download_rate(redis)
+    if duration is None or not rate:
+        return requested
+
+    candidates = TIERS[TIERS.index(minimum) : TIERS.index(requested) + 1]
+    for quality in reversed(candidates):
+        if expected_seconds(duration, quality, rate) <= budget:
+            return quality
+    return minimum
+
+
+def select_quality(redis: Redis, job_id: str, job_data: dict) -> dict:
+    """
+    Settle the quality for a job attempt before any work starts.
+
+    Records the choice in the job record when it differs from the last one.
+
+    Returns:
+        The job record with `quality` set to the chosen tier
+    """
+    requested = job_data.get("requested_quality", job_data["quality"])
+    quality = choose_quality(redis, job_data)
+    if quality == job_data["quality"]:
+        return job_data
+
+    if quality != requested:
+        logger.info(f"Job {job_id} degraded from {requested} to {quality} under load")
+        inc(redis, "ytdl_quality_degraded_total", requested=requested, chosen=quality)
+    updated = update_job(redis, job_id, quality=quality, requested_quality=requested)
+    return updated or {**job_data, "quality": quality, "requested_quality": requested}
+
+
+def degraded(job_data: dict) -> bool:
+    """Whether a job was delivered, or is being fetched, below its requested quality."""
+    requested = job_data.get("requested_quality")
+    return requested is not None and requested != job_data["quality"]
@@ -6,13 +6,18 @@ import re
 import shutil
 import subprocess
 import tempfile
+import time
+from collections.abc import Callable
 from pathlib import Path
-from typing import Callable
 
 import yt_dlp
 
-from ytdl.config import settings
-from ytdl.errors import DownloadError, ErrorCode
+from ytdl.bandwidth import BandwidthShare
+from ytdl.config import Identity, settings
+from ytdl.errors import DownloadError, ErrorCode, YTDLError
+from ytdl.fragments import FragmentTuner
+from ytdl.metrics import StageCallback, timed_stage
+from ytdl.partials import check_resume_manifest
 
 logger = logging.getLogger(__name__)
 
@@ -34,12 +39,23 @@ def sanitize_filename(title: str) -> str:
     return sanitized.strip("_")
 
 
-def get_format_selector(quality: str) -> str:
+# Lowest acceptable single-file height per quality: anything above the next tier down
+PROGRESSIVE_MIN_HEIGHT = {"480": 360, "720": 480, "1080": 720, "best": 1080}
+
+
+def get_format_selector(quality: str, progressive: bool = False) -> str:
     """
     Get yt-dlp format selector string for requested quality.
 
     Uses separate video + audio streams for better compatibility,
     especially with YouTube Shorts and restricted videos.
+
+    With progressive=True a single-file MP4 is preferred, since only a
+    single file can be streamed to the client while it is still growing.
+    It must be in the requested tier (above the next lower one): YouTube
+    usually offers only a 360p single file (format 18), and taking that for
+    a 720p request would silently drop the quality. Without one, the
+    separate streams are used and the job is not streamed.
     """
     quality_map = {
         "480": "bv*[height<=480]+ba/best",
@@ -47,7 +63,24 @@ def get_format_selector(quality: str) -> str:
         "1080": "bv*[height<=1080]+ba/best",
         "best": "bv*+ba/best",
     }
-    return quality_map.get(quality, "bv*[height<=720]+ba/best")
+    selector = quality_map.get(quality, "bv*[height<=720]+ba/best")
+
+    if progressive:
+        floor = PROGRESSIVE_MIN_HEIGHT.get(quality, PROGRESSIVE_MIN_HEIGHT["best"])
+        height = f"[height<={quality}]" if quality in ("480", "720", "1080") else ""
+        selector = f"b{height}[height>{floor}][ext=mp4]/{selector}"
+
+    return selector
+
+
+def _aria2c_args(concurrency: int) -> list[str]:
+    """aria2c arguments for a number of parallel connections."""
+    return [
+        f"-x{concurrency}",
+        f"-s{concurrency}",
+        "-k1M",
+        "--file-allocation=none",
+    ]
 
 
 def check_aria2c_available() -> bool:
@@ -55,29 +88,63 @@ def check_aria2c_available() -> bool:
     return shutil.which("aria2c") is not None
 
 
-def get_cookies_file() -> Path | None:
-    """Get cookies file path, creating from base64 env var if needed."""
+def get_cookies_file(identity: Identity | None) -> Path | None:
+    """
+    Write an identity's cookie jar to a private temp file.
+
+    yt-dlp saves cookies back to the file when it finishes, so concurrent
+    jobs must not share one. The caller deletes the file.
+    """
     # Cookies disabled - Railway IP works without them
-    # If needed in future, set YOUTUBE_COOKIES_BASE64 env var
-    if not settings.youtube_cookies_base64:
+    # If needed, set YOUTUBE_COOKIES_BASE64 or IDENTITIES
+    if not identity or not identity.cookies_base64:
         return None
 
     try:
-        cookies_content = base64.b64decode(settings.youtube_cookies_base64).decode("utf-8")
-        cookies_path = Path(tempfile.gettempdir()) / "youtube_cookies.txt"
-        cookies_path.write_text(cookies_content)
-        logger.info(f"Loaded YouTube cookies: {len(cookies_content.strip().split(chr(10)))} lines")
-        return cookies_path
+        cookies_content = base64.b64decode(identity.cookies_base64).decode("utf-8")
+        with tempfile.NamedTemporaryFile(
+            "w", prefix=f"ytdl_cookies_{identity.name}_", suffix=".txt", delete=False
+        ) as f:
+            f.write(cookies_content)
+        logger.info(
+            f"Loaded YouTube cookies for {identity.name}: "
+            f"{len(cookies_content.strip().split(chr(10)))} lines"
+        )
+        return Path(f.name)
     except Exception as e:
-        logger.warning(f"Failed to decode cookies: {e}")
+        logger.warning(f"Failed to decode cookies for {identity.name}: {e}")
         return None
 
 
+def probe_duration(url: str) -> float | None:
+    """
+    Look up a video's duration without resolving formats or downloading.
+
+    Returns:
+        Duration in seconds, or None if it could not be determined
+    """
+    ydl_opts = {"quiet": True, "no_warnings": True, "skip_download": True}
+    try:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False, process=False)
+    except Exception as e:
+        logger.debug(f"Metadata probe failed for {url}: {e}")
+        return None
+    duration = info.get("duration") if info else None
+    return float(duration) if duration else None
+
+
 def download_video(
     url: str,
     quality: str,
     output_dir: Path,
     progress_callback: Callable[[str, int], None] | None = None,
+    progressive: bool = False,
+    file_callback: Callable[[Path], None] | None = None,
+    stage_callback: StageCallback | None = None,
+    identity: Identity | None = None,
+    fragment_tuner: FragmentTuner | None = None,
+    bandwidth: BandwidthShare | None = None,
 ) -> Path:
     """
     Download a YouTube video.
@@ -87,6 +154,15 @@ def download_video(
         quality: Video quality (480, 720, 1080, best)
         output_dir: Directory to save the video
         progress_callback: Optional callback(stage, percentage)
+        progressive: Prefer a single-file format that can be streamed while downloading
+        file_callback: Optional callback(path) called once with the growing output
+            file, only when a single-file format is being downloaded
+        stage_callback: Optional callback(stage, started, ended) for extract,
+            download, merge and remux timings
+        identity: Optional cookie jar and proxy to download with
+        fragment_tuner: Optional tuner that picks the number of parallel
+            connections for the CDN host and learns from the throughput
+        bandwidth: Optional share of the node's bandwidth budget to stay within
 
     Returns:
         Path to the downloaded video file
@@ -96,8 +172,37 @@ def download_video(
     """
     output_dir.mkdir(parents=True, exist_ok=True)
 
+    streamed_files: set[str] = set()
+    # Decided once from the top-level info after extraction: yt-dlp strips
+    # requested_formats from the per-format info_dict it hands to the hooks
+    streamable = False
+
+    # Bytes fetched in this run per file (excluding any resumed prefix)
+    first_seen: dict[str, int] = {}
+    fetched: dict[str, int] = {}
+
     # Progress hook for yt-dlp
     def progress_hook(d):
+        name = d.get("filename")
+        if name and d.get("downloaded_bytes") is not None:
+            first_seen.setdefault(name, d["downloaded_bytes"])
+            fetched[name] = d["downloaded_bytes"] - first_seen[name]
+
+        # yt-dlp's downloader reads ratelimit live; aria2c gets it per file
+        if bandwidth:
+            total = d.get("total_bytes") or d.get("total_bytes_estimate")
+            remaining = total - d.get("downloaded_bytes", 0) if total else None
+            rate = bandwidth.update(remaining)
+            if rate:
+                ydl.params["ratelimit"] = int(rate)
+
+        if file_callback and streamable and d["status"] == "downloading":
+            # Separate video/audio streams can't be played until merged
+            growing = d.get("tmpfilename") or d.get("filename")
+            if growing and growing not in streamed_files:
+                streamed_files.add(growing)
+                file_callback(Path(growing))
+
         if progress_callback and d["status"] == "downloading":
             total = d.get("total_bytes") or d.get("total_bytes_estimate", 0)
             downloaded = d.get("downloaded_bytes", 0)
@@ -107,14 +212,26 @@ def download_video(
         elif progress_callback and d["status"] == "finished":
             progress_callback("processing", 0)
 
+    # Time yt-dlp's own ffmpeg merge of separate video/audio streams
+    merge_started: list[float] = []
+
+    def postprocessor_hook(d):
+        if not stage_callback or d.get("postprocessor") != "Merger":
+            return
+        if d["status"] == "started":
+            merge_started.append(time.monotonic())
+        elif d["status"] == "finished" and merge_started:
+            stage_callback("merge", merge_started.pop(), time.monotonic())
+
     # Configure yt-dlp options
     ydl_opts = {
-        "format": get_format_selector(quality),
+        "format": get_format_selector(quality, progressive),
         "outtmpl": str(output_dir / "%(id)s.%(ext)s"),
         "merge_output_format": "mp4",
         # Prefer h264/aac for iPhone compatibility (avoid vp9/opus)
         "format_sort": ["vcodec:h264", "acodec:aac", "ext:mp4:m4a"],
         "progress_hooks": [progress_hook],
+        "postprocessor_hooks": [postprocessor_hook],
         "quiet": True,
         "no_warnings": True,
         # Prefer remux over re-encode
@@ -123,21 +240,19 @@ def download_video(
         },
     }
 
-    # Add cookies if available
-    cookies_file = get_cookies_file()
+    # Add cookies and proxy if available
+    cookies_file = get_cookies_file(identity)
     if cookies_file:
         ydl_opts["cookiefile"] = str(cookies_file)
+    if identity and identity.proxy:
+        ydl_opts["proxy"] = identity.proxy
+        logger.info(f"Using proxy of identity {identity.name}")
 
     # Use aria2c if available for faster downloads
     if check_aria2c_available():
         ydl_opts["external_downloader"] = "aria2c"
         ydl_opts["external_downloader_args"] = {
-            "aria2c": [
-                f"-x{settings.concurrent_fragments}",
-                f"-s{settings.concurrent_fragments}",
-                "-k1M",
-                "--file-allocation=none",
-            ]
+            "aria2c": _aria2c_args(settings.concurrent_fragments)
         }
         logger.info("Using aria2c for download")
     else:
@@ -146,23 +261,56 @@ def download_video(
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             # Extract info first to get video ID
-            info = ydl.extract_info(url, download=False)
+            with timed_stage("extract", stage_callback):
+                info = ydl.extract_info(url, download=False)
             if not info:
                 raise DownloadError(ErrorCode.UPSTREAM_FAILURE, "Could not extract video info")
 
             video_id = info.get("id", "video")
             video_title = info.get("title", "video")
 
+            # Partial files from an earlier attempt must match what we download now
+            check_resume_manifest(output_dir, video_id, info.get("requested_formats") or [info])
+
+            # aria2c writes segments out of order, so a file being tailed by
+            # a client must be fetched sequentially by the built-in downloader
+            streamable = bool(file_callback) and not info.get("requested_formats")
+            if streamable:
+                ydl.params.pop("external_downloader", None)
+
+            # Size the connection pool for the CDN host serving this video.
+            # aria2c splits plain HTTPS formats; yt-dlp's own concurrency
+            # covers fragmented (DASH/HLS) ones
+            formats = info.get("requested_formats") or [info]
+            concurrency = settings.concurrent_fragments
+            if fragment_tuner:
+                concurrency = fragment_tuner.start(formats[0].get("url"))
+            ydl.params["concurrent_fragment_downloads"] = concurrency
+            if ydl.params.get("external_downloader"):
+                ydl.params["external_downloader_args"] = {"aria2c": _aria2c_args(concurrency)}
+
+            # Start within our share of the node's bandwidth
+            if bandwidth:
+                total = sum(f.get("filesize") or f.get("filesize_approx") or 0 for f in formats)
+                rate = bandwidth.update(total or None, force=True)
+                if rate:
+                    ydl.params["ratelimit"] = int(rate)
+
             # Download the video
             logger.info(f"Downloading: {video_title} ({video_id})")
-            ydl.download([url])
+            download_started = time.monotonic()
+            with timed_stage("download", stage_callback):
+                ydl.download([url])
+            if fragment_tuner:
+                fragment_tuner.finish(sum(fetched.values()), time.monotonic() - download_started)
 
             # Find the output file
-            output_pattern = output_dir / f"{video_id}.*"
             output_files = list(output_dir.glob(f"{video_id}.*"))
 
             if not output_files:
-                raise DownloadError(ErrorCode.DOWNLOAD_FAILED, "Output file not found after download")
+                raise DownloadError(
+                    ErrorCode.DOWNLOAD_FAILED, "Output file not found after download"
+                )
 
             # Prefer mp4, otherwise take first file
             output_file = None
@@ -177,34 +325,35 @@ def download_video(
             sanitized_name = sanitize_filename(video_title)
             final_path = output_dir / f"{sanitized_name}.mp4"
 
-            # If not already mp4, remux with ffmpeg
-            if output_file.suffix.lower() != ".mp4":
-                logger.info(f"Remuxing {output_file} to mp4")
-                if progress_callback:
-                    progress_callback("processing", 50)
-
-                remux_cmd = [
-                    "ffmpeg",
-                    "-i", str(output_file),
-                    "-c", "copy",
-                    "-movflags", "+faststart",
-                    "-y",
-                    str(final_path),
-                ]
-                result = subprocess.run(
-                    remux_cmd,
-                    capture_output=True,
-                    text=True,
-                )
-                if result.returncode != 0:
-                    logger.error(f"ffmpeg remux failed: {result.stderr}")
-                    raise DownloadError(ErrorCode.MERGE_FAILED, "Failed to remux video")
-
-                # Clean up original file
-                output_file.unlink(missing_ok=True)
-            else:
-                # Just rename
-                output_file.rename(final_path)
+            with timed_stage("remux", stage_callback):
+                # If not already mp4, remux with ffmpeg
+                if output_file.suffix.lower() != ".mp4":
+                    logger.info(f"Remuxing {output_file} to mp4")
+                    if progress_callback:
+                        progress_callback("processing", 50)
+
+                    remux_cmd = [
+                        "ffmpeg",
+                        "-i", str(output_file),
+                        "-c", "copy",
+                        "-movflags", "+faststart",
+                        "-y",
+                        str(final_path),
+                    ]  # fmt: skip
+                    result = subprocess.run(
+                        remux_cmd,
+                        capture_output=True,
+                        text=True,
+                    )
+                    if result.returncode != 0:
+                        logger.error(f"ffmpeg remux failed: {result.stderr}")
+                        raise DownloadError(ErrorCode.MERGE_FAILED, "Failed to remux video")
+
+                    # Clean up original file
+                    output_file.unlink(missing_ok=True)
+                else:
+                    # Just rename
+                    output_file.rename(final_path)
 
             logger.info(f"Download complete: {final_path}")
             return final_path
@@ -212,10 +361,14 @@ def download_video(
     except yt_dlp.utils.DownloadError as e:
         logger.error(f"yt-dlp download error: {e}")
         if "unavailable" in str(e).lower() or "private" in str(e).lower():
-            raise DownloadError(ErrorCode.UPSTREAM_FAILURE, str(e)) from e
+            raise DownloadError(ErrorCode.VIDEO_UNAVAILABLE, str(e)) from e
         raise DownloadError(ErrorCode.DOWNLOAD_FAILED, str(e)) from e
+    except YTDLError:
+        # Ours already, including preemption and cancellation from the progress hooks
+        raise
     except Exception as e:
         logger.error(f"Unexpected download error: {e}")
-        if isinstance(e, DownloadError):
-            raise
         raise DownloadError(ErrorCode.DOWNLOAD_FAILED, str(e)) from e
+    finally:
+        if cookies_file:
+            cookies_file.unlink(missing_ok=True)
@@ -7,25 +7,41 @@ class ErrorCode(StrEnum):
     """Error codes returned by the API."""
 
     INVALID_URL = "INVALID_URL"
+    VIDEO_UNAVAILABLE = "VIDEO_UNAVAILABLE"
     UPSTREAM_FAILURE = "UPSTREAM_FAILURE"
     DOWNLOAD_FAILED = "DOWNLOAD_FAILED"
     MERGE_FAILED = "MERGE_FAILED"
+    TRANSCODE_FAILED = "TRANSCODE_FAILED"
     UPLOAD_FAILED = "UPLOAD_FAILED"
     UNAUTHORIZED = "UNAUTHORIZED"
     RATE_LIMITED = "RATE_LIMITED"
+    OVERLOADED = "OVERLOADED"
     JOB_NOT_FOUND = "JOB_NOT_FOUND"
+    STREAM_UNAVAILABLE = "STREAM_UNAVAILABLE"
+    LINK_EXPIRED = "LINK_EXPIRED"
+    NOT_DEGRADED = "NOT_DEGRADED"
+    WORKER_LOST = "WORKER_LOST"
+    PREEMPTED = "PREEMPTED"
     INTERNAL_ERROR = "INTERNAL_ERROR"
 
 
 ERROR_MESSAGES = {
     ErrorCode.INVALID_URL: "Invalid or unsupported URL. Only YouTube URLs are supported.",
+    ErrorCode.VIDEO_UNAVAILABLE: "This video is private, removed or otherwise unavailable.",
     ErrorCode.UPSTREAM_FAILURE: "YouTube is temporarily unavailable. Please try again later.",
     ErrorCode.DOWNLOAD_FAILED: "Failed to download the video. Please try again.",
     ErrorCode.MERGE_FAILED: "Failed to merge video and audio streams.",
+    ErrorCode.TRANSCODE_FAILED: "Failed to convert the video to an iPhone-compatible format.",
     ErrorCode.UPLOAD_FAILED: "Failed to upload the processed video.",
     ErrorCode.UNAUTHORIZED: "Invalid or missing API token.",
     ErrorCode.RATE_LIMITED: "Too many requests. Please slow down.",
+    ErrorCode.OVERLOADED: "Too busy to finish this job in time. Retry after the given delay.",
     ErrorCode.JOB_NOT_FOUND: "Job not found.",
+    ErrorCode.STREAM_UNAVAILABLE: "Stream is not available for this job yet.",
+    ErrorCode.LINK_EXPIRED: "This download link is invalid or has expired.",
+    ErrorCode.NOT_DEGRADED: "This job was not lowered below its requested quality.",
+    ErrorCode.WORKER_LOST: "The worker processing this job stopped unexpectedly.",
+    ErrorCode.PREEMPTED: "Background prefetch stopped to free a worker for requested jobs.",
     ErrorCode.INTERNAL_ERROR: "An internal error occurred.",
 }
 
@@ -58,3 +74,10 @@ class UploadError(YTDLError):
 
     def __init__(self, message: str | None = None):
         super().__init__(ErrorCode.UPLOAD_FAILED, message)
+
+
+class JobTimeoutError(YTDLError):
+    """Raised when a job runs past its deadline, like a worker RQ had to kill."""
+
+    def __init__(self, message: str | None = None):
+        super().__init__(ErrorCode.WORKER_LOST, message)
@@ -0,0 +1,235 @@
+"""MP4 fast-start post-processing (moov atom relocation)."""
+
+import errno
+import logging
+import os
+import struct
+import subprocess
+from collections.abc import Callable
+from pathlib import Path
+
+from ytdl.config import settings
+from ytdl.errors import DownloadError, ErrorCode
+
+logger = logging.getLogger(__name__)
+
+# Atoms we need to descend into to reach the chunk offset tables (stco/co64)
+CONTAINER_ATOMS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class FaststartError(Exception):
+    """Raised when the MP4 atom layout cannot be rewritten in place."""
+
+
+def _read_top_level_atoms(path: Path) -> list[tuple[bytes, int, int]]:
+    """
+    Read top-level atom headers without loading atom bodies.
+
+    Returns:
+        List of (atom_type, offset, size) tuples in file order
+    """
+    atoms = []
+    file_size = path.stat().st_size
+
+    with open(path, "rb") as f:
+        offset = 0
+        while offset < file_size:
+            f.seek(offset)
+            header = f.read(8)
+            if len(header) < 8:
+                break
+
+            size, atom_type = struct.unpack(">I4s", header)
+            if size == 1:
+                size = struct.unpack(">Q", f.read(8))[0]
+            elif size == 0:
+                size = file_size - offset
+
+            if size < 8:
+                raise FaststartError(f"Invalid atom size {size} at offset {offset}")
+
+            atoms.append((atom_type, offset, size))
+            offset += size
+
+    return atoms
+
+
+def _moov_after_mdat(atoms: list[tuple[bytes, int, int]]) -> bool:
+    """Check whether the moov atom sits after the first mdat atom."""
+    moov = next((a for a in atoms if a[0] == b"moov"), None)
+    mdat = next((a for a in atoms if a[0] == b"mdat"), None)
+    if moov is None or mdat is None:
+        return False
+    return moov[1] > mdat[1]
+
+
+def needs_faststart(path: Path) -> bool:
+    """Check whether an MP4 file needs its moov atom moved to the front."""
+    return _moov_after_mdat(_read_top_level_atoms(path))
+
+
+def _patch_chunk_offsets(
+    data: bytearray,
+    start: int,
+    end: int,
+    shift: Callable[[int], int],
+) -> None:
+    """Recursively rewrite stco/co64 entries inside data[start:end]."""
+    offset = start
+    while offset + 8 <= end:
+        size, atom_type = struct.unpack_from(">I4s", data, offset)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+
+        if size < header_size or offset + size > end:
+            raise FaststartError(f"Corrupt {atom_type!r} atom inside moov")
+
+        body = offset + header_size
+        if atom_type in CONTAINER_ATOMS:
+            _patch_chunk_offsets(data, body, offset + size, shift)
+        elif atom_type == b"stco":
+            # version/flags (4) + entry count (4) + 32-bit offsets
+            count = struct.unpack_from(">I", data, body + 4)[0]
+            for i in range(count):
+                pos = body + 8 + i * 4
+                new_offset = shift(struct.unpack_from(">I", data, pos)[0])
+                if new_offset > 0xFFFFFFFF:
+                    raise FaststartError("Chunk offset overflows stco, co64 required")
+                struct.pack_into(">I", data, pos, new_offset)
+        elif atom_type == b"co64":
+            count = struct.unpack_from(">I", data, body + 4)[0]
+            for i in range(count):
+                pos = body + 8 + i * 8
+                struct.pack_into(">Q", data, pos, shift(struct.unpack_from(">Q", data, pos)[0]))
+        elif atom_type == b"cmov":
+            raise FaststartError("Compressed moov atoms are not supported")
+
+        offset += size
+
+
+def _relocate_moov(
+    path: Path,
+    atoms: list[tuple[bytes, int, int]],
+    progress_callback: Callable[[str, int], None] | None = None,
+) -> None:
+    """Rewrite the file with moov placed before the first mdat, in a single pass."""
+    _, moov_offset, moov_size = next(a for a in atoms if a[0] == b"moov")
+    insert_at = next(a for a in atoms if a[0] == b"mdat")[1]
+
+    with open(path, "rb") as src:
+        src.seek(moov_offset)
+        moov = bytearray(src.read(moov_size))
+
+    # Everything between the insertion point and the old moov position moves
+    # forward by moov_size; data after the old moov keeps its offset.
+    def shift(chunk_offset: int) -> int:
+        if insert_at <= chunk_offset < moov_offset:
+            return chunk_offset + moov_size
+        return chunk_offset
+
+    header_size = 16 if struct.unpack_from(">I", moov)[0] == 1 else 8
+    _patch_chunk_offsets(moov, header_size, len(moov), shift)
+
+    tmp_path = path.with_name(f"{path.name}.faststart")
+    total = sum(size for atom_type, _, size in atoms if atom_type != b"moov")
+    copied = 0
+    last_pct = -1
+
+    try:
+        with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+            moov_written = False
+            for atom_type, offset, size in atoms:
+                if atom_type == b"moov":
+                    continue
+                if not moov_written and offset >= insert_at:
+                    dst.write(moov)
+                    moov_written = True
+
+                src.seek(offset)
+                remaining = size
+                while remaining > 0:
+                    chunk = src.read(min(COPY_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise FaststartError("Unexpected end of file while copying atoms")
+                    dst.write(chunk)
+                    remaining -= len(chunk)
+                    copied += len(chunk)
+
+                    pct = int(copied * 100 / total) if total else 100
+                    if progress_callback and pct != last_pct:
+                        progress_callback("processing", pct)
+                        last_pct = pct
+
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _fragment(path: Path) -> None:
+    """Remux to fragmented MP4 with ffmpeg (stream copy)."""
+    tmp_path = path.with_name(f"{path.name}.frag.mp4")
+    cmd = [
+        "ffmpeg",
+        "-i", str(path),
+        "-c", "copy",
+        "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+        "-y",
+        str(tmp_path),
+    ]  # fmt: skip
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        tmp_path.unlink(missing_ok=True)
+        logger.error(f"ffmpeg fragment failed: {result.stderr}")
+        raise DownloadError(ErrorCode.MERGE_FAILED, "Failed to fragment video")
+    os.replace(tmp_path, path)
+
+
+def ensure_faststart(
+    path: Path,
+    progress_callback: Callable[[str, int], None] | None = None,
+) -> Path:
+    """
+    Make sure an MP4 file can start playing before it is fully downloaded.
+
+    The moov atom is only relocated when it sits after the media data, so
+    files produced by `ffmpeg -movflags +faststart` pass through untouched.
+
+    Args:
+        path: MP4 file to check (rewritten in place if needed)
+        progress_callback: Optional callback(stage, percentage)
+
+    Returns:
+        Path to the (possibly rewritten) file
+
+    Raises:
+        OSError: If the filesystem fills up while rewriting (the file is left
+            as it was, so the caller can retry with more room)
+    """
+    if settings.mp4_fragmented:
+        logger.info(f"Fragmenting {path}")
+        _fragment(path)
+        if progress_callback:
+            progress_callback("processing", 100)
+        return path
+
+    try:
+        atoms = _read_top_level_atoms(path)
+        if not _moov_after_mdat(atoms):
+            logger.info(f"moov already at front: {path}")
+            return path
+
+        logger.info(f"Relocating moov atom to front: {path}")
+        _relocate_moov(path, atoms, progress_callback)
+    except (FaststartError, OSError, struct.error) as e:
+        if isinstance(e, OSError) and e.errno == errno.ENOSPC:
+            raise
+        # File is still playable, just not progressively
+        logger.warning(f"Skipping fast-start for {path}: {e}")
+
+    return path
@@ -0,0 +1,120 @@
+"""Adaptive download concurrency, remembered per CDN host.
+
+The right number of parallel connections depends on the node (a fat
+datacenter box versus a small container) and on the CDN edge serving the
+video, so a fixed CONCURRENT_FRAGMENTS is wrong somewhere. Each download
+measures its throughput and feeds a hill climber in Redis per worker node
+and host (fragments:{node}:{host}): most jobs use the best concurrency seen so far, some
+try one step up or down, and a step that beats the best by a clear margin
+becomes the new best. A step that does not reverses the search direction.
+"""
+
+import logging
+import random
+import re
+from urllib.parse import urlparse
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from ytdl.config import settings
+
+logger = logging.getLogger(__name__)
+
+EXPLORE_RATE = 0.25  # Share of jobs that try a neighbouring concurrency
+IMPROVEMENT = 0.05  # Relative throughput gain needed to move the best setting
+SMOOTHING = 0.3  # Weight of a new measurement at the best setting
+MIN_SAMPLE_BYTES = 5 * 1024 * 1024  # Smaller downloads are too noisy to learn from
+MIN_SAMPLE_SECONDS = 2.0
+STATE_TTL = 7 * 86400
+
+# googlevideo edges are rrN---sn-<cluster>.googlevideo.com; key on the cluster
+_EDGE_PREFIX = re.compile(r"^rr\d+---")
+
+
+def media_host(url: str | None) -> str | None:
+    """CDN host (or cluster) a media URL is served from."""
+    host = urlparse(url).hostname if url else None
+    return _EDGE_PREFIX.sub("", host) if host else None
+
+
+def _state_key(host: str) -> str:
+    return f"fragments:{settings.node_id}:{host}"
+
+
+def _clamp(concurrency: int) -> int:
+    return max(1, min(concurrency, settings.max_concurrent_fragments))
+
+
+class FragmentTuner:
+    """Pick a concurrency for one download and learn from its throughput."""
+
+    def __init__(self, redis: Redis):
+        self.redis = redis
+        self.host: str | None = None
+        self.concurrency = settings.concurrent_fragments
+
+    def start(self, media_url: str | None) -> int:
+        """Choose the concurrency for a download from media_url's host."""
+        self.host = media_host(media_url)
+        if not self.host:
+            return self.concurrency
+
+        try:
+            state = self.redis.hgetall(_state_key(self.host))
+        except RedisError as e:
+            logger.debug(f"Fragment tuner state unavailable: {e}")
+            return self.concurrency
+
+        if state:
+            best = int(state["best"])
+            self.concurrency = best
+            if random.random() < EXPLORE_RATE:
+                step = int(state["direction"]) * max(1, best // 4)
+                # At a bound, explore the only way left
+                self.concurrency = _clamp(best + step)
+                if self.concurrency == best:
+                    self.concurrency = _clamp(best - step)
+
+        logger.info(f"Using {self.concurrency} concurrent connections for {self.host}")
+        return self.concurrency
+
+    def finish(self, downloaded_bytes: int, seconds: float) -> None:
+        """Record the throughput achieved at the chosen concurrency."""
+        if not self.host or downloaded_bytes < MIN_SAMPLE_BYTES or seconds < MIN_SAMPLE_SECONDS:
+            return
+
+        throughput = downloaded_bytes / seconds
+        logger.info(
+            f"{self.host}: {throughput / 1e6:.1f} MB/s at {self.concurrency} connections "
+            f"({throughput / self.concurrency / 1e6:.2f} MB/s per connection)"
+        )
+
+        key = _state_key(self.host)
+        try:
+            state = self.redis.hgetall(key)
+            if not state:
+                updates = {"best": self.concurrency, "throughput": throughput, "direction": 1}
+            else:
+                best = int(state["best"])
+                best_throughput = float(state["throughput"])
+                if self.concurrency == best:
+                    updates = {
+                        "throughput": (1 - SMOOTHING) * best_throughput + SMOOTHING * throughput
+                    }
+                elif throughput > best_throughput * (1 + IMPROVEMENT):
+                    # Keep moving the same way from the new best
+                    updates = {
+                        "best": self.concurrency,
+                        "throughput": throughput,
+                        "direction": 1 if self.concurrency > best else -1,
+                    }
+                else:
+                    # No gain that way; try the other side next
+                    updates = {"direction": -1 if self.concurrency > best else 1}
+            pipe = self.redis.pipeline()
+            pipe.hset(key, mapping=updates)
+            pipe.expire(key, STATE_TTL)
+            pipe.execute()
+        except RedisError as e:
+            logger.debug(f"Failed to record fragment throughput: {e}")
@@ -0,0 +1,184 @@
+"""Pool of YouTube identities (cookie jar + egress proxy) with health scoring.
+
+Each job borrows one identity for its yt-dlp download. Per-identity health
+lives in Redis (identity:{name}) so every worker sees the same picture:
+an exponentially weighted success score, extract latency, totals per
+outcome and a cooldown. Identities are picked at random, weighted by score
+and spread by how many jobs currently hold them. An identity that gets
+throttled or bot-checked is cooled down, for longer each time in a row.
+"""
+
+import logging
+import random
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from redis import Redis
+from redis.client import Pipeline
+
+from ytdl.cobalt import is_bot_detection
+from ytdl.config import Identity, settings
+from ytdl.errors import ErrorCode, YTDLError
+from ytdl.jobs import JOB_TIMEOUT
+from ytdl.metrics import inc
+
+logger = logging.getLogger(__name__)
+
+SCORE_ALPHA = 0.2  # Weight of the newest outcome in the success score
+MIN_WEIGHT = 0.05  # Keep poorly scoring identities in rotation so they can recover
+
+# Failures that say nothing about the identity used
+NEUTRAL_ERRORS = frozenset({ErrorCode.INVALID_URL, ErrorCode.VIDEO_UNAVAILABLE})
+
+
+def identity_pool() -> list[Identity]:
+    """Configured identities, or the single legacy cookie jar if no pool is set."""
+    if settings.identities:
+        return settings.identities
+    if settings.youtube_cookies_base64:
+        return [Identity(name="default", cookies_base64=settings.youtube_cookies_base64)]
+    return []
+
+
+def stats_key(name: str) -> str:
+    """Redis hash holding an identity's health."""
+    return f"identity:{{{name}}}"
+
+
+def leases_key(name: str) -> str:
+    """Redis sorted set of jobs holding an identity, scored by lease expiry."""
+    return f"identity:{{{name}}}:leases"
+
+
+def _weight(stats: dict, in_flight: int) -> float:
+    """Selection weight: success score, discounted by load and extract latency."""
+    score = max(float(stats.get("score", 1.0)), MIN_WEIGHT)
+    latency = float(stats.get("latency", 0.0))
+    return score / (1 + in_flight) / (1 + latency / 10)
+
+
+def acquire_identity(redis: Redis, job_id: str) -> Identity | None:
+    """
+    Pick an identity for a job and lease it.
+
+    Identities in cooldown are skipped; if every identity is cooling down,
+    the one that recovers first is used.
+
+    Returns:
+        The leased identity, or None if no pool is configured
+    """
+    pool = identity_pool()
+    if not pool:
+        return None
+
+    now = time.time()
+    pipe = redis.pipeline()
+    for identity in pool:
+        pipe.hgetall(stats_key(identity.name))
+        pipe.zcount(leases_key(identity.name), now, "+inf")
+    results = pipe.execute()
+
+    candidates = []
+    for identity, stats, in_flight in zip(pool, results[::2], results[1::2], strict=True):
+        cooldown_until = float(stats.get("cooldown_until", 0))
+        candidates.append((identity, cooldown_until, _weight(stats, in_flight)))
+
+    available = [c for c in candidates if c[1] <= now]
+    if available:
+        identity = random.choices([c[0] for c in available], weights=[c[2] for c in available])[0]
+    else:
+        identity = min(candidates, key=lambda c: c[1])[0]
+        logger.warning(f"All identities are cooling down, using {identity.name}")
+
+    redis.zadd(leases_key(identity.name), {job_id: now + JOB_TIMEOUT})
+    return identity
+
+
+def release_identity(
+    redis: Redis,
+    identity: Identity,
+    job_id: str,
+    outcome: str,
+    latency: float | None = None,
+) -> None:
+    """
+    Return a leased identity and record how the job went.
+
+    Args:
+        redis: Redis connection
+        identity: The leased identity
+        job_id: The job that held it
+        outcome: "ok", "throttled" or "failed"
+        latency: Seconds the extract stage took, if known
+    """
+    key = stats_key(identity.name)
+
+    def record(pipe: Pipeline) -> None:
+        stats = pipe.hgetall(key)
+        score = float(stats.get("score", 1.0))
+        score = (1 - SCORE_ALPHA) * score + SCORE_ALPHA * (1.0 if outcome == "ok" else 0.0)
+        updates: dict[str, float] = {"score": round(score, 4)}
+
+        if latency is not None:
+            previous = float(stats.get("latency", latency))
+            updates["latency"] = round((1 - SCORE_ALPHA) * previous + SCORE_ALPHA * latency, 3)
+
+        streak = int(stats.get("throttle_streak", 0))
+        if outcome == "throttled":
+            streak += 1
+            cooldown = min(
+                settings.identity_cooldown * 2 ** (streak - 1), settings.identity_max_cooldown
+            )
+            updates["cooldown_until"] = time.time() + cooldown
+            logger.warning(f"Identity {identity.name} throttled, cooling down for {cooldown}s")
+        elif outcome == "ok":
+            streak = 0
+        updates["throttle_streak"] = streak
+
+        pipe.multi()
+        pipe.hset(key, mapping=updates)
+        pipe.hincrby(key, outcome, 1)
+        pipe.zrem(leases_key(identity.name), job_id)
+
+    redis.transaction(record, key)
+    inc(redis, "ytdl_identity_outcomes_total", identity=identity.name, outcome=outcome)
+
+
+def classify_outcome(error: Exception | None) -> str:
+    """Map a download result to an identity outcome."""
+    if error is None:
+        return "ok"
+    if isinstance(error, YTDLError) and error.code in NEUTRAL_ERRORS:
+        return "ok"
+    message = str(error).lower()
+    if is_bot_detection(error) or "429" in message or "too many requests" in message:
+        return "throttled"
+    return "failed"
+
+
+@contextmanager
+def leased_identity(
+    redis: Redis,
+    job_id: str,
+    latency: dict[str, float],
+) -> Iterator[Identity | None]:
+    """
+    Lease an identity for the block and record its outcome from any exception.
+
+    Args:
+        redis: Redis connection
+        job_id: The job borrowing the identity
+        latency: Stage durations filled in during the block; "extract" is recorded
+    """
+    identity = acquire_identity(redis, job_id)
+    if identity is None:
+        yield None
+        return
+
+    try:
+        yield identity
+    except Exception as e:
+        release_identity(redis, identity, job_id, classify_outcome(e), latency.get("extract"))
+        raise
+    release_identity(redis, identity, job_id, "ok", latency.get("extract"))
@@ -0,0 +1,219 @@
+"""Job record storage in Redis, shared by the API and workers.
+
+Besides the record itself (job:{id}), every write maintains sorted-set
+indexes of job IDs by creation time, per tenant (jobs:index:{tenant}) and
+per tenant and status (jobs:index:{tenant}:{status}), in the same
+transaction as the record. Entries older than the record TTL are trimmed
+on write, and an index nobody writes to expires with its last job.
+
+A job created with a callback_url is also added to webhooks:pending when
+it reaches done or error, in that same transaction, for the API's webhook
+dispatcher to deliver.
+
+On a Redis Cluster, a transaction can only cover one slot: the record and
+its version key share the job's hash tag and stay atomic, while index and
+webhook writes follow in a second round trip. Listing by status therefore
+re-checks each record's status rather than trusting the index alone.
+"""
+
+import json
+import time
+from datetime import datetime
+
+from redis import Redis
+from redis.client import Pipeline
+from rq import Queue
+
+from ytdl.connections import is_cluster, mget, queue_connections
+from ytdl.metrics import inc
+from ytdl.models import JobStatus
+
+JOB_TTL = 86400  # 24 hours
+JOB_TIMEOUT = 600  # 10 minutes
+
+# RQ queues; workers list them in priority order, reserved workers only take "fast"
+FAST_LANE = "fast"
+DEFAULT_LANE = "default"
+LANES = (FAST_LANE, DEFAULT_LANE)
+PREFETCH_LANE = "prefetch"  # Background prefetches (ytdl.prefetch); workers poll it last
+
+DEFAULT_TENANT = "default"
+
+WEBHOOK_KEY = "webhooks:pending"  # Sorted set of job IDs to notify, by when due
+TERMINAL_STATUSES = (JobStatus.DONE.value, JobStatus.ERROR.value)
+
+
+def job_key(job_id: str) -> str:
+    """Redis key holding the job record (JSON)."""
+    return f"job:{{{job_id}}}"
+
+
+def version_key(job_id: str) -> str:
+    """Redis key holding just the job record's version, for cheap ETag checks."""
+    return f"job:{{{job_id}}}:version"
+
+
+def get_job_data(redis: Redis, job_id: str) -> dict | None:
+    """Get job data from Redis."""
+    data = redis.get(job_key(job_id))
+    if data:
+        return json.loads(data)
+    return None
+
+
+def get_job_version(redis: Redis, job_id: str) -> int | None:
+    """Get the job's version without loading the record."""
+    version = redis.get(version_key(job_id))
+    return int(version) if version else None
+
+
+def index_key(tenant: str, status: str | None = None) -> str:
+    """Redis sorted set of a tenant's job IDs (optionally one status), by creation time."""
+    if status is None:
+        return f"jobs:index:{{{tenant}}}"
+    return f"jobs:index:{{{tenant}}}:{status}"
+
+
+def _created_score(job_data: dict) -> float:
+    created_at = job_data.get("created_at")
+    return datetime.fromisoformat(created_at).timestamp() if created_at else time.time()
+
+
+def _write_record(pipe: Pipeline, job_id: str, job_data: dict) -> None:
+    """Queue writes for the record and its version key (same TTL and slot)."""
+    pipe.setex(job_key(job_id), JOB_TTL, json.dumps(job_data, default=str))
+    pipe.setex(version_key(job_id), JOB_TTL, job_data["version"])
+
+
+def _write_indexes(
+    pipe: Pipeline, job_id: str, job_data: dict, previous_status: str | None = None
+) -> None:
+    """Queue writes for the index entries and webhook that follow a status change."""
+    status = job_data.get("status")
+    if status == previous_status:
+        return
+    tenant = job_data.get("tenant", DEFAULT_TENANT)
+    if previous_status is not None:
+        pipe.zrem(index_key(tenant, previous_status), job_id)
+    score = _created_score(job_data)
+    cutoff = time.time() - JOB_TTL
+    for key in (index_key(tenant), index_key(tenant, status)):
+        pipe.zadd(key, {job_id: score})
+        pipe.zremrangebyscore(key, "-inf", cutoff)
+        pipe.expire(key, JOB_TTL)
+
+    if status in TERMINAL_STATUSES and job_data.get("callback_url"):
+        pipe.zadd(WEBHOOK_KEY, {job_id: time.time()})
+
+
+def set_job_data(redis: Redis, job_id: str, data: dict) -> None:
+    """Create a job record (version 1) with 24h TTL."""
+    data["version"] = 1
+    pipe = redis.pipeline()
+    _write_record(pipe, job_id, data)
+    _write_indexes(pipe, job_id, data)
+    pipe.execute()
+
+
+def update_job(redis: Redis, job_id: str, **updates) -> dict | None:
+    """
+    Update job data in Redis, bumping its version.
+
+    The read-modify-write runs in a WATCH/MULTI transaction so concurrent
+    updates (e.g. progress hooks and status changes) are never lost and the
+    version always matches the stored record.
+
+    Returns:
+        The updated job data, or None if the job does not exist
+    """
+    key = job_key(job_id)
+    cluster = is_cluster(redis)
+
+    def apply(pipe: Pipeline) -> tuple[dict, str | None] | None:
+        data = pipe.get(key)
+        if not data:
+            return None
+        job_data = json.loads(data)
+        previous_status = job_data.get("status")
+        job_data.update(updates)
+        job_data["version"] = job_data.get("version", 0) + 1
+        pipe.multi()
+        _write_record(pipe, job_id, job_data)
+        if not cluster:
+            _write_indexes(pipe, job_id, job_data, previous_status)
+        return job_data, previous_status
+
+    result = redis.transaction(apply, key, value_from_callable=True)
+    if result is None:
+        return None
+    job_data, previous_status = result
+    if cluster:
+        # Index and webhook keys hash to other slots than the record
+        pipe = redis.pipeline()
+        _write_indexes(pipe, job_id, job_data, previous_status)
+        pipe.execute()
+    if "status" in updates:
+        inc(redis, "ytdl_jobs_total", status=updates["status"])
+    return job_data
+
+
+def list_jobs(
+    redis: Redis,
+    tenant: str,
+    status: str | None = None,
+    since: float | None = None,
+    cursor: str | None = None,
+    limit: int = 50,
+) -> tuple[list[dict], str | None]:
+    """
+    List a tenant's jobs, newest first, reading only the requested page.
+
+    Jobs created in the same instant are ordered by job ID, so the cursor
+    carries both and no job is skipped or repeated between pages.
+
+    Args:
+        redis: Redis connection
+        tenant: Tenant whose jobs to list
+        status: Only jobs currently in this status
+        since: Only jobs created at or after this Unix time
+        cursor: "<created_at>:<job_id>" of the last job on the previous page
+        limit: Page size
+
+    Returns:
+        Tuple of (job records, cursor for the next page or None)
+    """
+    key = index_key(tenant, status)
+    newest, offset = "+inf", 0
+    if cursor is not None:
+        score, _, after = cursor.partition(":")
+        newest = float(score)
+        # Same-score entries come in reverse job ID order; skip those already listed
+        offset = sum(1 for job_id in redis.zrangebyscore(key, newest, newest) if job_id >= after)
+    entries = redis.zrevrangebyscore(
+        key,
+        newest,
+        since if since is not None else "-inf",
+        start=offset,
+        num=limit + 1,
+        withscores=True,
+    )
+    page, more = entries[:limit], len(entries) > limit
+
+    records = mget(redis, [job_key(job_id) for job_id, _ in page]) if page else []
+    # Records can expire slightly before their index entry is trimmed, and on
+    # a cluster a status index can briefly lag the record
+    jobs = [json.loads(record) for record in records if record]
+    if status is not None:
+        jobs = [job for job in jobs if job.get("status") == status]
+    next_cursor = f"{page[-1][1]!r}:{page[-1][0]}" if more else None
+    return jobs, next_cursor
+
+
+def enqueue_job(job_id: str, lane: str = DEFAULT_LANE, shard: int = 0) -> None:
+    """Put a job on a lane's RQ queue, on one of the queue shards, for a worker to pick up."""
+    queue = Queue(lane, connection=queue_connections()[shard])
+    queue.enqueue(
+        "ytdl.worker.process_job",
+        job_id,
+        job_timeout=JOB_TIMEOUT,
+    )
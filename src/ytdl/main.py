@@ -1,21 +1,47 @@
 """FastAPI application entry point."""
 
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager, suppress
 from pathlib import Path
 
 from fastapi import FastAPI, Request, status
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 
 from ytdl.api import router
 from ytdl.config import StorageMode, settings
+from ytdl.connections import get_redis
 from ytdl.errors import ERROR_MESSAGES, ErrorCode
+from ytdl.metrics import CONTENT_TYPE, render
+from ytdl.migrations import migrate_keys
 from ytdl.models import ErrorResponse
+from ytdl.reaper import run_reaper
+from ytdl.webhooks import run_dispatcher
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Run the stuck-job reaper and webhook dispatcher alongside the API."""
+    await asyncio.to_thread(migrate_keys, get_redis())
+    tasks = [
+        asyncio.create_task(run_reaper(get_redis())),
+        asyncio.create_task(run_dispatcher(get_redis())),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        with suppress(asyncio.CancelledError):
+            await task
+
 
 app = FastAPI(
     title="YouTube Downloader API",
     description="Backend API for downloading YouTube videos to iPhone via Shortcuts",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 
@@ -54,6 +80,12 @@ async def health_check() -> dict:
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """Prometheus metrics endpoint."""
+    return Response(content=render(get_redis()), media_type=CONTENT_TYPE)
+
+
 app.include_router(router)
 
 # Mount static files for local storage mode
@@ -0,0 +1,267 @@
+"""Prometheus metrics for the API and workers.
+
+RQ forks a fresh process for every job, so in-process counters would be lost
+as soon as the job finishes. Samples are aggregated in Redis hashes instead
+(one pipelined round trip per update) and rendered in the Prometheus text
+format at scrape time by the API's /metrics endpoint or the standalone
+exporter (python -m ytdl.metrics).
+"""
+
+import argparse
+import logging
+import re
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from ytdl.connections import get_redis, queue_connections
+
+logger = logging.getLogger(__name__)
+
+COUNTERS_KEY = "metrics:counters"
+GAUGES_KEY = "metrics:gauges"
+HISTOGRAMS_KEY = "metrics:histograms"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DURATION_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+THROUGHPUT_BUCKETS = (1e5, 5e5, 1e6, 5e6, 1e7, 2.5e7, 5e7, 1e8)
+
+# name -> (type, help, histogram buckets)
+METRICS: dict[str, tuple[str, str, tuple[float, ...]]] = {
+    "ytdl_jobs_total": ("counter", "Jobs that entered each status", ()),
+    "ytdl_stage_duration_seconds": (
+        "histogram",
+        "Time spent in each pipeline stage",
+        DURATION_BUCKETS,
+    ),
+    "ytdl_download_bytes_total": ("counter", "Bytes downloaded per backend", ()),
+    "ytdl_download_throughput_bytes_per_second": (
+        "histogram",
+        "Per-job download throughput per backend",
+        THROUGHPUT_BUCKETS,
+    ),
+    "ytdl_cobalt_fallback_checks_total": (
+        "counter",
+        "yt-dlp failures checked for Cobalt fallback, by decision",
+        (),
+    ),
+    "ytdl_rate_limited_total": ("counter", "Job creations rejected by the rate limiter", ()),
+    "ytdl_admission_rejected_total": (
+        "counter",
+        "Job creations rejected because the backlog is too long to start them in time",
+        (),
+    ),
+    "ytdl_long_poll_waiters": ("gauge", "Requests currently long-polling for a job", ()),
+    "ytdl_download_resumes_total": ("counter", "Jobs that resumed a partial download", ()),
+    "ytdl_memory_staging_total": (
+        "counter",
+        "Jobs staged in RAM, and those that fell back to disk",
+        (),
+    ),
+    "ytdl_identity_outcomes_total": ("counter", "Downloads per identity, by outcome", ()),
+    "ytdl_job_retries_total": ("counter", "Failed attempts scheduled for retry, by error", ()),
+    "ytdl_cache_requests_total": ("counter", "Object cache lookups, by hit or miss", ()),
+    "ytdl_cache_evictions_total": ("counter", "Objects evicted from the cache", ()),
+    "ytdl_cache_evicted_bytes_total": ("counter", "Bytes evicted from the cache", ()),
+    "ytdl_webhooks_total": ("counter", "Webhook delivery attempts, by result", ()),
+    "ytdl_prefetch_total": (
+        "counter",
+        "Prefetch jobs started, stored, preempted or failed, and requests served from them",
+        (),
+    ),
+    "ytdl_jobs_reaped_total": (
+        "counter",
+        "Running jobs whose worker stopped heartbeating, by action",
+        (),
+    ),
+    "ytdl_quality_degraded_total": (
+        "counter",
+        "Job attempts downloaded below the requested quality under load",
+        (),
+    ),
+}
+
+# Stage timing callback: (stage, started, ended) using time.monotonic()
+StageCallback = Callable[[str, float, float], None]
+
+_LE_PATTERN = re.compile(r'le="([^"]+)"')
+
+
+def _format_labels(labels: dict[str, str], le: float | str | None = None) -> str:
+    """Format labels as a Prometheus label set (histogram bound last)."""
+    parts = []
+    for key in sorted(labels):
+        value = str(labels[key]).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    if le is not None:
+        parts.append(f'le="{le}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def inc(redis: Redis, name: str, value: float = 1, **labels: str) -> None:
+    """Increment a counter."""
+    try:
+        redis.hincrbyfloat(COUNTERS_KEY, f"{name}{_format_labels(labels)}", value)
+    except RedisError as e:
+        logger.debug(f"Failed to record {name}: {e}")
+
+
+def gauge_add(redis: Redis, name: str, value: int, **labels: str) -> None:
+    """Add to (or subtract from) a gauge."""
+    try:
+        redis.hincrby(GAUGES_KEY, f"{name}{_format_labels(labels)}", value)
+    except RedisError as e:
+        logger.debug(f"Failed to record {name}: {e}")
+
+
+def observe(redis: Redis, name: str, value: float, **labels: str) -> None:
+    """Record a histogram observation."""
+    buckets = METRICS[name][2]
+    pipe = redis.pipeline(transaction=False)
+    for bound in buckets:
+        if value <= bound:
+            pipe.hincrby(HISTOGRAMS_KEY, f"{name}_bucket{_format_labels(labels, bound)}", 1)
+    pipe.hincrby(HISTOGRAMS_KEY, f"{name}_bucket{_format_labels(labels, '+Inf')}", 1)
+    pipe.hincrbyfloat(HISTOGRAMS_KEY, f"{name}_sum{_format_labels(labels)}", value)
+    pipe.hincrby(HISTOGRAMS_KEY, f"{name}_count{_format_labels(labels)}", 1)
+    try:
+        pipe.execute()
+    except RedisError as e:
+        logger.debug(f"Failed to record {name}: {e}")
+
+
+@contextmanager
+def timed_stage(stage: str, stage_callback: StageCallback | None) -> Iterator[None]:
+    """Report the duration of a block to stage_callback if it completes."""
+    started = time.monotonic()
+    yield
+    if stage_callback:
+        stage_callback(stage, started, time.monotonic())
+
+
+def _bucket_sort_key(field: str) -> tuple[str, float]:
+    """Sort histogram samples by label set, then by bucket bound."""
+    match = _LE_PATTERN.search(field)
+    if not match:
+        return field, 0.0
+    return _LE_PATTERN.sub("", field), float(match.group(1))
+
+
+def _queue_samples() -> list[str]:
+    """Collect queue depth and RQ registry sizes at scrape time."""
+    from rq import Queue
+    from rq.registry import (
+        DeferredJobRegistry,
+        FailedJobRegistry,
+        FinishedJobRegistry,
+        ScheduledJobRegistry,
+        StartedJobRegistry,
+    )
+
+    from ytdl.jobs import LANES, PREFETCH_LANE
+
+    shards = [
+        (shard, Queue(lane, connection=connection))
+        for shard, connection in enumerate(queue_connections())
+        for lane in [*LANES, PREFETCH_LANE]
+    ]
+    registries = {
+        "started": StartedJobRegistry,
+        "finished": FinishedJobRegistry,
+        "failed": FailedJobRegistry,
+        "deferred": DeferredJobRegistry,
+        "scheduled": ScheduledJobRegistry,
+    }
+
+    lines = [
+        "# HELP ytdl_queue_depth Jobs waiting in each RQ queue, per queue shard",
+        "# TYPE ytdl_queue_depth gauge",
+    ]
+    for shard, queue in shards:
+        labels = _format_labels({"queue": queue.name, "shard": str(shard)})
+        lines.append(f"ytdl_queue_depth{labels} {queue.count}")
+    lines += [
+        "# HELP ytdl_rq_jobs Jobs in each RQ registry",
+        "# TYPE ytdl_rq_jobs gauge",
+    ]
+    for state, registry_class in registries.items():
+        count = sum(registry_class(queue=queue).count for _, queue in shards)
+        lines.append(f"ytdl_rq_jobs{_format_labels({'state': state})} {count}")
+    return lines
+
+
+def render(redis: Redis) -> str:
+    """Render all metrics in the Prometheus text exposition format."""
+    pipe = redis.pipeline(transaction=False)
+    pipe.hgetall(COUNTERS_KEY)
+    pipe.hgetall(GAUGES_KEY)
+    pipe.hgetall(HISTOGRAMS_KEY)
+    counters, gauges, histograms = pipe.execute()
+    stored = {"counter": counters, "gauge": gauges, "histogram": histograms}
+
+    lines = []
+    for name, (metric_type, help_text, _) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+        if metric_type == "histogram":
+            prefixes = (f"{name}_bucket", f"{name}_sum", f"{name}_count")
+            fields = [f for f in histograms if f.startswith(prefixes)]
+            for field in sorted(fields, key=_bucket_sort_key):
+                lines.append(f"{field} {histograms[field]}")
+        else:
+            values = stored[metric_type]
+            for field in sorted(f for f in values if f == name or f.startswith(f"{name}{{")):
+                lines.append(f"{field} {values[field]}")
+
+    try:
+        lines.extend(_queue_samples())
+    except RedisError as e:
+        logger.warning(f"Failed to collect queue metrics: {e}")
+
+    from ytdl import cache
+
+    if cache.enabled():
+        lines += [
+            "# HELP ytdl_cache_bytes Bytes held in this node's object cache",
+            "# TYPE ytdl_cache_bytes gauge",
+            f"ytdl_cache_bytes {cache.cached_bytes()}",
+        ]
+
+    return "\n".join(lines) + "\n"
+
+
+def serve(port: int) -> None:
+    """Serve /metrics over HTTP for Prometheus to scrape workers directly."""
+    redis = get_redis()
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = render(redis).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    logger.info(f"Serving metrics on :{port}/metrics")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Prometheus exporter for ytdl workers")
+    parser.add_argument("--port", type=int, default=9100)
+    serve(parser.parse_args().port)
@@ -0,0 +1,80 @@
+"""One-shot migration of the Redis key layout.
+
+Redis Cluster support put hash tags in the keys that are written together:
+job:<id> became job:{<id>}, and likewise the job's version key, the tenant
+indexes and queues, and each identity's stats and leases. Releases before
+that only ran on a standalone Redis, so migrate_keys() renames whatever an
+older release left there. Jobs in flight during an upgrade keep their
+records, versions and queue places.
+
+The API and the workers run it when they start. The first one to get the
+lock migrates and sets a marker key; every later start reads the marker and
+returns.
+"""
+
+import logging
+import re
+
+from redis import Redis
+
+from ytdl.connections import is_cluster
+from ytdl.models import JobStatus
+
+logger = logging.getLogger(__name__)
+
+MARKER_KEY = "migrations:hash_tags"  # Set once the old key layout is gone
+LOCK_KEY = "migrations:lock"
+LOCK_TTL = 300
+
+_STATUSES = "|".join(status.value for status in JobStatus)
+# Old key -> (prefix, name, suffix); the new key is prefix:{name}suffix
+OLD_KEYS = {
+    "job:*": re.compile(r"^(job):([^{}:]+)((?::version)?)$"),
+    "jobs:index:*": re.compile(rf"^(jobs:index):([^{{}}:]+)((?::(?:{_STATUSES}))?)$"),
+    "queue:*": re.compile(r"^(queue):([^{}:]+)()$"),
+    "identity:*": re.compile(r"^(identity):([^{}:]+)((?::leases)?)$"),
+}
+
+
+def _move(redis: Redis, old: str, new: str) -> None:
+    """Rename a key, merging sorted sets the new release has already written to."""
+    if redis.renamenx(old, new):
+        return
+    if redis.type(old) == "zset":
+        ttl = redis.pttl(new)
+        redis.zunionstore(new, [new, old], aggregate="MIN")
+        if ttl > 0:
+            redis.pexpire(new, ttl)
+    # Otherwise the record written by the new release wins
+    redis.delete(old)
+
+
+def migrate_keys(redis: Redis) -> int:
+    """
+    Rename keys from the layout before hash tags, once per Redis.
+
+    Returns:
+        Number of keys migrated
+    """
+    if is_cluster(redis) or redis.exists(MARKER_KEY):
+        return 0
+    if not redis.set(LOCK_KEY, 1, nx=True, ex=LOCK_TTL):
+        # Another process is migrating
+        return 0
+
+    moved = 0
+    try:
+        for match, pattern in OLD_KEYS.items():
+            for key in redis.scan_iter(match=match, count=1000):
+                old = pattern.match(key)
+                if old:
+                    prefix, name, suffix = old.groups()
+                    _move(redis, key, f"{prefix}:{{{name}}}{suffix}")
+                    moved += 1
+        redis.set(MARKER_KEY, 1)
+    finally:
+        redis.delete(LOCK_KEY)
+
+    if moved:
+        logger.info(f"Migrated {moved} Redis keys to the hash-tagged layout")
+    return moved
@@ -1,10 +1,12 @@
 """Pydantic models for API requests and responses."""
 
+import ipaddress
 from datetime import datetime
 from enum import StrEnum
 from typing import Literal
+from urllib.parse import urlsplit
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 
 from ytdl.errors import ErrorCode
 
@@ -35,6 +37,14 @@ class ProgressStage(StrEnum):
     UPLOADING = "uploading"
 
 
+def is_public_address(address: str) -> bool:
+    """Whether an IP address is publicly routable (not loopback, private, link-local, ...)."""
+    ip = ipaddress.ip_address(address)
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
 # Request models
 
 
@@ -45,6 +55,18 @@ class CreateJobRequest(BaseModel):
     quality: Quality = Field(default=Quality.Q720, description="Video quality")
     wait: bool = Field(default=False, description="Wait for job completion")
     timeout: int = Field(default=300, ge=1, le=600, description="Max wait time in seconds")
+    stream: bool = Field(
+        default=False,
+        description="Expose stream_url while downloading (prefers single-file formats)",
+    )
+    callback_url: str | None = Field(
+        default=None,
+        description="URL to POST the final job status to when the job is done or fails",
+    )
+    min_quality: Quality | None = Field(
+        default=None,
+        description="Lowest quality acceptable when busy; quality becomes a preference",
+    )
 
     @field_validator("url")
     @classmethod
@@ -64,6 +86,44 @@ class CreateJobRequest(BaseModel):
             raise ValueError("URL must start with http:// or https://")
         return v
 
+    @field_validator("callback_url")
+    @classmethod
+    def validate_callback_url(cls, v: str | None) -> str | None:
+        """
+        Validate that the callback URL is an absolute HTTP(S) URL on a public host.
+
+        Host names are resolved and checked again when the webhook is delivered.
+        """
+        if v is None:
+            return v
+        v = v.strip()
+        if not v.startswith(("http://", "https://")):
+            raise ValueError("callback_url must start with http:// or https://")
+        try:
+            host = urlsplit(v).hostname
+        except ValueError:
+            host = None
+        if not host:
+            raise ValueError("callback_url must include a host")
+        host = host.rstrip(".")
+        if host == "localhost" or host.endswith(".localhost"):
+            raise ValueError("callback_url must point to a public host")
+        try:
+            ipaddress.ip_address(host)
+        except ValueError:
+            return v
+        if not is_public_address(host):
+            raise ValueError("callback_url must point to a public host")
+        return v
+
+    @model_validator(mode="after")
+    def validate_min_quality(self) -> "CreateJobRequest":
+        """Validate that min_quality is not above quality."""
+        tiers = list(Quality)
+        if self.min_quality and tiers.index(self.min_quality) > tiers.index(self.quality):
+            raise ValueError("min_quality must not be higher than quality")
+        return self
+
 
 # Response models
 
@@ -79,7 +139,26 @@ class CreateJobResponse(BaseModel):
     """Response for job creation."""
 
     job_id: str
-    status: Literal[JobStatus.QUEUED] = JobStatus.QUEUED
+    status: Literal[JobStatus.QUEUED, JobStatus.DONE] = JobStatus.QUEUED  # Done if prefetched
+
+
+class PrefetchRequest(BaseModel):
+    """Request body for queueing a video to download ahead of demand."""
+
+    url: str = Field(..., description="YouTube video URL")
+    quality: Quality = Field(default=Quality.Q720, description="Video quality")
+
+    @field_validator("url")
+    @classmethod
+    def validate_youtube_url(cls, v: str) -> str:
+        """Validate that the URL is a YouTube URL."""
+        return CreateJobRequest.validate_youtube_url(v)
+
+
+class PrefetchResponse(BaseModel):
+    """Response for a prefetch request."""
+
+    status: Literal["queued", "stored"]  # Stored: already prefetched, jobs are served from it
 
 
 class JobStatusResponse(BaseModel):
@@ -87,12 +166,44 @@ class JobStatusResponse(BaseModel):
 
     job_id: str
     status: JobStatus
+    created_at: datetime | None = None
     progress: JobProgress | None = None
+    stream_url: str | None = None
     download_url: str | None = None
     expires_at: datetime | None = None
     filename: str | None = None
+    quality: Quality | None = None  # Quality being fetched or delivered
+    requested_quality: Quality | None = None  # Set when quality was lowered under load
     error_code: ErrorCode | None = None
     message: str | None = None
+    attempts: int | None = None
+    next_retry_at: datetime | None = None
+    queue_position: int | None = None
+    estimated_start_at: datetime | None = None
+
+
+class JobListResponse(BaseModel):
+    """One page of a job listing."""
+
+    jobs: list[JobStatusResponse]
+    next_cursor: str | None = None  # Pass as ?cursor= to get the next page
+
+
+class StageTiming(BaseModel):
+    """One stage in a job's timing waterfall."""
+
+    stage: str
+    start_ms: int
+    duration_ms: int
+
+
+class JobTimingsResponse(BaseModel):
+    """Response for job timing query."""
+
+    job_id: str
+    status: JobStatus
+    total_ms: int
+    stages: list[StageTiming]
 
 
 class ErrorResponse(BaseModel):
@@ -0,0 +1,180 @@
+"""Keep partial downloads between attempts so retries can resume.
+
+Each job downloads into a work area keyed by (video ID, quality) under
+download_dir/partial instead of a per-job directory. If the job fails, the
+area is kept (yt-dlp .part/.ytdl files, aria2c control files, partial
+Cobalt files) and a retried or duplicate job resumes from it. Areas are
+deleted when a job succeeds, or pruned once unused for partial_ttl_hours.
+
+A Redis lock stops two jobs from writing into the same area at once; a job
+that cannot take it falls back to a fresh per-job directory.
+"""
+
+import json
+import logging
+import shutil
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from redis import Redis
+from redis.client import Pipeline
+
+from ytdl.cobalt import extract_video_id
+from ytdl.config import settings
+from ytdl.jobs import JOB_TIMEOUT
+from ytdl.metrics import inc
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_DIR = "partial"
+MANIFEST_NAME = ".resume.json"
+
+
+def partial_root() -> Path:
+    """Directory holding all resumable work areas."""
+    return Path(settings.download_dir) / PARTIAL_DIR
+
+
+def partial_name(url: str, quality: str, progressive: bool = False) -> str | None:
+    """Name of the work area for a video and quality, or None if the URL has no ID."""
+    video_id = extract_video_id(url)
+    if not video_id:
+        return None
+    # Streamed jobs select a different (single-file) format
+    return f"{video_id}_{quality}_stream" if progressive else f"{video_id}_{quality}"
+
+
+def lock_key(name: str) -> str:
+    """Redis key locking a work area to one job."""
+    return f"partial:lock:{name}"
+
+
+def _acquire(redis: Redis, name: str, job_id: str) -> bool:
+    """Lock a work area for a job. A retry of the same job may take over its own lock."""
+    key = lock_key(name)
+    ttl = JOB_TIMEOUT + 60
+    if redis.set(key, job_id, nx=True, ex=ttl):
+        return True
+    if redis.get(key) == job_id:
+        redis.expire(key, ttl)
+        return True
+    return False
+
+
+def _release(redis: Redis, name: str, job_id: str) -> None:
+    """Release a work area lock if this job still holds it."""
+    key = lock_key(name)
+
+    def release(pipe: Pipeline) -> None:
+        if pipe.get(key) == job_id:
+            pipe.multi()
+            pipe.delete(key)
+
+    redis.transaction(release, key)
+
+
+@contextmanager
+def claim_work_area(
+    redis: Redis,
+    job_id: str,
+    url: str,
+    quality: str,
+    progressive: bool = False,
+) -> Iterator[Path | None]:
+    """
+    Claim the resumable work area for a job's video and quality.
+
+    Yields the directory, or None when resuming is disabled, the URL has no
+    video ID, or another job is using the area. The caller deletes the
+    directory on success; it is kept otherwise.
+    """
+    name = partial_name(url, quality, progressive) if settings.resume_downloads else None
+    if not name or not _acquire(redis, name, job_id):
+        yield None
+        return
+
+    path = partial_root() / name
+    if path.is_dir() and any(path.iterdir()):
+        logger.info(f"Resuming job {job_id} from partial download in {path}")
+        inc(redis, "ytdl_download_resumes_total")
+    path.mkdir(parents=True, exist_ok=True)
+
+    try:
+        yield path
+    finally:
+        # Restart the TTL from the last time the area was used
+        if path.exists():
+            path.touch()
+        _release(redis, name, job_id)
+
+
+def check_resume_manifest(output_dir: Path, video_id: str, formats: list[dict]) -> None:
+    """
+    Discard partial files that don't belong to the formats about to be downloaded.
+
+    The selected format IDs and sizes are recorded next to the partial files.
+    If a retry selects different formats (or YouTube reports different sizes),
+    or a partial file is larger than its format, the partial files are deleted
+    so yt-dlp starts clean instead of appending to mismatched data.
+    """
+    manifest_path = output_dir / MANIFEST_NAME
+    manifest = [
+        {
+            "format_id": f.get("format_id"),
+            "filesize": f.get("filesize") or f.get("filesize_approx"),
+        }
+        for f in formats
+    ]
+
+    stale = False
+    if manifest_path.exists():
+        try:
+            stale = json.loads(manifest_path.read_text()) != manifest
+        except (OSError, ValueError):
+            stale = True
+
+    if not stale:
+        sizes = {str(m["format_id"]): m["filesize"] for m in manifest}
+        for part in output_dir.glob(f"{video_id}.*.part"):
+            # yt-dlp names per-format parts <id>.f<format_id>.<ext>.part
+            format_id = part.name.split(".")[1].removeprefix("f")
+            expected = sizes.get(format_id) or sizes.get(str(formats[0].get("format_id")))
+            if expected and part.stat().st_size > expected:
+                stale = True
+                break
+
+    if stale:
+        logger.warning(f"Discarding partial download of {video_id} in {output_dir}")
+        for path in output_dir.iterdir():
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+
+    manifest_path.write_text(json.dumps(manifest))
+
+
+def prune_partials(redis: Redis) -> int:
+    """
+    Remove work areas unused for longer than partial_ttl_hours.
+
+    Returns:
+        Number of work areas removed
+    """
+    root = partial_root()
+    if not root.is_dir():
+        return 0
+
+    cutoff = time.time() - settings.partial_ttl_hours * 3600
+    removed = 0
+    for path in root.iterdir():
+        if not path.is_dir() or path.stat().st_mtime >= cutoff:
+            continue
+        if redis.exists(lock_key(path.name)):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        logger.info(f"Pruned expired partial download: {path}")
+        removed += 1
+    return removed
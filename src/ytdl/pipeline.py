@@ -0,0 +1,443 @@
+"""Staged pipeline worker: separate download, processing and upload pools.
+
+An RQ worker runs a job from start to finish in one slot, so its network
+link idles while it remuxes and uploads, and its CPU idles while it
+downloads. This worker takes the same jobs from the same RQ queues but
+moves each one through three thread pools instead:
+
+    download (extract, download, merge) -> process (transcode, faststart) -> upload
+
+Each pool works through its own bounded queue. A stage whose next queue is
+full blocks until that stage catches up, and a new job is only taken from
+RQ when a download thread is free. Job N+1 can therefore download while job
+N remuxes and job N-1 uploads, without pulling more work than the node can
+hold. Free download slots are reported to the scheduler so dispatch counts
+them like idle RQ workers.
+
+Run it instead of (or next to) `rq worker`, listing lanes in priority order:
+
+    python -m ytdl.pipeline fast default prefetch
+
+With several queue shards (QUEUE_URLS), run pipelines on each shard with
+--shard <n>, as with `rq worker --url <shard>`.
+
+Stages share one process, so RQ's per-job timeout does not apply. A job gets
+JOB_TIMEOUT of step time in total instead, like an RQ job; waiting between
+stages does not count. When it runs out, the run is cancelled: its ffmpeg and
+aria2c processes are killed and Python code stops at its next progress update.
+A step that then stops within STOP_GRACE fails the job, which is retried like a
+job RQ killed. A thread cannot be killed, so a step that still does not stop is
+left behind: the job fails without a retry and its heartbeat stops, but its
+work area and bandwidth share stay held until the thread exits, so nothing else
+writes to them meanwhile. A dead process is caught by the heartbeat reaper.
+"""
+
+import argparse
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+from collections.abc import Callable
+from contextlib import ExitStack
+
+from redis import Redis
+from rq import Queue
+from rq.exceptions import DequeueTimeout
+
+from ytdl import degrade, prefetch
+from ytdl.bandwidth import bandwidth_share
+from ytdl.config import settings
+from ytdl.connections import get_redis, queue_connections
+from ytdl.errors import ErrorCode, JobTimeoutError
+from ytdl.jobs import JOB_TIMEOUT, LANES, PREFETCH_LANE, get_job_data
+from ytdl.migrations import migrate_keys
+from ytdl.partials import claim_work_area, prune_partials
+from ytdl.reaper import cleanup_orphaned_work_dirs, heartbeat
+from ytdl.retries import fail_job
+from ytdl.scheduler import dispatch, record_job_seconds, remove_pipeline, report_pipeline
+from ytdl.worker import JobRun
+
+logger = logging.getLogger(__name__)
+
+DEQUEUE_TIMEOUT = 1  # Seconds to block on RQ before checking for shutdown
+REPORT_INTERVAL = 5.0  # Seconds between free-slot reports while nothing changes
+STOP_GRACE = 30  # Seconds a cancelled step gets to stop before the job is given up on
+
+
+class PipelineJob:
+    """A job moving through the pipeline, with the resources it holds until it leaves."""
+
+    def __init__(self, redis: Redis, job_id: str, job_data: dict):
+        self.redis = redis
+        self.job_id = job_id
+        self.started = time.monotonic()
+        self.budget = float(JOB_TIMEOUT)  # Step time left, shared by all stages
+        self.lock = threading.Lock()
+        self.stepping = False  # A step thread is running
+        self.abandoned = False  # Failed while its step was stuck; see abandon()
+        self.beat = ExitStack()
+        self.resources = ExitStack()
+        self.download_resources = ExitStack()
+        try:
+            job_data = degrade.select_quality(redis, job_id, job_data)
+            self.beat.enter_context(heartbeat(redis, job_id))
+            work_area = self.resources.enter_context(
+                claim_work_area(
+                    redis,
+                    job_id,
+                    job_data["url"],
+                    job_data["quality"],
+                    job_data.get("stream", False),
+                )
+            )
+            # Only the download needs a share of the node's bandwidth
+            bandwidth = self.download_resources.enter_context(
+                bandwidth_share(redis, job_id, background=bool(job_data.get("prefetch")))
+            )
+            self.run = JobRun(redis, job_id, job_data, work_area, bandwidth)
+        except BaseException:
+            self._release()
+            raise
+
+    def download(self) -> None:
+        """Download stage: mark the job running and fetch the video."""
+        self.run.start()
+        self.run.download()
+        self.download_resources.close()
+
+    def process(self) -> None:
+        """Processing stage: transcode and faststart."""
+        self.run.process()
+
+    def upload(self) -> None:
+        """Upload stage: store the file and mark the job done."""
+        self.run.upload()
+
+    def close(self, error: Exception | None = None) -> None:
+        """Record the outcome and release everything the job holds."""
+        try:
+            if error is not None:
+                self.run.fail(error)
+        finally:
+            try:
+                self.run.finish()
+            finally:
+                self._release()
+
+        record_job_seconds(self.redis, time.monotonic() - self.started)
+        prune_partials(self.redis)
+
+    def abandon(self, error: Exception) -> bool:
+        """
+        Fail a job whose step will not stop, keeping its files until it does.
+
+        The job fails without a retry (a retry would take over the work area
+        the stuck step is still writing to) and its heartbeat stops. The step
+        thread releases the rest when it finally exits (see step_exited).
+
+        Returns:
+            False if the step exited meanwhile and the job can be closed as usual
+        """
+        with self.lock:
+            if not self.stepping:
+                return False
+            self.abandoned = True
+            try:
+                self.run.fail(error, retry=False)
+            finally:
+                self.beat.close()
+        return True
+
+    def step_exited(self) -> None:
+        """Called by a step thread on exit: release an abandoned job's remaining resources."""
+        with self.lock:
+            self.stepping = False
+            if not self.abandoned:
+                return
+        logger.info(f"Stuck step of job {self.job_id} exited, releasing its work area")
+        try:
+            self.run.finish()
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        """Release the bandwidth share and work area, then stop the heartbeat."""
+        try:
+            self.download_resources.close()
+            self.resources.close()
+        finally:
+            self.beat.close()
+
+
+class Stage:
+    """A pool of threads running one pipeline step, fed by a bounded queue."""
+
+    def __init__(
+        self,
+        name: str,
+        step: Callable[[PipelineJob], None],
+        workers: int,
+        depth: int,
+        on_leave: Callable[[], None] | None = None,
+    ):
+        self.name = name
+        self.step = step
+        self.workers = workers
+        self.inbox: queue.Queue[PipelineJob | None] = queue.Queue(maxsize=depth)
+        self.next: Stage | None = None
+        self.on_leave = on_leave
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        """Start the stage's threads."""
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        """Finish the queued jobs, then stop the threads."""
+        for _ in self._threads:
+            self.inbox.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self) -> None:
+        while (job := self.inbox.get()) is not None:
+            try:
+                finished = self._run_step(job)
+            except Exception as e:
+                self._close(job, e)
+            else:
+                # An abandoned job (not finished) is released by its stuck step thread
+                if finished and self.next:
+                    # Blocks while the next stage is behind: backpressure
+                    self.next.inbox.put(job)
+                elif finished:
+                    self._close(job)
+            finally:
+                if self.on_leave:
+                    self.on_leave()
+
+    def _run_step(self, job: PipelineJob) -> bool:
+        """
+        Run the step on its own thread, within the job's remaining step time.
+
+        Returns:
+            False if the step would not stop and the job was abandoned; it is
+            then no longer this stage's to hand on or close
+
+        Raises:
+            JobTimeoutError: If the job ran out of time and its step stopped
+        """
+        errors: list[Exception] = []
+
+        def run() -> None:
+            try:
+                self.step(job)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                job.step_exited()
+
+        thread = threading.Thread(
+            target=run, name=f"{threading.current_thread().name}-{job.job_id}", daemon=True
+        )
+        job.stepping = True
+        started = time.monotonic()
+        thread.start()
+        thread.join(max(job.budget, 0))
+        job.budget -= time.monotonic() - started
+        if thread.is_alive():
+            logger.error(f"Job {job.job_id} ran out of time in the {self.name} stage")
+            job.run.cancel()
+            thread.join(STOP_GRACE)
+            error = JobTimeoutError(f"Job timed out in the {self.name} stage")
+            if thread.is_alive() and job.abandon(error):
+                logger.error(f"Job {job.job_id} did not stop, leaving it behind")
+                return False
+            raise error
+        if errors:
+            raise errors[0]
+        return True
+
+    @staticmethod
+    def _close(job: PipelineJob, error: Exception | None = None) -> None:
+        try:
+            job.close(error)
+        except Exception as e:
+            logger.error(f"Failed to finish job {job.job_id}: {e}")
+
+
+class Pipeline:
+    """Pulls jobs from RQ lanes into the download stage while it has free threads."""
+
+    def __init__(
+        self,
+        lanes: list[str],
+        download_workers: int,
+        process_workers: int,
+        upload_workers: int,
+        depth: int,
+        shard: int = 0,
+    ):
+        self.redis = get_redis()
+        self.lanes = lanes
+        self.shard = shard
+        self.name = f"{settings.node_id}:{os.getpid()}"
+        self.download_workers = download_workers
+        self.stopping = threading.Event()
+
+        # Jobs taken from RQ and not yet handed on by the download stage
+        self.downloading = 0
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(download_workers)
+
+        self.stages = [
+            Stage(
+                "download",
+                PipelineJob.download,
+                download_workers,
+                download_workers,
+                on_leave=self._download_done,
+            ),
+            Stage("process", PipelineJob.process, process_workers, depth),
+            Stage("upload", PipelineJob.upload, upload_workers, depth),
+        ]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next = next_stage
+
+    def _download_done(self) -> None:
+        """A download thread is free again: tell the scheduler and fill it."""
+        with self.lock:
+            self.downloading -= 1
+        self.slots.release()
+        self._report()
+        if not self.stopping.is_set():
+            try:
+                dispatch(self.redis)
+            except Exception as e:
+                logger.warning(f"Dispatch failed: {e}")
+
+    def _report(self) -> None:
+        with self.lock:
+            free = self.download_workers - self.downloading
+        if self.stopping.is_set():
+            free = 0
+        try:
+            report_pipeline(
+                self.redis, self.name, free, self.download_workers, self.lanes, self.shard
+            )
+        except Exception as e:
+            logger.warning(f"Failed to report free slots: {e}")
+
+    def _take_job(self, queues: list[Queue]) -> PipelineJob | None:
+        """Take the next job from RQ, or None if there is none yet."""
+        try:
+            rq_job, lane = Queue.dequeue_any(
+                queues, DEQUEUE_TIMEOUT, connection=queues[0].connection
+            )
+        except DequeueTimeout:
+            return None
+        job_id = rq_job.args[0]
+        # The job record in Redis is the source of truth; RQ only carried the ID
+        rq_job.delete()
+
+        job_data = get_job_data(self.redis, job_id)
+        if not job_data:
+            logger.error(f"Job {job_id} not found")
+            return None
+        logger.info(f"Took job {job_id} from {lane.name}")
+        try:
+            return PipelineJob(self.redis, job_id, job_data)
+        except Exception as e:
+            # Off the RQ queue but never started; don't leave it queued forever
+            logger.error(f"Failed to start job {job_id}: {e}")
+            if job_data.get("prefetch"):
+                prefetch.abandon(self.redis, job_id, job_data, ErrorCode.INTERNAL_ERROR, str(e))
+                return None
+            attempts = job_data.get("attempts", 0) + 1
+            fail_job(self.redis, job_id, ErrorCode.INTERNAL_ERROR, str(e), attempts)
+            return None
+
+    def run(self) -> None:
+        """Feed the download stage until asked to stop, then drain all stages."""
+        migrate_keys(self.redis)
+        removed = cleanup_orphaned_work_dirs(self.redis)
+        if removed:
+            logger.info(f"Removed {removed} orphaned work directories")
+        prune_partials(self.redis)
+
+        for stage in self.stages:
+            stage.start()
+        logger.info(
+            f"Pipeline {self.name} polling {', '.join(self.lanes)} on shard {self.shard} with "
+            + ", ".join(f"{stage.workers} {stage.name}" for stage in self.stages)
+            + " threads"
+        )
+
+        connection = queue_connections()[self.shard]
+        queues = [Queue(lane, connection=connection) for lane in self.lanes]
+        reported = 0.0
+        try:
+            while not self.stopping.is_set():
+                if time.monotonic() - reported > REPORT_INTERVAL:
+                    self._report()
+                    reported = time.monotonic()
+                if not self.slots.acquire(timeout=DEQUEUE_TIMEOUT):
+                    continue
+
+                try:
+                    job = self._take_job(queues)
+                except Exception as e:
+                    logger.error(f"Failed to take a job: {e}")
+                    job = None
+                if job is None:
+                    self.slots.release()
+                    continue
+
+                with self.lock:
+                    self.downloading += 1
+                self.stages[0].inbox.put(job)
+                self._report()
+        finally:
+            self.stopping.set()
+            self._report()
+            logger.info("Draining pipeline")
+            for stage in self.stages:
+                stage.stop()
+            remove_pipeline(self.redis, self.name)
+
+    def stop(self) -> None:
+        """Stop taking jobs; run() returns once the jobs in flight are done."""
+        self.stopping.set()
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(threadName)s - %(levelname)s - %(message)s",
+    )
+    parser = argparse.ArgumentParser(description="Staged pipeline worker for ytdl jobs")
+    parser.add_argument(
+        "lanes", nargs="*", default=[*LANES, PREFETCH_LANE], help="RQ queues, by priority"
+    )
+    parser.add_argument("--download", type=int, default=settings.pipeline_download_workers)
+    parser.add_argument("--process", type=int, default=settings.pipeline_process_workers)
+    parser.add_argument("--upload", type=int, default=settings.pipeline_upload_workers)
+    parser.add_argument("--depth", type=int, default=settings.pipeline_queue_depth)
+    parser.add_argument("--shard", type=int, default=0, help="Queue shard (index in QUEUE_URLS)")
+    args = parser.parse_args()
+
+    pipeline = Pipeline(
+        args.lanes, args.download, args.process, args.upload, args.depth, args.shard
+    )
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: pipeline.stop())
+    pipeline.run()
+
+
+if __name__ == "__main__":
+    main()
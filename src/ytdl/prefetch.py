@@ -0,0 +1,255 @@
+"""Prefetch likely-requested videos on idle workers.
+
+Workers sit idle between bursts, and then every burst pays the full download
+cost. Prefetching spends that idle time on videos that are likely to be
+requested soon. Videos become candidates in two ways: they are queued through
+POST /prefetch, or they are requested PREFETCH_MIN_REQUESTS times within
+PREFETCH_WINDOW_HOURS. Requests are counted per video and quality in hourly
+buckets, prefetch:popular:{hour}. Candidates wait in prefetch:candidates,
+with the most requested first.
+
+The dispatcher (ytdl.scheduler) starts a prefetch job only when no tenant job
+is waiting and a worker polling the "prefetch" RQ lane is idle, with at most
+PREFETCH_MAX_JOBS running at once. Prefetch downloads get a small share of a
+node's bandwidth cap. Once real jobs are waiting for a worker, the dispatcher
+flags running prefetch jobs in prefetch:preempt. A flagged job stops at its
+next download progress report and keeps its partial download. Its video goes
+back to the candidates.
+
+A finished prefetch is stored like any job. It is recorded in
+prefetch:result:{video}_{quality} for PREFETCH_RESULT_TTL_HOURS. While that
+record exists, POST /jobs for the same video and quality is answered
+immediately with a fresh download link.
+"""
+
+import json
+import logging
+import time
+import uuid
+from datetime import UTC, datetime
+
+from redis import Redis
+
+from ytdl.cobalt import extract_video_id
+from ytdl.config import settings
+from ytdl.errors import ERROR_MESSAGES, ErrorCode, YTDLError
+from ytdl.jobs import PREFETCH_LANE, enqueue_job, get_job_data, set_job_data, update_job
+from ytdl.metrics import inc
+from ytdl.models import JobStatus
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_TENANT = "prefetch"  # Owns prefetch job records; never dispatched as a tenant
+CANDIDATES_KEY = "prefetch:candidates"  # Sorted set of {video}_{quality} by demand
+RUNNING_KEY = "prefetch:running"  # Hash of prefetch job ID -> {video}_{quality}
+PREEMPT_KEY = "prefetch:preempt"  # Set of prefetch job IDs asked to stop
+POPULAR_PREFIX = "prefetch:popular:"
+RESULT_PREFIX = "prefetch:result:"
+
+BUCKET_SECONDS = 3600
+MAX_CANDIDATES = 1000
+MAX_TRACKED = 10_000  # Videos counted per popularity bucket
+
+
+class PreemptedError(YTDLError):
+    """Raised inside a prefetch job that must give its worker to a real job."""
+
+    def __init__(self):
+        super().__init__(ErrorCode.PREEMPTED)
+
+
+def enabled() -> bool:
+    """Whether prefetching is on (PREFETCH_MAX_JOBS > 0)."""
+    return settings.prefetch_max_jobs > 0
+
+
+def prefetch_name(url: str, quality: str) -> str | None:
+    """Name of a video and quality in prefetch state, or None if the URL has no video ID."""
+    video_id = extract_video_id(url)
+    return f"{video_id}_{quality}" if video_id else None
+
+
+def _result_key(name: str) -> str:
+    return f"{RESULT_PREFIX}{name}"
+
+
+def _popular_key(bucket: int) -> str:
+    return f"{POPULAR_PREFIX}{bucket}"
+
+
+def lookup(redis: Redis, url: str, quality: str) -> dict | None:
+    """
+    Find a stored prefetch of a video at a quality.
+
+    Returns:
+        Dict with object_key and filename, or None if it was not prefetched
+    """
+    name = prefetch_name(url, quality)
+    if not name:
+        return None
+    data = redis.get(_result_key(name))
+    return json.loads(data) if data else None
+
+
+def add_candidate(redis: Redis, url: str, quality: str, demand: float) -> bool:
+    """
+    Queue a video for prefetching, unless it is already stored.
+
+    Args:
+        redis: Redis connection
+        url: Video URL
+        quality: Quality to fetch
+        demand: Priority among candidates (recent requests); only ever raised
+
+    Returns:
+        True if the video is now a candidate
+    """
+    name = prefetch_name(url, quality)
+    if not name or redis.exists(_result_key(name)):
+        return False
+    pipe = redis.pipeline()
+    pipe.zadd(CANDIDATES_KEY, {name: demand}, gt=True)
+    pipe.zremrangebyrank(CANDIDATES_KEY, 0, -MAX_CANDIDATES - 1)
+    pipe.execute()
+    return True
+
+
+def record_request(redis: Redis, url: str, quality: str) -> None:
+    """Count a job request; a video requested often enough recently becomes a candidate."""
+    name = prefetch_name(url, quality)
+    if not enabled() or not name:
+        return
+
+    buckets = max(settings.prefetch_window_hours * 3600 // BUCKET_SECONDS, 1)
+    bucket = int(time.time() // BUCKET_SECONDS)
+    key = _popular_key(bucket)
+    pipe = redis.pipeline()
+    pipe.zincrby(key, 1, name)
+    pipe.expire(key, (buckets + 1) * BUCKET_SECONDS)
+    pipe.zremrangebyrank(key, 0, -MAX_TRACKED - 1)
+    for earlier in range(bucket - buckets + 1, bucket):
+        pipe.zscore(_popular_key(earlier), name)
+    current, _, _, *previous = pipe.execute()
+
+    requests = current + sum(score or 0 for score in previous)
+    if requests >= settings.prefetch_min_requests:
+        add_candidate(redis, url, quality, requests)
+
+
+def running(redis: Redis) -> dict[str, str]:
+    """Prefetch jobs queued on RQ or running, by job ID, dropping any that have ended."""
+    live, ended = {}, []
+    for job_id, name in redis.hgetall(RUNNING_KEY).items():
+        job_data = get_job_data(redis, job_id)
+        if job_data and job_data["status"] in (JobStatus.QUEUED.value, JobStatus.RUNNING.value):
+            live[job_id] = name
+        else:
+            ended.append(job_id)
+    if ended:
+        redis.hdel(RUNNING_KEY, *ended)
+        redis.srem(PREEMPT_KEY, *ended)
+    return live
+
+
+def launch(redis: Redis, shard: int = 0) -> str | None:
+    """
+    Start a prefetch job for the most requested candidate that is not stored yet.
+
+    Args:
+        redis: Redis connection
+        shard: Queue shard to put the job on
+
+    Returns:
+        The new job's ID, or None if there is nothing to prefetch
+    """
+    in_flight = set(running(redis).values())
+    while popped := redis.zpopmax(CANDIDATES_KEY):
+        name, demand = popped[0]
+        if name in in_flight or redis.exists(_result_key(name)):
+            continue
+
+        video_id, quality = name.rsplit("_", 1)
+        job_id = str(uuid.uuid4())
+        set_job_data(
+            redis,
+            job_id,
+            {
+                "job_id": job_id,
+                "tenant": PREFETCH_TENANT,
+                "url": f"https://www.youtube.com/watch?v={video_id}",
+                "quality": quality,
+                "status": JobStatus.QUEUED.value,
+                "stream": False,
+                "created_at": datetime.now(UTC).isoformat(),
+                "prefetch": name,
+                "demand": demand,
+            },
+        )
+        redis.hset(RUNNING_KEY, job_id, name)
+        enqueue_job(job_id, PREFETCH_LANE, shard)
+        inc(redis, "ytdl_prefetch_total", result="started")
+        logger.info(f"Prefetching {name} as job {job_id}")
+        return job_id
+    return None
+
+
+def preempt(redis: Redis, count: int) -> int:
+    """
+    Ask prefetch jobs to stop so that `count` real jobs can have their workers.
+
+    Jobs already asked to stop count towards `count`.
+
+    Returns:
+        Number of jobs newly asked to stop
+    """
+    job_ids = list(running(redis))
+    if not job_ids:
+        return 0
+    flagged = redis.smembers(PREEMPT_KEY)
+    needed = count - sum(1 for job_id in job_ids if job_id in flagged)
+    targets = [job_id for job_id in job_ids if job_id not in flagged][: max(needed, 0)]
+    if targets:
+        redis.sadd(PREEMPT_KEY, *targets)
+        logger.info(f"Preempting prefetch jobs {', '.join(targets)} for waiting jobs")
+    return len(targets)
+
+
+def check_preempted(redis: Redis, job_id: str) -> None:
+    """
+    Stop a prefetch job that was asked to make room.
+
+    Raises:
+        PreemptedError: If the job is flagged in prefetch:preempt
+    """
+    if redis.sismember(PREEMPT_KEY, job_id):
+        raise PreemptedError()
+
+
+def complete(redis: Redis, job_data: dict, object_key: str, filename: str) -> None:
+    """Record a finished prefetch so matching requests are answered from it."""
+    result = {"object_key": object_key, "filename": filename, "job_id": job_data["job_id"]}
+    ttl = settings.prefetch_result_ttl_hours * 3600
+    redis.set(_result_key(job_data["prefetch"]), json.dumps(result), ex=ttl)
+    inc(redis, "ytdl_prefetch_total", result="stored")
+
+
+def abandon(redis: Redis, job_id: str, job_data: dict, code: ErrorCode, message: str) -> None:
+    """
+    Record a prefetch job that ended without a result. Prefetch jobs are never retried.
+
+    A preempted job's video goes back to the candidates.
+    """
+    if redis.sismember(PREEMPT_KEY, job_id):
+        redis.zadd(CANDIDATES_KEY, {job_data["prefetch"]: job_data.get("demand", 1)}, gt=True)
+        code, message = ErrorCode.PREEMPTED, ERROR_MESSAGES[ErrorCode.PREEMPTED]
+        inc(redis, "ytdl_prefetch_total", result="preempted")
+    else:
+        logger.warning(f"Prefetch job {job_id} failed: {code} - {message}")
+        inc(redis, "ytdl_prefetch_total", result="failed")
+    update_job(
+        redis,
+        job_id,
+        status=JobStatus.ERROR.value,
+        error_code=code.value,
+        message=message,
+    )
@@ -0,0 +1,151 @@
+"""Stuck-job detection: worker heartbeats and the reaper that acts on them.
+
+While a job runs, its worker refreshes heartbeat:{id} (short TTL) from a
+background thread and keeps the ID in the jobs:running set. A worker that
+is OOM-killed or loses its container stops heartbeating, so the reaper
+(run by the API) finds running jobs without a live heartbeat and hands them
+to the retry queue, or marks them as error once max_job_attempts is reached.
+Waiting clients get an answer within seconds instead of sitting out the
+timeout. The same loop also promotes jobs whose retry is due and
+dispatches waiting tenant jobs.
+"""
+
+import asyncio
+import logging
+import shutil
+import threading
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from ytdl import prefetch
+from ytdl.config import settings
+from ytdl.errors import ERROR_MESSAGES, ErrorCode
+from ytdl.jobs import get_job_data
+from ytdl.metrics import inc
+from ytdl.models import JobStatus
+from ytdl.retries import fail_job, promote_due_retries
+from ytdl.scheduler import dispatch
+
+logger = logging.getLogger(__name__)
+
+RUNNING_KEY = "jobs:running"
+
+
+def heartbeat_key(job_id: str) -> str:
+    """Redis key that exists while a worker is alive on the job."""
+    return f"heartbeat:{job_id}"
+
+
+@contextmanager
+def heartbeat(redis: Redis, job_id: str) -> Iterator[None]:
+    """Heartbeat a job from a background thread while the block runs."""
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(settings.heartbeat_interval):
+            try:
+                redis.set(heartbeat_key(job_id), 1, ex=settings.heartbeat_ttl)
+            except RedisError as e:
+                logger.warning(f"Heartbeat for job {job_id} failed: {e}")
+
+    pipe = redis.pipeline()
+    pipe.set(heartbeat_key(job_id), 1, ex=settings.heartbeat_ttl)
+    pipe.sadd(RUNNING_KEY, job_id)
+    pipe.execute()
+
+    thread = threading.Thread(target=beat, name=f"heartbeat-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+        # Leave the running set first so the reaper never sees us without a heartbeat
+        pipe = redis.pipeline()
+        pipe.srem(RUNNING_KEY, job_id)
+        pipe.delete(heartbeat_key(job_id))
+        pipe.execute()
+
+
+def reap_stuck_jobs(redis: Redis) -> int:
+    """
+    Requeue or fail running jobs whose worker stopped heartbeating.
+
+    Safe to run from several API instances: whoever removes a job from the
+    running set handles it.
+
+    Returns:
+        Number of jobs reaped
+    """
+    reaped = 0
+    for job_id in redis.smembers(RUNNING_KEY):
+        if redis.exists(heartbeat_key(job_id)):
+            continue
+        if not redis.srem(RUNNING_KEY, job_id):
+            continue
+
+        job_data = get_job_data(redis, job_id)
+        if not job_data or job_data["status"] != JobStatus.RUNNING.value:
+            continue
+
+        reaped += 1
+        logger.warning(f"Job {job_id} lost its worker")
+        if job_data.get("prefetch"):
+            message = ERROR_MESSAGES[ErrorCode.WORKER_LOST]
+            prefetch.abandon(redis, job_id, job_data, ErrorCode.WORKER_LOST, message)
+            inc(redis, "ytdl_jobs_reaped_total", action="failed")
+            continue
+        retried = fail_job(
+            redis,
+            job_id,
+            ErrorCode.WORKER_LOST,
+            ERROR_MESSAGES[ErrorCode.WORKER_LOST],
+            job_data.get("attempts", 1),
+        )
+        inc(redis, "ytdl_jobs_reaped_total", action="requeued" if retried else "failed")
+
+    return reaped
+
+
+async def run_reaper(redis: Redis) -> None:
+    """Reap stuck jobs, promote due retries and dispatch every reaper_interval seconds."""
+    while True:
+        try:
+            await asyncio.to_thread(reap_stuck_jobs, redis)
+            await asyncio.to_thread(promote_due_retries, redis)
+            await asyncio.to_thread(dispatch, redis)
+        except Exception as e:
+            logger.error(f"Reaper pass failed: {e}")
+        await asyncio.sleep(settings.reaper_interval)
+
+
+def cleanup_orphaned_work_dirs(redis: Redis) -> int:
+    """
+    Remove job work directories that no live worker owns.
+
+    Work directories are named after the job ID, under download_dir or
+    (for jobs staged in RAM) memory_staging_dir; anything else is left alone.
+
+    Returns:
+        Number of directories removed
+    """
+    removed = 0
+    for root in (Path(settings.download_dir), Path(settings.memory_staging_dir)):
+        if not root.is_dir():
+            continue
+        for path in root.iterdir():
+            try:
+                uuid.UUID(path.name)
+            except ValueError:
+                continue
+            if not path.is_dir() or redis.exists(heartbeat_key(path.name)):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            logger.info(f"Removed orphaned work directory: {path}")
+            removed += 1
+    return removed
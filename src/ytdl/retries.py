@@ -0,0 +1,122 @@
+"""Error-class-aware job retries with exponential backoff.
+
+Jobs that fail with a transient error (YouTube hiccups, network timeouts,
+upload failures, lost workers) go back to `queued` and into the jobs:retry
+sorted set, scored by when they are due. The API's reaper loop moves due
+jobs back to the front of their tenant's queue. Errors that will not go away by themselves
+(invalid URL, private or removed videos, merge failures) fail immediately.
+"""
+
+import logging
+import random
+import time
+from datetime import UTC, datetime, timedelta
+
+from redis import Redis
+
+from ytdl.config import settings
+from ytdl.errors import ErrorCode
+from ytdl.jobs import DEFAULT_TENANT, update_job
+from ytdl.metrics import inc
+from ytdl.models import JobStatus
+from ytdl.scheduler import submit_job
+
+logger = logging.getLogger(__name__)
+
+RETRY_KEY = "jobs:retry"
+
+RETRIABLE_ERRORS = frozenset(
+    {
+        ErrorCode.UPSTREAM_FAILURE,
+        ErrorCode.DOWNLOAD_FAILED,
+        ErrorCode.UPLOAD_FAILED,
+        ErrorCode.WORKER_LOST,
+        ErrorCode.INTERNAL_ERROR,
+    }
+)
+
+
+def is_retriable(code: ErrorCode) -> bool:
+    """Check whether an error is worth retrying."""
+    return code in RETRIABLE_ERRORS
+
+
+def retry_delay(attempt: int) -> float:
+    """Seconds to wait after a failed attempt (1-based): exponential, with jitter."""
+    delay = min(settings.retry_base_delay * 2 ** (attempt - 1), settings.retry_max_delay)
+    return random.uniform(delay / 2, delay)
+
+
+def fail_job(
+    redis: Redis,
+    job_id: str,
+    code: ErrorCode,
+    message: str,
+    attempts: int,
+    retry: bool = True,
+) -> bool:
+    """
+    Record a failed attempt: schedule a retry or mark the job as error.
+
+    Args:
+        redis: Redis connection
+        job_id: The failed job
+        code: Error code of the failure
+        message: Error message
+        attempts: Attempts made so far, including this one
+        retry: Whether a retry may be scheduled at all
+
+    Returns:
+        True if a retry was scheduled
+    """
+    if retry and is_retriable(code) and attempts < settings.max_job_attempts:
+        next_retry_at = datetime.now(UTC) + timedelta(seconds=retry_delay(attempts))
+        logger.warning(
+            f"Job {job_id} failed on attempt {attempts} ({code}), "
+            f"retrying at {next_retry_at.isoformat()}"
+        )
+        update_job(
+            redis,
+            job_id,
+            status=JobStatus.QUEUED.value,
+            error_code=code.value,
+            message=message,
+            next_retry_at=next_retry_at.isoformat(),
+            stream_path=None,
+            stream_url=None,
+        )
+        redis.zadd(RETRY_KEY, {job_id: next_retry_at.timestamp()})
+        inc(redis, "ytdl_job_retries_total", error_code=code.value)
+        return True
+
+    update_job(
+        redis,
+        job_id,
+        status=JobStatus.ERROR.value,
+        error_code=code.value,
+        message=message,
+        next_retry_at=None,
+    )
+    return False
+
+
+def promote_due_retries(redis: Redis) -> int:
+    """
+    Move jobs whose retry is due back to the front of their tenant's queue.
+
+    Safe to run from several API instances: whoever removes a job from the
+    retry set enqueues it.
+
+    Returns:
+        Number of jobs enqueued
+    """
+    promoted = 0
+    for job_id in redis.zrangebyscore(RETRY_KEY, 0, time.time()):
+        if not redis.zrem(RETRY_KEY, job_id):
+            continue
+        job_data = update_job(redis, job_id, next_retry_at=None)
+        if not job_data:
+            continue
+        submit_job(redis, job_id, job_data.get("tenant", DEFAULT_TENANT), front=True)
+        promoted += 1
+    return promoted
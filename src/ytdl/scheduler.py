@@ -0,0 +1,495 @@
+"""Per-tenant job queues with weighted fair, shortest-job-first dispatch.
+
+Each API token belongs to a tenant. New jobs wait in their tenant's queue
+(queue:{tenant}) instead of going straight to RQ, and a dispatcher feeds
+RQ with deficit round-robin across tenants: every visit adds the tenant's
+weight to its deficit, and each dispatched job costs one. A tenant with a
+long backlog therefore gets its share of workers, not all of them. RQ only
+gets enough jobs for its idle workers plus DISPATCH_DEPTH spare, so
+ordering is decided here rather than by RQ's FIFO.
+
+Tenant queues are sorted sets scored by submission time plus a size
+penalty: the job's cost (video duration, scaled by quality) capped at
+SJF_MAX_DELAY. A Short therefore overtakes a two-hour `best` download
+submitted shortly before it, but no job is overtaken by anything submitted
+more than SJF_MAX_DELAY after it. Small jobs go to the "fast" RQ queue,
+which workers poll first and reserved workers poll alone. Big jobs stay
+on "default" however long they wait, so reserved workers only ever see
+small ones; the capped penalty is what keeps big jobs moving.
+
+Dispatch runs when a job is submitted, when a worker finishes a job, and
+from the API's reaper loop. Staged pipeline workers (ytdl.pipeline) are not
+RQ workers, so they report their free download slots in pipeline:workers
+and count towards the lanes they poll.
+
+An idle worker counts once, however many lanes it polls (see Slots).
+With several queue shards (QUEUE_URLS, see ytdl.connections), free slots
+are counted per lane and shard, and each job goes to the shard with the
+most room for its lane, so workers on every shard are kept busy.
+"""
+
+import json
+import logging
+import math
+import time
+import uuid
+from datetime import UTC, datetime, timedelta
+
+from redis import Redis
+from redis.client import Pipeline
+from rq import Queue, Worker
+from rq.worker import WorkerStatus
+
+from ytdl import prefetch
+from ytdl.config import Tenant, settings
+from ytdl.connections import queue_connections
+from ytdl.jobs import (
+    DEFAULT_LANE,
+    DEFAULT_TENANT,
+    FAST_LANE,
+    LANES,
+    PREFETCH_LANE,
+    enqueue_job,
+    get_job_data,
+    update_job,
+)
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_KEY = "tenants:active"
+DEFICIT_KEY = "tenants:deficit"
+CURSOR_KEY = "tenants:cursor"
+SEQUENCE_KEY = "tenants:dispatch_seq"
+LOCK_KEY = "tenants:dispatch_lock"
+LOCK_TTL_MS = 5000  # Frees the lock if its holder dies mid-dispatch
+JOB_SECONDS_KEY = "stats:job_seconds"
+PIPELINE_KEY = "pipeline:workers"  # Hash of pipeline worker -> free slots, size, lanes
+PIPELINE_STALE_AFTER = 30.0  # Pipeline workers not reporting for this long are dropped
+
+DEFAULT_JOB_SECONDS = 60.0
+JOB_SECONDS_ALPHA = 0.1
+
+LOOKAHEAD = 10  # Jobs per tenant considered when the first one's lane is full
+
+# Relative download/processing work per second of video at each quality
+QUALITY_COST = {"480": 0.5, "720": 1.0, "1080": 2.0, "best": 4.0}
+
+
+def tenants() -> dict[str, Tenant]:
+    """Configured tenants by name, including the default tenant of API_TOKEN."""
+    configured = {tenant.name: tenant for tenant in settings.tenants}
+    configured.setdefault(DEFAULT_TENANT, Tenant(name=DEFAULT_TENANT, token=settings.api_token))
+    return configured
+
+
+def tenant_for_token(token: str) -> Tenant | None:
+    """Find the tenant an API token belongs to."""
+    for tenant in tenants().values():
+        if tenant.token and tenant.token == token:
+            return tenant
+    return None
+
+
+def queue_key(tenant: str) -> str:
+    """Redis sorted set of a tenant's jobs waiting for dispatch."""
+    return f"queue:{{{tenant}}}"
+
+
+def _rq_queues() -> dict[str, list[Queue]]:
+    """Each lane's RQ queue on every queue shard, in shard order."""
+    connections = queue_connections()
+    return {
+        lane: [Queue(lane, connection=connection) for connection in connections] for lane in LANES
+    }
+
+
+def job_cost(duration: float | None, quality: str) -> float | None:
+    """Size of a job in seconds of 720p-equivalent video, if the duration is known."""
+    if duration is None:
+        return None
+    return duration * QUALITY_COST.get(quality, 1.0)
+
+
+def job_lane(job_data: dict) -> str:
+    """RQ queue for a job: fast if it is known to be small."""
+    cost = job_cost(job_data.get("duration"), job_data["quality"])
+    if cost is not None and cost <= settings.fast_lane_max_seconds:
+        return FAST_LANE
+    return DEFAULT_LANE
+
+
+def submit_job(redis: Redis, job_id: str, tenant: str, front: bool = False) -> None:
+    """
+    Put a job in its tenant's queue and try to dispatch.
+
+    Jobs start out scored by submission time alone; classify_job adds the
+    size penalty once the duration is known.
+
+    Args:
+        redis: Redis connection
+        job_id: The job to run
+        tenant: Tenant name
+        front: Queue ahead of the tenant's other jobs (retries)
+    """
+    pipe = redis.pipeline()
+    pipe.zadd(queue_key(tenant), {job_id: 0 if front else time.time()})
+    pipe.sadd(ACTIVE_KEY, tenant)
+    _, added = pipe.execute()
+    if added:
+        # A newly active tenant changes everyone's share
+        redis.incr(SEQUENCE_KEY)
+    dispatch(redis)
+
+
+def classify_job(redis: Redis, job_id: str, tenant: str, duration: float) -> None:
+    """
+    Record a waiting job's duration and move it back by its size penalty.
+
+    Args:
+        redis: Redis connection
+        job_id: The job that was probed
+        tenant: Tenant name
+        duration: Video duration in seconds
+    """
+    job_data = update_job(redis, job_id, duration=duration)
+    if not job_data:
+        return
+    penalty = min(job_cost(duration, job_data["quality"]), settings.sjf_max_delay)
+    submitted = redis.zscore(queue_key(tenant), job_id)
+    if submitted:
+        # XX: a job dispatched in the meantime must not be queued again
+        redis.zadd(queue_key(tenant), {job_id: submitted + penalty}, xx=True)
+        redis.incr(SEQUENCE_KEY)
+
+
+def report_pipeline(
+    redis: Redis, name: str, free: int, size: int, lanes: list[str], shard: int = 0
+) -> None:
+    """Publish a pipeline worker's free download slots for dispatch and estimates."""
+    entry = {"free": free, "size": size, "lanes": lanes, "shard": shard, "ts": time.time()}
+    redis.hset(PIPELINE_KEY, name, json.dumps(entry))
+
+
+def remove_pipeline(redis: Redis, name: str) -> None:
+    """Withdraw a pipeline worker that is shutting down."""
+    redis.hdel(PIPELINE_KEY, name)
+
+
+def _pipelines(redis: Redis) -> list[dict]:
+    """Live pipeline workers, dropping any that stopped reporting."""
+    now = time.time()
+    live, stale = [], []
+    for name, raw in redis.hgetall(PIPELINE_KEY).items():
+        entry = json.loads(raw)
+        if now - entry["ts"] > PIPELINE_STALE_AFTER:
+            stale.append(name)
+        else:
+            live.append(entry)
+    if stale:
+        redis.hdel(PIPELINE_KEY, *stale)
+    return live
+
+
+class Slots:
+    """
+    Room for more jobs on each lane's RQ queue, per queue shard.
+
+    Each idle worker (or free pipeline download slot) is counted once, even
+    when it polls several lanes. Queued jobs are first matched to the idle
+    workers that will take them, each worker taking from the first of its
+    lanes with a job waiting, as RQ does. The workers left over count
+    towards every lane they poll, until a job dispatched to one of those
+    lanes uses them up. On top of that, each lane may hold DISPATCH_DEPTH
+    jobs that no idle worker is free for yet.
+    """
+
+    def __init__(self, pipelines: list[dict]):
+        lanes = [*LANES, PREFETCH_LANE]
+        self.unmatched: dict[str, list[int]] = {lane: [] for lane in lanes}
+        self.idle: list[list[tuple[str, ...]]] = []  # Per shard: lanes of each free worker
+
+        for shard, connection in enumerate(queue_connections()):
+            queued = {lane: Queue(lane, connection=connection).count for lane in lanes}
+            workers = [
+                tuple(worker.queue_names())
+                for worker in Worker.all(connection=connection)
+                if worker.state == WorkerStatus.IDLE
+            ]
+            for entry in pipelines:
+                if entry.get("shard", 0) == shard:
+                    workers += [tuple(entry["lanes"])] * entry["free"]
+
+            idle = []
+            for polled in workers:
+                lane = next((lane for lane in polled if queued.get(lane)), None)
+                if lane:
+                    queued[lane] -= 1
+                else:
+                    idle.append(polled)
+            self.idle.append(idle)
+            for lane in lanes:
+                self.unmatched[lane].append(queued[lane])
+
+    @property
+    def shards(self) -> int:
+        """Number of queue shards."""
+        return len(self.idle)
+
+    def idle_for(self, lane: str, shard: int) -> int:
+        """Free workers on a shard that poll a lane."""
+        return sum(1 for polled in self.idle[shard] if lane in polled)
+
+    def free(self, lane: str, shard: int) -> int:
+        """Jobs a lane's queue on one shard can take."""
+        return self.idle_for(lane, shard) + settings.dispatch_depth - self.unmatched[lane][shard]
+
+    def best_shard(self, lane: str) -> int | None:
+        """The shard with the most room for a lane, or None if it is full everywhere."""
+        shard = max(range(self.shards), key=lambda shard: self.free(lane, shard))
+        return shard if self.free(lane, shard) > 0 else None
+
+    def take(self, lane: str, shard: int) -> None:
+        """Account for a job put on a lane's queue on a shard."""
+        polling = [polled for polled in self.idle[shard] if lane in polled]
+        if polling:
+            # Use up the least flexible worker, keeping others for more lanes
+            self.idle[shard].remove(min(polling, key=len))
+        else:
+            self.unmatched[lane][shard] += 1
+
+    def shortage(self) -> int:
+        """Jobs queued on the tenant lanes with no idle worker to take them."""
+        return sum(max(count, 0) for lane in LANES for count in self.unmatched[lane])
+
+
+def _next_job(redis: Redis, tenant: str, slots: Slots) -> tuple[str | None, str]:
+    """A tenant's first waiting job whose lane has a free slot on some shard, and that lane."""
+    for job_id in redis.zrange(queue_key(tenant), 0, LOOKAHEAD - 1):
+        job_data = get_job_data(redis, job_id)
+        lane = job_lane(job_data) if job_data else DEFAULT_LANE
+        if slots.best_shard(lane) is not None:
+            return job_id, lane
+    return None, DEFAULT_LANE
+
+
+def dispatch(redis: Redis) -> int:
+    """
+    Move jobs from tenant queues to RQ by deficit round-robin.
+
+    Each tenant's smallest-scored job goes next, or the first of its next
+    LOOKAHEAD jobs whose lane has room. A tenant with nothing that fits is
+    passed over, keeping its credit, until a slot opens.
+    Only one caller dispatches at a time; others return immediately. The
+    lock is renewed before each tenant's turn, and a pass that lost it
+    stops rather than race the dispatcher that took it over.
+
+    Returns:
+        Number of jobs dispatched
+    """
+    token = uuid.uuid4().hex
+    if not redis.set(LOCK_KEY, token, nx=True, px=LOCK_TTL_MS):
+        return 0
+
+    try:
+        slots = Slots(_pipelines(redis))
+        dispatched = 0
+        if any(slots.best_shard(lane) is not None for lane in LANES):
+            dispatched = _dispatch_tenants(redis, slots, token)
+        if prefetch.enabled() and _renew_lock(redis, token):
+            _balance_prefetch(redis, slots)
+        return dispatched
+    finally:
+        _release_lock(redis, token)
+
+
+def _renew_lock(redis: Redis, token: str) -> bool:
+    """Extend the dispatch lock if it is still ours; False once it expired and moved on."""
+
+    def renew(pipe: Pipeline) -> bool:
+        if pipe.get(LOCK_KEY) != token:
+            return False
+        pipe.multi()
+        pipe.pexpire(LOCK_KEY, LOCK_TTL_MS)
+        return True
+
+    return redis.transaction(renew, LOCK_KEY, value_from_callable=True)
+
+
+def _release_lock(redis: Redis, token: str) -> None:
+    """Release the dispatch lock if it is still ours, not a later holder's after expiry."""
+
+    def release(pipe: Pipeline) -> None:
+        if pipe.get(LOCK_KEY) == token:
+            pipe.multi()
+            pipe.delete(LOCK_KEY)
+
+    redis.transaction(release, LOCK_KEY)
+
+
+def _dispatch_tenants(redis: Redis, slots: Slots, token: str) -> int:
+    """Deficit round-robin over the active tenants, using up `slots` as jobs are enqueued."""
+    # Configured tenants are checked directly too, in case a submit raced
+    # with a tenant being marked idle
+    configured = tenants()
+    pipe = redis.pipeline()
+    for name in configured:
+        pipe.zcard(queue_key(name))
+    waiting = {name for name, length in zip(configured, pipe.execute()) if length}
+    active = sorted(redis.smembers(ACTIVE_KEY) | waiting)
+    if not active:
+        return 0
+
+    deficits = {name: float(value) for name, value in redis.hgetall(DEFICIT_KEY).items()}
+    cursor = redis.get(CURSOR_KEY)
+    i = active.index(cursor) if cursor in active else 0
+
+    dispatched = 0
+    blocked = 0  # Tenants in a row whose next job has no free lane
+    lost = False
+    while active and blocked < len(active):
+        if not _renew_lock(redis, token):
+            # Another dispatcher may be running; our credit and cursor are stale
+            logger.warning("Dispatch lock expired mid-pass, stopping")
+            lost = True
+            break
+        i %= len(active)
+        tenant = active[i]
+
+        # A new turn earns the tenant its weight in credit
+        if deficits.get(tenant, 0.0) < 1:
+            weight = configured[tenant].weight if tenant in configured else 1.0
+            deficits[tenant] = deficits.get(tenant, 0.0) + weight
+
+        while deficits[tenant] >= 1:
+            job_id, lane = _next_job(redis, tenant, slots)
+            if job_id is None:
+                break
+            shard = slots.best_shard(lane)
+            if not redis.zrem(queue_key(tenant), job_id):
+                # Taken by another dispatcher (or cancelled) since we looked
+                continue
+            enqueue_job(job_id, lane, shard)
+            deficits[tenant] -= 1
+            slots.take(lane, shard)
+            dispatched += 1
+
+        if not redis.zcard(queue_key(tenant)):
+            # Idle tenants don't bank credit
+            active.pop(i)
+            redis.srem(ACTIVE_KEY, tenant)
+            deficits.pop(tenant, None)
+            redis.hdel(DEFICIT_KEY, tenant)
+            blocked = 0
+        elif deficits[tenant] < 1:
+            i += 1
+            blocked = 0
+        else:
+            # Next job's lane is full; resume with this tenant next time
+            # unless someone else can use a free lane
+            i += 1
+            blocked += 1
+
+    if active and not lost:
+        redis.set(CURSOR_KEY, active[(i - blocked) % len(active)])
+    if deficits and not lost:
+        redis.hset(DEFICIT_KEY, mapping=deficits)
+    if dispatched:
+        redis.incr(SEQUENCE_KEY)
+        logger.info(f"Dispatched {dispatched} jobs")
+    return dispatched
+
+
+def _waiting_jobs(redis: Redis) -> int:
+    """Jobs in tenant queues, not yet dispatched to RQ."""
+    pipe = redis.pipeline()
+    for name in redis.smembers(ACTIVE_KEY) | set(tenants()):
+        pipe.zcard(queue_key(name))
+    return sum(pipe.execute())
+
+
+def _balance_prefetch(redis: Redis, slots: Slots) -> None:
+    """
+    Hand idle workers to prefetch jobs, or take them back for real ones.
+
+    Real jobs are short of workers when any wait in a tenant queue, or when
+    an RQ queue holds more jobs than it has idle workers; running prefetch
+    jobs are then preempted, one per missing worker. Otherwise each shard
+    gets prefetch jobs for its idle workers that poll the prefetch lane and
+    have no real job queued ahead of it, up to PREFETCH_MAX_JOBS in all.
+    """
+    shortage = _waiting_jobs(redis) + slots.shortage()
+    if shortage:
+        prefetch.preempt(redis, shortage)
+        return
+
+    for shard in range(slots.shards):
+        while (
+            slots.idle_for(PREFETCH_LANE, shard) > 0
+            and len(prefetch.running(redis)) < settings.prefetch_max_jobs
+        ):
+            if prefetch.launch(redis, shard) is None:
+                return
+            slots.take(PREFETCH_LANE, shard)
+
+
+def get_dispatch_sequence(redis: Redis) -> int:
+    """Counter that moves whenever queue positions may have changed."""
+    return int(redis.get(SEQUENCE_KEY) or 0)
+
+
+def record_job_seconds(redis: Redis, seconds: float) -> None:
+    """Fold a finished job's run time into the average used for estimates."""
+    previous = float(redis.get(JOB_SECONDS_KEY) or seconds)
+    redis.set(JOB_SECONDS_KEY, (1 - JOB_SECONDS_ALPHA) * previous + JOB_SECONDS_ALPHA * seconds)
+
+
+def _jobs_ahead(redis: Redis, tenant: str, position: int) -> int:
+    """
+    Jobs that will be dispatched before the one at `position` in a tenant queue.
+
+    The position is scaled by the tenant's share of dispatches among active
+    tenants, then added to what is already on the RQ queue.
+    """
+    configured = tenants()
+    weights = {
+        name: configured[name].weight if name in configured else 1.0
+        for name in redis.smembers(ACTIVE_KEY) | {tenant}
+    }
+    queued = sum(queue.count for queues in _rq_queues().values() for queue in queues)
+    return queued + math.ceil((position + 1) * sum(weights.values()) / weights[tenant]) - 1
+
+
+def _seconds_per_dispatch(redis: Redis) -> float:
+    """How often a worker frees up, from the average job time and worker count."""
+    job_seconds = float(redis.get(JOB_SECONDS_KEY) or DEFAULT_JOB_SECONDS)
+    workers = sum(Worker.count(connection=connection) for connection in queue_connections())
+    workers += sum(entry["size"] for entry in _pipelines(redis))
+    return job_seconds / max(workers, 1)
+
+
+def estimate_start(redis: Redis, job_id: str, tenant: str) -> tuple[int, datetime] | None:
+    """
+    Estimate a waiting job's place in line and when it will start.
+
+    Returns:
+        Tuple of (queue position, estimated start time), or None if the job
+        is not waiting in a tenant queue
+    """
+    position = redis.zrank(queue_key(tenant), job_id)
+    if position is None:
+        return None
+
+    ahead = _jobs_ahead(redis, tenant, position)
+    eta = datetime.now(UTC) + timedelta(seconds=ahead * _seconds_per_dispatch(redis))
+    return ahead + 1, eta
+
+
+def estimate_wait(redis: Redis, tenant: str) -> float:
+    """
+    Estimate how long a job submitted now by a tenant would wait to start.
+
+    Returns:
+        Seconds for the jobs ahead of it to drain; 0 with an empty queue
+    """
+    ahead = _jobs_ahead(redis, tenant, redis.zcard(queue_key(tenant)))
+    return ahead * _seconds_per_dispatch(redis)
@@ -0,0 +1,91 @@
+"""RAM staging for small downloads.
+
+Shorts and low-quality clips spend a noticeable share of their run time on
+disk I/O: the download is written under DOWNLOAD_DIR, rewritten by
+faststart, then read back for upload. When a job's expected output (video
+duration times a typical bitrate for its quality) is under
+MEMORY_STAGING_MAX_MB and the RAM-backed MEMORY_STAGING_DIR (tmpfs, e.g.
+/dev/shm) has room for it twice over, the whole work directory lives there
+instead and the upload reads straight from memory.
+
+Estimates can be wrong. A download that runs the tmpfs out of space is
+restarted on disk, and a finished file larger than the threshold is moved
+to disk before post-processing, so staging never costs a job its result.
+"""
+
+import errno
+import logging
+import shutil
+from pathlib import Path
+
+from ytdl.config import settings
+from ytdl.errors import DownloadError
+
+logger = logging.getLogger(__name__)
+
+# Typical muxed video + audio bitrate at each quality, in bytes per second
+BYTES_PER_SECOND = {
+    "480": 150_000,
+    "720": 320_000,
+    "1080": 650_000,
+    "best": 2_500_000,
+}
+
+HEADROOM = 2  # faststart writes a full copy next to the original
+
+
+def threshold() -> int:
+    """Largest output staged in memory, in bytes (0 = staging off)."""
+    return settings.memory_staging_max_mb * 1024 * 1024
+
+
+def estimate_size(job_data: dict) -> int | None:
+    """Expected output size in bytes, if the video duration is known."""
+    duration = job_data.get("duration")
+    if duration is None:
+        return None
+    return int(duration * BYTES_PER_SECOND.get(job_data["quality"], BYTES_PER_SECOND["best"]))
+
+
+def memory_dir(job_id: str, job_data: dict) -> Path | None:
+    """
+    Pick a RAM-backed work directory for a job, if it qualifies.
+
+    Streamed jobs stay on disk: the API tails their growing file from a
+    shared volume, and the tmpfs belongs to the worker alone.
+
+    Returns:
+        Directory for the job under MEMORY_STAGING_DIR, or None to use disk
+    """
+    limit = threshold()
+    if not limit or job_data.get("stream"):
+        return None
+    estimate = estimate_size(job_data)
+    if estimate is None or estimate > limit:
+        return None
+
+    root = Path(settings.memory_staging_dir)
+    try:
+        root.mkdir(parents=True, exist_ok=True)
+        free = shutil.disk_usage(root).free
+    except OSError as e:
+        logger.warning(f"Memory staging unavailable at {root}: {e}")
+        return None
+    if free < estimate * HEADROOM:
+        logger.info(f"Not enough room in {root} for job {job_id}; staging on disk")
+        return None
+    return root / job_id
+
+
+def out_of_space(error: Exception) -> bool:
+    """Whether an error means the staging filesystem filled up."""
+    if isinstance(error, OSError):
+        return error.errno == errno.ENOSPC
+    if isinstance(error, DownloadError):
+        return "no space left on device" in error.message.lower()
+    return False
+
+
+def too_large(path: Path) -> bool:
+    """Whether a staged file turned out bigger than the staging threshold."""
+    return path.stat().st_size > threshold()
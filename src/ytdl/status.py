@@ -0,0 +1,70 @@
+"""Job status responses, shared by the API and webhook deliveries."""
+
+from datetime import datetime
+
+from redis import Redis
+
+from ytdl import degrade
+from ytdl.errors import ERROR_MESSAGES, ErrorCode
+from ytdl.jobs import DEFAULT_TENANT
+from ytdl.models import JobProgress, JobStatus, JobStatusResponse, ProgressStage, Quality
+from ytdl.scheduler import estimate_start
+
+
+def build_status_response(job_data: dict, redis: Redis | None = None) -> JobStatusResponse:
+    """
+    Build the status response for a job record.
+
+    Args:
+        job_data: The job record
+        redis: Redis connection, to estimate when a waiting job will start
+    """
+    response = JobStatusResponse(
+        job_id=job_data["job_id"],
+        status=JobStatus(job_data["status"]),
+    )
+    if "created_at" in job_data:
+        response.created_at = datetime.fromisoformat(job_data["created_at"])
+
+    # Add progress info if running
+    if job_data["status"] == JobStatus.RUNNING.value and "progress" in job_data:
+        response.progress = JobProgress(
+            stage=ProgressStage(job_data["progress"]["stage"]),
+            pct=job_data["progress"]["pct"],
+        )
+
+    # Add stream URL once the worker has a growing file
+    if job_data["status"] == JobStatus.RUNNING.value:
+        response.stream_url = job_data.get("stream_url")
+
+    # Report the quality actually fetched, and what was asked for if it was lowered
+    if "quality" in job_data:
+        response.quality = Quality(job_data["quality"])
+    if degrade.degraded(job_data):
+        response.requested_quality = Quality(job_data["requested_quality"])
+
+    # Add download URL if done
+    if job_data["status"] == JobStatus.DONE.value:
+        response.download_url = job_data.get("download_url")
+        if "expires_at" in job_data:
+            response.expires_at = datetime.fromisoformat(job_data["expires_at"])
+        response.filename = job_data.get("filename")
+
+    # Add retry info once a job has failed at least one attempt
+    if job_data.get("attempts"):
+        response.attempts = job_data["attempts"]
+    if job_data["status"] == JobStatus.QUEUED.value and job_data.get("next_retry_at"):
+        response.next_retry_at = datetime.fromisoformat(job_data["next_retry_at"])
+        response.error_code = ErrorCode(job_data["error_code"])
+        response.message = job_data.get("message")
+    elif job_data["status"] == JobStatus.QUEUED.value and redis is not None:
+        estimate = estimate_start(redis, job_data["job_id"], job_data.get("tenant", DEFAULT_TENANT))
+        if estimate:
+            response.queue_position, response.estimated_start_at = estimate
+
+    # Add error info if failed
+    if job_data["status"] == JobStatus.ERROR.value:
+        response.error_code = ErrorCode(job_data.get("error_code", ErrorCode.INTERNAL_ERROR))
+        response.message = job_data.get("message", ERROR_MESSAGES[response.error_code])
+
+    return response
@@ -1,11 +1,21 @@
 """Storage operations for both local and Cloudflare R2."""
 
+import hashlib
+import hmac
 import logging
 import shutil
-from datetime import datetime, timedelta, timezone
+import tempfile
+import time
+from datetime import UTC, datetime, timedelta
 from pathlib import Path
+from urllib.parse import quote
 
+from redis import Redis
+from redis.exceptions import RedisError
+
+from ytdl import cache
 from ytdl.config import StorageMode, settings
+from ytdl.connections import get_redis
 from ytdl.errors import UploadError
 
 logger = logging.getLogger(__name__)
@@ -37,7 +47,7 @@ def _upload_local(local_path: Path, object_key: str) -> str:
 
 def _generate_local_url(object_key: str, expiry_minutes: int) -> tuple[str, datetime]:
     """Generate URL for local file download."""
-    expires_at = datetime.now(timezone.utc) + timedelta(minutes=expiry_minutes)
+    expires_at = datetime.now(UTC) + timedelta(minutes=expiry_minutes)
     url = f"{settings.base_url.rstrip('/')}/downloads/{object_key}"
     return url, expires_at
 
@@ -96,7 +106,7 @@ def _generate_r2_url(object_key: str, expiry_minutes: int) -> tuple[str, datetim
     from botocore.exceptions import ClientError
 
     client = _get_r2_client()
-    expires_at = datetime.now(timezone.utc) + timedelta(minutes=expiry_minutes)
+    expires_at = datetime.now(UTC) + timedelta(minutes=expiry_minutes)
 
     try:
         if settings.r2_public_url:
@@ -117,6 +127,12 @@ def _generate_r2_url(object_key: str, expiry_minutes: int) -> tuple[str, datetim
         raise UploadError(f"Failed to generate download URL: {e}") from e
 
 
+def _download_r2(object_key: str, local_path: Path) -> None:
+    """Download an object from R2."""
+    client = _get_r2_client()
+    client.download_file(settings.r2_bucket_name, object_key, str(local_path))
+
+
 def _delete_r2(object_key: str) -> None:
     """Delete file from R2."""
     from botocore.exceptions import ClientError
@@ -129,6 +145,54 @@ def _delete_r2(object_key: str) -> None:
         logger.warning(f"Failed to delete {object_key} from R2: {e}")
 
 
+# --- Cache tier ---
+
+
+def _sign(object_key: str, expires: int) -> str:
+    key = (settings.url_signing_key or settings.api_token).encode()
+    return hmac.new(key, f"{object_key}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+def _generate_cached_url(object_key: str, expiry_minutes: int) -> tuple[str, datetime]:
+    """Generate a signed URL for the API's /files endpoint, which serves from the cache."""
+    expires_at = datetime.now(UTC) + timedelta(minutes=expiry_minutes)
+    expires = int(expires_at.timestamp())
+    url = (
+        f"{settings.base_url.rstrip('/')}/files/{quote(object_key)}"
+        f"?expires={expires}&sig={_sign(object_key, expires)}"
+    )
+    return url, expires_at
+
+
+def verify_signature(object_key: str, expires: int, signature: str) -> bool:
+    """Check a /files URL signature and that it has not expired."""
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(_sign(object_key, expires), signature)
+
+
+def generate_origin_url(object_key: str) -> str:
+    """URL of an object in R2 itself, for cache misses."""
+    url, _ = _generate_r2_url(object_key, settings.url_expiry_minutes)
+    return url
+
+
+def warm_cache(redis: Redis, object_key: str) -> None:
+    """Fetch an object from R2 into the node's cache."""
+    path = cache.cache_path(object_key)
+    if path is None:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=path.parent, prefix=".fill-") as tmp_dir:
+        tmp_path = Path(tmp_dir) / "object"
+        try:
+            _download_r2(object_key, tmp_path)
+        except Exception as e:
+            logger.warning(f"Failed to fetch {object_key} into cache: {e}")
+            return
+        cache.put(redis, tmp_path, object_key, move=True)
+
+
 # --- Public API ---
 
 
@@ -147,12 +211,21 @@ def upload_file(local_path: Path, object_key: str) -> str:
         UploadError: If upload fails
     """
     if settings.storage_mode == StorageMode.R2:
-        return _upload_r2(local_path, object_key)
+        _upload_r2(local_path, object_key)
+        if cache.enabled():
+            # The object is safely in R2; a full or broken cache must not fail the job
+            try:
+                cache.put(get_redis(), local_path, object_key)
+            except (OSError, RedisError) as e:
+                logger.warning(f"Failed to cache {object_key} after upload: {e}")
+        return object_key
     else:
         return _upload_local(local_path, object_key)
 
 
-def generate_presigned_url(object_key: str, expiry_minutes: int | None = None) -> tuple[str, datetime]:
+def generate_presigned_url(
+    object_key: str, expiry_minutes: int | None = None
+) -> tuple[str, datetime]:
     """
     Generate a URL for downloading a file.
 
@@ -166,6 +239,8 @@ def generate_presigned_url(object_key: str, expiry_minutes: int | None = None) -
     if expiry_minutes is None:
         expiry_minutes = settings.url_expiry_minutes
 
+    if cache.enabled():
+        return _generate_cached_url(object_key, expiry_minutes)
     if settings.storage_mode == StorageMode.R2:
         return _generate_r2_url(object_key, expiry_minutes)
     else:
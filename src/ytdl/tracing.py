@@ -0,0 +1,164 @@
+"""Per-job stage timings, waterfall view and OpenTelemetry span export.
+
+Workers record stage offsets (from time.monotonic()) relative to the moment
+they picked up the job, plus the wall-clock start time. The waterfall puts the
+queue wait first and shifts worker stages after it, so every stage is an
+offset from the job's created_at.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+from datetime import UTC, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+from ytdl.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def build_waterfall(job_data: dict) -> list[dict]:
+    """
+    Build the stage waterfall for a job.
+
+    Returns:
+        List of {"stage", "start", "end"} dicts, in seconds since created_at
+    """
+    created_at = datetime.fromisoformat(job_data["created_at"])
+    started_at = job_data.get("started_at")
+    if started_at:
+        queue_end = (datetime.fromisoformat(started_at) - created_at).total_seconds()
+    else:
+        queue_end = (datetime.now(UTC) - created_at).total_seconds()
+
+    waterfall = [{"stage": "queue", "start": 0.0, "end": max(queue_end, 0.0)}]
+    for timing in job_data.get("timings", []):
+        waterfall.append(
+            {
+                "stage": timing["stage"],
+                "start": queue_end + timing["start"],
+                "end": queue_end + timing["end"],
+            }
+        )
+    return waterfall
+
+
+def _span_id(job_id: str, name: str) -> str:
+    """Derive a stable 8-byte span ID from the job and span name."""
+    return hashlib.sha256(f"{job_id}:{name}".encode()).hexdigest()[:16]
+
+
+def _attribute(key: str, value: str) -> dict:
+    return {"key": key, "value": {"stringValue": value}}
+
+
+def build_spans(job_data: dict) -> dict:
+    """
+    Convert a job's waterfall to an OTLP/JSON ExportTraceServiceRequest.
+
+    The job ID (a UUID) doubles as the trace ID; stages are children of a
+    root "job" span covering the whole waterfall.
+    """
+    job_id = job_data["job_id"]
+    trace_id = job_id.replace("-", "")
+    created_ns = int(datetime.fromisoformat(job_data["created_at"]).timestamp() * 1e9)
+    waterfall = build_waterfall(job_data)
+    root_id = _span_id(job_id, "job")
+
+    def span(name: str, start: float, end: float, span_id: str, parent: str | None) -> dict:
+        data = {
+            "traceId": trace_id,
+            "spanId": span_id,
+            "name": name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(created_ns + int(start * 1e9)),
+            "endTimeUnixNano": str(created_ns + int(end * 1e9)),
+            "attributes": [_attribute("ytdl.job_id", job_id)],
+        }
+        if parent:
+            data["parentSpanId"] = parent
+        return data
+
+    end = max(stage["end"] for stage in waterfall)
+    root = span("job", 0.0, end, root_id, None)
+    root["attributes"] += [
+        _attribute("ytdl.quality", job_data.get("quality", "")),
+        _attribute("ytdl.status", job_data.get("status", "")),
+    ]
+    # Stages can repeat (e.g. extract again after a Cobalt fallback)
+    spans = [root]
+    for i, stage in enumerate(waterfall):
+        span_id = _span_id(job_id, f"{i}:{stage['stage']}")
+        spans.append(span(stage["stage"], stage["start"], stage["end"], span_id, root_id))
+
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [_attribute("service.name", "ytdl")]},
+                "scopeSpans": [{"scope": {"name": "ytdl.tracing"}, "spans": spans}],
+            }
+        ]
+    }
+
+
+def export_spans(job_data: dict) -> None:
+    """Send a job's spans to the configured OTLP/HTTP collector, if any."""
+    if not settings.otlp_traces_url:
+        return
+
+    try:
+        response = httpx.post(settings.otlp_traces_url, json=build_spans(job_data), timeout=5.0)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.warning(f"Failed to export spans for job {job_data['job_id']}: {e}")
+
+
+def serve_collector(port: int, output: Path) -> None:
+    """
+    Run a minimal OTLP/HTTP (JSON) collector stand-in for offline use.
+
+    Accepts POST /v1/traces and appends each request body as a JSON line.
+    """
+
+    class CollectorHandler(BaseHTTPRequestHandler):
+        def do_POST(self):  # noqa: N802
+            if self.path != "/v1/traces":
+                self.send_error(404)
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            payload = json.loads(body)
+            with open(output, "a") as f:
+                f.write(json.dumps(payload) + "\n")
+
+            for resource_spans in payload.get("resourceSpans", []):
+                for scope_spans in resource_spans.get("scopeSpans", []):
+                    for span in scope_spans.get("spans", []):
+                        duration_ms = (
+                            int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])
+                        ) / 1e6
+                        logger.info(f"{span['traceId']} {span['name']}: {duration_ms:.0f} ms")
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), CollectorHandler)
+    logger.info(f"Collecting spans on :{port}/v1/traces into {output}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Local OTLP/HTTP collector stand-in")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--output", type=Path, default=Path("spans.jsonl"))
+    args = parser.parse_args()
+    serve_collector(args.port, args.output)
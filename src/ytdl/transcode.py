@@ -0,0 +1,247 @@
+"""Parallel H.264/AAC transcode for sources iPhones cannot play.
+
+yt-dlp's format_sort only prefers H.264/AAC; when a video exists only as
+VP9/AV1 or Opus, the merged MP4 will not play on iOS. Re-encoding a long
+video on one core takes far longer than the download, so the video track
+is split at keyframes (stream copy), the segments are encoded concurrently
+by one ffmpeg process each, and the results are concatenated without
+re-encoding. The audio track is encoded alongside the segments.
+
+Progress comes from ffmpeg's -progress output, summed across segments.
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from ytdl.config import settings
+from ytdl.errors import DownloadError, ErrorCode
+
+logger = logging.getLogger(__name__)
+
+# Codecs iOS plays natively from MP4
+COMPATIBLE_VIDEO = {"h264", "hevc"}
+COMPATIBLE_AUDIO = {"aac", "mp3", "alac"}
+
+STDERR_TAIL = 2000  # Characters of ffmpeg stderr kept for error logs
+
+
+def probe_streams(path: Path) -> tuple[str | None, str | None, float]:
+    """
+    Read codecs and duration with ffprobe.
+
+    Returns:
+        Tuple of (video codec, audio codec, duration in seconds); codecs are
+        None for missing tracks
+    """
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-show_entries", "stream=codec_type,codec_name:format=duration",
+        "-of", "default=noprint_wrappers=1",
+        str(path),
+    ]  # fmt: skip
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise DownloadError(ErrorCode.TRANSCODE_FAILED, f"ffprobe failed: {result.stderr}")
+
+    video = audio = None
+    duration = 0.0
+    codec = None
+    for line in result.stdout.splitlines():
+        key, _, value = line.partition("=")
+        if key == "codec_name":
+            codec = value
+        elif key == "codec_type" and value == "video" and video is None:
+            video = codec
+        elif key == "codec_type" and value == "audio" and audio is None:
+            audio = codec
+        elif key == "duration" and value not in ("", "N/A"):
+            duration = float(value)
+    return video, audio, duration
+
+
+def _run_ffmpeg(cmd: list[str], on_progress: Callable[[float], None] | None = None) -> None:
+    """
+    Run ffmpeg, reporting seconds of output written as it goes.
+
+    stderr goes to a temporary file rather than a pipe, so a chatty ffmpeg
+    can never block on a full pipe while we read progress from stdout. If
+    on_progress raises (or the thread is interrupted), ffmpeg is killed
+    before the exception propagates.
+    """
+    cmd = [cmd[0], "-nostats", "-loglevel", "error", "-progress", "pipe:1", *cmd[1:]]
+    with tempfile.TemporaryFile(mode="w+") as stderr:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, text=True)
+        try:
+            for line in process.stdout:
+                key, _, value = line.strip().partition("=")
+                if key == "out_time_us" and value.isdigit() and on_progress:
+                    on_progress(int(value) / 1_000_000)
+            process.wait()
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        if process.returncode != 0:
+            stderr.seek(0)
+            message = stderr.read()[-STDERR_TAIL:]
+            logger.error(f"ffmpeg failed: {message}")
+            raise DownloadError(ErrorCode.TRANSCODE_FAILED, "ffmpeg transcode failed")
+
+
+class _Progress:
+    """Sum of per-task ffmpeg progress, reported as a percentage."""
+
+    def __init__(self, total: float, callback: Callable[[str, int], None] | None):
+        self.total = total
+        self.callback = callback
+        self.done: dict[str, float] = {}
+        self.last_pct = -1
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def tracker(self, name: str) -> Callable[[float], None]:
+        def update(seconds: float) -> None:
+            if self.stopped.is_set():
+                # Another task failed: stop this ffmpeg too
+                raise DownloadError(ErrorCode.TRANSCODE_FAILED, "Transcode stopped")
+            with self.lock:
+                self.done[name] = seconds
+                pct = min(int(sum(self.done.values()) * 100 / self.total), 99)
+                if self.callback and pct != self.last_pct:
+                    self.last_pct = pct
+                    self.callback("processing", pct)
+
+        return update
+
+
+def _encode_audio(source: Path, output: Path, progress: Callable[[float], None]) -> None:
+    _run_ffmpeg(
+        ["ffmpeg", "-i", str(source), "-vn", "-c:a", "aac", "-b:a", "160k", "-y", str(output)],
+        progress,
+    )
+
+
+def _encode_segment(
+    segment: Path, output: Path, threads: int, progress: Callable[[float], None]
+) -> None:
+    cmd = [
+        "ffmpeg",
+        "-i", str(segment),
+        "-an",
+        "-c:v", "libx264",
+        "-preset", settings.transcode_preset,
+        "-crf", str(settings.transcode_crf),
+        "-pix_fmt", "yuv420p",
+        "-threads", str(threads),
+        "-y",
+        str(output),
+    ]  # fmt: skip
+    _run_ffmpeg(cmd, progress)
+
+
+def transcode(
+    path: Path,
+    progress_callback: Callable[[str, int], None] | None = None,
+) -> Path:
+    """
+    Re-encode a file to H.264/AAC if iOS cannot play it as is.
+
+    Only the incompatible tracks are re-encoded; a compatible track is
+    copied. The result replaces the original file.
+
+    Args:
+        path: MP4 (or other container) file to check
+        progress_callback: Optional callback(stage, percentage)
+
+    Returns:
+        Path to the playable MP4 file
+    """
+    video, audio, duration = probe_streams(path)
+    encode_video = video is not None and video not in COMPATIBLE_VIDEO
+    encode_audio = audio is not None and audio not in COMPATIBLE_AUDIO
+    if not encode_video and not encode_audio:
+        return path
+
+    logger.info(f"Transcoding {path} (video: {video}, audio: {audio})")
+    workers = settings.transcode_workers or os.cpu_count() or 1
+    output = path.with_suffix(".mp4")
+    work_dir = Path(tempfile.mkdtemp(prefix="transcode-", dir=path.parent))
+
+    try:
+        segments: list[Path] = []
+        if encode_video:
+            # Stream copy can only cut at keyframes, which is what we want
+            _run_ffmpeg([
+                "ffmpeg",
+                "-i", str(path),
+                "-map", "0:v:0",
+                "-c", "copy",
+                "-f", "segment",
+                "-segment_time", str(settings.transcode_segment_seconds),
+                "-reset_timestamps", "1",
+                str(work_dir / "source%05d.mkv"),
+            ])  # fmt: skip
+            segments = sorted(work_dir.glob("source*.mkv"))
+
+        # Each task's progress counts against the video duration once, plus
+        # the audio track once
+        progress = _Progress(
+            duration * (int(encode_video) + int(encode_audio)) or 1.0, progress_callback
+        )
+        audio_file = work_dir / "audio.m4a"
+        encoded = [segment.with_name(f"encoded{i:05d}.mp4") for i, segment in enumerate(segments)]
+        threads = max(1, (os.cpu_count() or 1) // max(min(workers, len(segments)), 1))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = []
+            if encode_audio:
+                futures.append(
+                    pool.submit(_encode_audio, path, audio_file, progress.tracker("audio"))
+                )
+            for i, (segment, target) in enumerate(zip(segments, encoded, strict=True)):
+                futures.append(
+                    pool.submit(_encode_segment, segment, target, threads, progress.tracker(str(i)))
+                )
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                # Don't start the remaining tasks, and stop the running ones
+                progress.stopped.set()
+                for future in futures:
+                    future.cancel()
+                raise
+
+        # Join the encoded segments losslessly and mux with the audio
+        concat_list = work_dir / "segments.txt"
+        concat_list.write_text("".join(f"file '{target.name}'\n" for target in encoded))
+        cmd = ["ffmpeg"]
+        if encode_video:
+            cmd += ["-f", "concat", "-safe", "0", "-i", str(concat_list)]
+        else:
+            cmd += ["-i", str(path)]
+        cmd += ["-i", str(audio_file) if encode_audio else str(path)]
+        cmd += ["-map", "0:v:0?"]
+        if audio is not None:
+            cmd += ["-map", "1:a:0"]
+        cmd += ["-c", "copy", "-movflags", "+faststart", "-y", str(work_dir / "output.mp4")]
+        _run_ffmpeg(cmd)
+
+        os.replace(work_dir / "output.mp4", output)
+        if output != path:
+            path.unlink(missing_ok=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if progress_callback:
+        progress_callback("processing", 100)
+    logger.info(f"Transcode complete: {output}")
+    return output
@@ -0,0 +1,213 @@
+"""Completion webhooks, delivered off the download workers.
+
+Clients that cannot hold a long-poll can pass callback_url when creating a
+job. When the job reaches done or error, the write that records the final
+status also adds the job to webhooks:pending (see ytdl.jobs), so workers
+never make the HTTP call themselves and a slow receiver cannot hold up a
+download.
+
+The API runs a dispatcher that claims due notifications in batches and
+POSTs the job's status (the same body as GET /jobs/{id}) over a pooled
+HTTP client, with at most WEBHOOK_CONCURRENCY deliveries in flight.
+Each request carries an HMAC-SHA256 signature keyed with the tenant's
+API token:
+
+    X-Ytdl-Timestamp: <unix time>
+    X-Ytdl-Signature: sha256=<hex HMAC of "<timestamp>.<body>">
+
+The callback host is resolved before each delivery and the request is sent
+to the resolved address, so a name that points at a loopback, private or
+link-local address (or is changed to after validation) is never contacted.
+
+Failed deliveries (network errors, timeouts, 408, 429 and 5xx) are retried
+with exponential backoff until WEBHOOK_MAX_ATTEMPTS; other responses are
+final. Several API instances can run the dispatcher: whoever removes a job
+from the pending set delivers it.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import random
+import socket
+import time
+from urllib.parse import urlsplit
+
+import httpx
+from redis import Redis
+
+from ytdl.config import settings
+from ytdl.jobs import DEFAULT_TENANT, WEBHOOK_KEY, get_job_data
+from ytdl.metrics import inc
+from ytdl.models import is_public_address
+from ytdl.scheduler import tenants
+from ytdl.status import build_status_response
+
+logger = logging.getLogger(__name__)
+
+ATTEMPTS_KEY = "webhooks:attempts"  # Hash of job ID -> failed deliveries so far
+POLL_INTERVAL = 1.0  # Seconds between checks for due notifications
+
+RETRIABLE_STATUS = frozenset({408, 429})
+
+
+def sign(key: str, timestamp: int, body: bytes) -> str:
+    """HMAC-SHA256 signature of a webhook body, as sent in X-Ytdl-Signature."""
+    message = f"{timestamp}.".encode() + body
+    return "sha256=" + hmac.new(key.encode(), message, hashlib.sha256).hexdigest()
+
+
+def retry_delay(attempt: int) -> float:
+    """Seconds to wait after a failed delivery (1-based): exponential, with jitter."""
+    delay = min(
+        settings.webhook_retry_base_delay * 2 ** (attempt - 1), settings.webhook_retry_max_delay
+    )
+    return random.uniform(delay / 2, delay)
+
+
+async def resolve_public(url: str) -> tuple[str, dict]:
+    """
+    Resolve a callback URL's host and pin the request to a public address.
+
+    Returns:
+        The URL with its host replaced by the address, and the request
+        extensions that keep TLS checks on the original name
+
+    Raises:
+        ValueError: If the host resolves to any non-public address
+        OSError: If the host cannot be resolved
+    """
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    infos = await asyncio.get_running_loop().getaddrinfo(
+        parts.hostname, port, type=socket.SOCK_STREAM
+    )
+    addresses = [info[4][0] for info in infos]
+    blocked = [address for address in addresses if not is_public_address(address)]
+    if blocked:
+        raise ValueError(f"{parts.hostname} resolves to non-public address {blocked[0]}")
+
+    address = addresses[0]
+    userinfo, at, _ = parts.netloc.rpartition("@")
+    netloc = f"[{address}]:{port}" if ":" in address else f"{address}:{port}"
+    return parts._replace(netloc=userinfo + at + netloc).geturl(), {"sni_hostname": parts.hostname}
+
+
+def claim_due(redis: Redis, limit: int) -> list[str]:
+    """
+    Take up to `limit` notifications that are due for delivery.
+
+    Returns:
+        Job IDs this caller now owns
+    """
+    claimed = []
+    for job_id in redis.zrangebyscore(WEBHOOK_KEY, 0, time.time(), start=0, num=limit):
+        if redis.zrem(WEBHOOK_KEY, job_id):
+            claimed.append(job_id)
+    return claimed
+
+
+def _finish(redis: Redis, job_id: str, result: str) -> None:
+    redis.hdel(ATTEMPTS_KEY, job_id)
+    inc(redis, "ytdl_webhooks_total", result=result)
+
+
+def _retry(redis: Redis, job_id: str, reason: str) -> None:
+    """Schedule another delivery, or give up after WEBHOOK_MAX_ATTEMPTS."""
+    attempts = redis.hincrby(ATTEMPTS_KEY, job_id, 1)
+    if attempts >= settings.webhook_max_attempts:
+        logger.warning(f"Giving up on webhook for job {job_id} after {attempts} attempts: {reason}")
+        _finish(redis, job_id, "failed")
+        return
+
+    delay = retry_delay(attempts)
+    logger.info(f"Webhook for job {job_id} failed ({reason}), retrying in {delay:.0f}s")
+    redis.zadd(WEBHOOK_KEY, {job_id: time.time() + delay})
+    inc(redis, "ytdl_webhooks_total", result="retried")
+
+
+async def deliver(client: httpx.AsyncClient, redis: Redis, job_id: str) -> None:
+    """POST a job's final status to its callback_url."""
+    try:
+        job_data = await asyncio.to_thread(get_job_data, redis, job_id)
+        if not job_data or not job_data.get("callback_url"):
+            # Expired before we got to it
+            await asyncio.to_thread(_finish, redis, job_id, "dropped")
+            return
+
+        tenant = tenants().get(job_data.get("tenant", DEFAULT_TENANT))
+        body = build_status_response(job_data).model_dump_json().encode()
+        timestamp = int(time.time())
+        headers = {
+            "Content-Type": "application/json",
+            "Host": urlsplit(job_data["callback_url"]).netloc.rpartition("@")[2],
+            "X-Ytdl-Timestamp": str(timestamp),
+            "X-Ytdl-Signature": sign(tenant.token if tenant else "", timestamp, body),
+        }
+
+        try:
+            url, extensions = await resolve_public(job_data["callback_url"])
+        except ValueError as e:
+            logger.warning(f"Refusing webhook for job {job_id}: {e}")
+            await asyncio.to_thread(_finish, redis, job_id, "blocked")
+            return
+        except OSError as e:
+            await asyncio.to_thread(_retry, redis, job_id, f"DNS: {e}")
+            return
+
+        try:
+            response = await client.post(url, content=body, headers=headers, extensions=extensions)
+        except httpx.HTTPError as e:
+            await asyncio.to_thread(_retry, redis, job_id, type(e).__name__)
+            return
+
+        if response.is_success:
+            logger.info(f"Delivered webhook for job {job_id}")
+            await asyncio.to_thread(_finish, redis, job_id, "delivered")
+        elif response.status_code in RETRIABLE_STATUS or response.status_code >= 500:
+            await asyncio.to_thread(_retry, redis, job_id, f"HTTP {response.status_code}")
+        else:
+            logger.warning(f"Webhook for job {job_id} rejected with HTTP {response.status_code}")
+            await asyncio.to_thread(_finish, redis, job_id, "rejected")
+    except Exception as e:
+        logger.error(f"Webhook delivery for job {job_id} failed: {e}")
+    except asyncio.CancelledError:
+        # Shutting down mid-delivery; hand the notification back
+        redis.zadd(WEBHOOK_KEY, {job_id: time.time()})
+        raise
+
+
+async def run_dispatcher(redis: Redis) -> None:
+    """Deliver due webhooks, keeping up to WEBHOOK_CONCURRENCY in flight."""
+    limits = httpx.Limits(
+        max_connections=settings.webhook_concurrency,
+        max_keepalive_connections=settings.webhook_concurrency,
+    )
+    in_flight: set[asyncio.Task] = set()
+    async with httpx.AsyncClient(timeout=settings.webhook_timeout, limits=limits) as client:
+        try:
+            while True:
+                free = settings.webhook_concurrency - len(in_flight)
+                if free > 0:
+                    try:
+                        job_ids = await asyncio.to_thread(claim_due, redis, free)
+                    except Exception as e:
+                        logger.error(f"Webhook dispatch pass failed: {e}")
+                        job_ids = []
+                    for job_id in job_ids:
+                        task = asyncio.create_task(deliver(client, redis, job_id))
+                        in_flight.add(task)
+                        task.add_done_callback(in_flight.discard)
+
+                # Claim more as soon as a slot frees up, or poll for new work
+                if in_flight:
+                    await asyncio.wait(
+                        in_flight, timeout=POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED
+                    )
+                else:
+                    await asyncio.sleep(POLL_INTERVAL)
+        finally:
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
@@ -1,20 +1,38 @@
 """RQ worker for processing download jobs."""
 
-import json
 import logging
+import os
 import shutil
-import uuid
-from datetime import datetime, timezone
+import signal
+import threading
+import time
+from datetime import UTC, datetime
 from pathlib import Path
 
 from redis import Redis
+from rq import Worker as RQWorker
 
+from ytdl import degrade, prefetch, staging
+from ytdl.bandwidth import BandwidthShare, bandwidth_share
 from ytdl.cobalt import download_with_cobalt, should_fallback_to_cobalt
 from ytdl.config import settings
+from ytdl.connections import get_redis
 from ytdl.downloader import download_video
-from ytdl.errors import DownloadError, ErrorCode, YTDLError
+from ytdl.errors import DownloadError, ErrorCode, JobTimeoutError, YTDLError
+from ytdl.faststart import ensure_faststart
+from ytdl.fragments import FragmentTuner
+from ytdl.identities import leased_identity
+from ytdl.jobs import get_job_data, update_job
+from ytdl.metrics import inc, observe, timed_stage
+from ytdl.migrations import migrate_keys
 from ytdl.models import JobStatus, ProgressStage
+from ytdl.partials import claim_work_area, prune_partials
+from ytdl.reaper import cleanup_orphaned_work_dirs, heartbeat
+from ytdl.retries import fail_job
+from ytdl.scheduler import dispatch, record_job_seconds
 from ytdl.storage import generate_presigned_url, upload_file
+from ytdl.tracing import export_spans
+from ytdl.transcode import transcode
 
 logger = logging.getLogger(__name__)
 
@@ -25,32 +43,28 @@ logging.basicConfig(
 )
 
 
-def get_redis() -> Redis:
-    """Get Redis connection."""
-    return Redis.from_url(settings.redis_url, decode_responses=True)
+class Worker(RQWorker):
+    """RQ worker that first removes work directories left behind by a crash."""
 
-
-def get_job_data(redis: Redis, job_id: str) -> dict | None:
-    """Get job data from Redis."""
-    data = redis.get(f"job:{job_id}")
-    if data:
-        return json.loads(data)
-    return None
-
-
-def update_job(redis: Redis, job_id: str, **updates) -> None:
-    """Update job data in Redis."""
-    job_data = get_job_data(redis, job_id)
-    if job_data:
-        job_data.update(updates)
-        redis.setex(f"job:{job_id}", 86400, json.dumps(job_data, default=str))
+    def work(self, *args, **kwargs) -> bool:
+        redis = get_redis()
+        migrate_keys(redis)
+        removed = cleanup_orphaned_work_dirs(redis)
+        if removed:
+            logger.info(f"Removed {removed} orphaned work directories")
+        prune_partials(redis)
+        return super().work(*args, **kwargs)
 
 
 def process_job(job_id: str) -> None:
     """
     Process a download job.
 
-    This function is called by RQ worker.
+    This function is called by RQ worker. The job is heartbeated while it
+    runs so the reaper can recover it if this process dies, and downloads
+    into a resumable work area when one is free. Jobs that accept a lower
+    quality settle it first, from the load at this moment. Finishing a job
+    frees a worker, so the next tenant job is dispatched right away.
     """
     redis = get_redis()
     job_data = get_job_data(redis, job_id)
@@ -58,104 +72,359 @@ def process_job(job_id: str) -> None:
     if not job_data:
         logger.error(f"Job {job_id} not found")
         return
+    job_data = degrade.select_quality(redis, job_id, job_data)
 
-    url = job_data["url"]
-    quality = job_data["quality"]
+    started = time.monotonic()
+    with (
+        heartbeat(redis, job_id),
+        claim_work_area(
+            redis,
+            job_id,
+            job_data["url"],
+            job_data["quality"],
+            job_data.get("stream", False),
+        ) as work_area,
+        bandwidth_share(redis, job_id, background=bool(job_data.get("prefetch"))) as bandwidth,
+    ):
+        _run_job(redis, job_id, job_data, work_area, bandwidth)
+
+    record_job_seconds(redis, time.monotonic() - started)
+    dispatch(redis)
+    prune_partials(redis)
 
-    # Create temporary directory for this job
-    work_dir = Path(settings.download_dir) / job_id
-    work_dir.mkdir(parents=True, exist_ok=True)
 
+def _run_job(
+    redis: Redis,
+    job_id: str,
+    job_data: dict,
+    work_area: Path | None,
+    bandwidth: BandwidthShare | None,
+) -> None:
+    """Download, post-process and upload a job, recording the outcome."""
+    run = JobRun(redis, job_id, job_data, work_area, bandwidth)
     try:
-        # Update status to running
+        run.start()
+        run.download()
+        run.process()
+        run.upload()
+    except Exception as e:
+        run.fail(e)
+    finally:
+        run.finish()
+
+
+def _child_processes(paths: set[Path]) -> list[int]:
+    """PIDs of this process's children with one of `paths` on their command line (Linux only)."""
+    needles = [str(path) for path in paths]
+    pids = []
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            # "pid (comm) state ppid ...", where comm may itself contain ")"
+            ppid = int(stat.read_text().rsplit(")", 1)[1].split()[1])
+            if ppid != os.getpid():
+                continue
+            cmdline = (stat.parent / "cmdline").read_bytes().decode(errors="replace")
+        except (OSError, ValueError, IndexError):
+            continue
+        if any(needle in cmdline for needle in needles):
+            pids.append(int(stat.parent.name))
+    return pids
+
+
+class JobRun:
+    """
+    One attempt at a job, split into the stages of the worker pipeline.
+
+    process_job runs the stages back to back in one worker; the staged
+    pipeline (ytdl.pipeline) hands the same object between separate
+    download, processing and upload pools. Any stage may raise; fail()
+    records the error and finish() always runs last.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        job_id: str,
+        job_data: dict,
+        work_area: Path | None,
+        bandwidth: BandwidthShare | None,
+    ):
+        self.redis = redis
+        self.job_id = job_id
+        self.job_data = job_data
+        self.work_area = work_area
+        self.bandwidth = bandwidth
+
+        # Small jobs are staged in RAM; otherwise the resumable work area, or a
+        # temporary directory for this job
+        self.disk_dir = work_area or Path(settings.download_dir) / job_id
+        self.memory_dir = staging.memory_dir(job_id, job_data)
+        self.work_dir = self.memory_dir or self.disk_dir
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        if self.memory_dir:
+            logger.info(f"Staging job {job_id} in memory: {self.memory_dir}")
+            inc(redis, "ytdl_memory_staging_total", outcome="staged")
+
+        # Stage timings are offsets from this point; queue wait is derived from
+        # created_at and started_at when the waterfall is built
+        self.origin = time.monotonic()
+        self.started_at = datetime.now(UTC)
+        self.attempts = job_data.get("attempts", 0) + 1
+        # Set by the staged pipeline when a stage outlives its deadline
+        self.cancelled = threading.Event()
+
+        self.stage_durations: dict[str, float] = {}
+        self.timings: list[dict] = []
+        self.backend = "yt-dlp"
+        self.output_file: Path | None = None
+
+    def cancel(self) -> None:
+        """
+        Stop a run that was given up on.
+
+        Its ffmpeg and aria2c processes are killed, so the step blocked on
+        them fails right away; Python code stops at its next progress update.
+        """
+        self.cancelled.set()
+        paths = {self.work_dir, self.disk_dir, self.memory_dir, self.work_area} - {None}
+        for pid in _child_processes(paths):
+            logger.warning(f"Killing process {pid} of cancelled job {self.job_id}")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def _check_cancelled(self) -> None:
+        if self.cancelled.is_set():
+            raise JobTimeoutError(f"Job {self.job_id} was cancelled after its deadline")
+
+    def on_progress(self, stage: str, pct: int) -> None:
+        """Progress callback; a cancelled run or preempted prefetch stops here."""
+        self._check_cancelled()
+        if self.job_data.get("prefetch") and stage == ProgressStage.DOWNLOADING.value:
+            prefetch.check_preempted(self.redis, self.job_id)
+        update_job(self.redis, self.job_id, progress={"stage": stage, "pct": pct})
+
+    def on_file(self, path: Path) -> None:
+        """Expose the growing file so clients can start fetching before we finish."""
+        self._check_cancelled()
+        logger.info(f"Streaming {path} for job {self.job_id}")
         update_job(
-            redis,
-            job_id,
+            self.redis,
+            self.job_id,
+            stream_path=str(path),
+            stream_url=f"{settings.base_url.rstrip('/')}/jobs/{self.job_id}/stream",
+        )
+
+    def on_stage(self, stage: str, started: float, ended: float) -> None:
+        """Stage timing callback, shared by both download backends."""
+        self._check_cancelled()
+        self.stage_durations[stage] = ended - started
+        observe(self.redis, "ytdl_stage_duration_seconds", ended - started, stage=stage)
+        self.timings.append(
+            {
+                "stage": stage,
+                "start": round(started - self.origin, 3),
+                "end": round(ended - self.origin, 3),
+            }
+        )
+        update_job(self.redis, self.job_id, timings=self.timings)
+
+    def start(self) -> None:
+        """Record the queue wait and mark the job as running."""
+        if self.job_data.get("prefetch"):
+            prefetch.check_preempted(self.redis, self.job_id)
+        created_at = datetime.fromisoformat(self.job_data["created_at"])
+        queue_wait = (self.started_at - created_at).total_seconds()
+        observe(self.redis, "ytdl_stage_duration_seconds", queue_wait, stage="queue")
+        update_job(
+            self.redis,
+            self.job_id,
             status=JobStatus.RUNNING.value,
             progress={"stage": ProgressStage.DOWNLOADING.value, "pct": 0},
+            started_at=self.started_at.isoformat(),
+            timings=[],
+            attempts=self.attempts,
         )
 
-        # Progress callback
-        def on_progress(stage: str, pct: int):
-            update_job(
-                redis,
-                job_id,
-                progress={"stage": stage, "pct": pct},
-            )
+    def download(self) -> None:
+        """Download the video, moving to disk if it outgrows RAM staging."""
+        try:
+            self._download()
+        except (OSError, DownloadError) as e:
+            if not self.memory_dir or not staging.out_of_space(e):
+                raise
+            logger.warning(f"Memory staging full for job {self.job_id}; downloading to disk")
+            self._leave_memory()
+            self._download()
 
-        # Download video (with Cobalt fallback for bot detection)
-        logger.info(f"Processing job {job_id}: {url} at {quality}p")
-        output_file = None
+        if self.memory_dir and staging.too_large(self.output_file):
+            logger.info(f"Job {self.job_id} is larger than estimated; processing on disk")
+            self._leave_memory()
+
+    def _leave_memory(self) -> None:
+        """Move the job from RAM staging to its disk work directory."""
+        self.disk_dir.mkdir(parents=True, exist_ok=True)
+        if self.output_file and self.output_file.exists():
+            target = self.disk_dir / self.output_file.name
+            self.output_file = Path(shutil.move(self.output_file, target))
+        shutil.rmtree(self.memory_dir, ignore_errors=True)
+        self.work_dir = self.disk_dir
+        self.memory_dir = None
+        inc(self.redis, "ytdl_memory_staging_total", outcome="fallback")
 
+    def _download(self) -> None:
+        """Download the video (with Cobalt fallback for bot detection)."""
+        redis, job_id = self.redis, self.job_id
+        url = self.job_data["url"]
+        quality = self.job_data["quality"]
+        stream = self.job_data.get("stream", False)
+        file_callback = self.on_file if stream else None
+
+        logger.info(f"Processing job {job_id}: {url} at {quality}p")
         try:
-            output_file = download_video(url, quality, work_dir, on_progress)
+            with leased_identity(redis, job_id, self.stage_durations) as identity:
+                if identity:
+                    update_job(redis, job_id, identity=identity.name)
+                self.output_file = download_video(
+                    url,
+                    quality,
+                    self.work_dir,
+                    self.on_progress,
+                    progressive=stream,
+                    file_callback=file_callback,
+                    stage_callback=self.on_stage,
+                    identity=identity,
+                    fragment_tuner=FragmentTuner(redis),
+                    bandwidth=self.bandwidth,
+                )
         except DownloadError as e:
-            if should_fallback_to_cobalt(e):
+            fallback = should_fallback_to_cobalt(e)
+            inc(
+                redis,
+                "ytdl_cobalt_fallback_checks_total",
+                decision="fallback" if fallback else "no_fallback",
+            )
+            if fallback:
                 logger.info("yt-dlp failed with bot detection, trying Cobalt fallback")
+                self.backend = "cobalt"
                 update_job(
                     redis,
                     job_id,
                     progress={"stage": ProgressStage.DOWNLOADING.value, "pct": 0},
                 )
-                output_file = download_with_cobalt(url, quality, work_dir, on_progress)
+                self.output_file = download_with_cobalt(
+                    url,
+                    quality,
+                    self.work_dir,
+                    self.on_progress,
+                    file_callback,
+                    self.on_stage,
+                    self.bandwidth,
+                )
             else:
                 raise
 
-        if output_file is None:
+        if self.output_file is None:
             raise DownloadError(ErrorCode.DOWNLOAD_FAILED, "No output file produced")
 
-        # Update progress - uploading
+        file_size = self.output_file.stat().st_size
+        inc(redis, "ytdl_download_bytes_total", file_size, backend=self.backend)
+        if self.stage_durations.get("download"):
+            throughput = file_size / self.stage_durations["download"]
+            observe(
+                redis, "ytdl_download_throughput_bytes_per_second", throughput, backend=self.backend
+            )
+            if not self.job_data.get("prefetch"):
+                # Prefetches are throttled on purpose; they would understate the node
+                degrade.record_throughput(redis, throughput)
+
+    def process(self) -> None:
+        """Make sure iOS can play the file and start playback before it is all fetched."""
         update_job(
-            redis,
-            job_id,
+            self.redis,
+            self.job_id,
+            progress={"stage": ProgressStage.PROCESSING.value, "pct": 0},
+        )
+        if settings.transcode_incompatible:
+            if self.memory_dir:
+                # Segments, encodes and the joined output need several times
+                # the file's size, more than RAM staging was sized for
+                logger.info(f"Moving job {self.job_id} to disk for transcoding")
+                self._leave_memory()
+            with timed_stage("transcode", self.on_stage):
+                self.output_file = transcode(self.output_file, self.on_progress)
+        with timed_stage("faststart", self.on_stage):
+            try:
+                self.output_file = ensure_faststart(self.output_file, self.on_progress)
+            except OSError as e:
+                if not self.memory_dir or not staging.out_of_space(e):
+                    raise
+                logger.warning(f"Memory staging full for job {self.job_id}; processing on disk")
+                self._leave_memory()
+                self.output_file = ensure_faststart(self.output_file, self.on_progress)
+
+    def upload(self) -> None:
+        """Upload to R2 and mark the job as done."""
+        update_job(
+            self.redis,
+            self.job_id,
             progress={"stage": ProgressStage.UPLOADING.value, "pct": 0},
         )
 
-        # Upload to R2
-        object_key = f"videos/{job_id}/{output_file.name}"
-        upload_file(output_file, object_key)
+        object_key = f"videos/{self.job_id}/{self.output_file.name}"
+        with timed_stage("upload", self.on_stage):
+            upload_file(self.output_file, object_key)
 
         # Generate presigned URL
         download_url, expires_at = generate_presigned_url(object_key)
 
-        # Update job as done
+        # A run given up on must not mark a job done that may be running again
+        self._check_cancelled()
         update_job(
-            redis,
-            job_id,
+            self.redis,
+            self.job_id,
             status=JobStatus.DONE.value,
             download_url=download_url,
             expires_at=expires_at.isoformat(),
-            filename=output_file.name,
+            filename=self.output_file.name,
             object_key=object_key,
-            completed_at=datetime.now(timezone.utc).isoformat(),
+            completed_at=datetime.now(UTC).isoformat(),
         )
+        if self.job_data.get("prefetch"):
+            prefetch.complete(self.redis, self.job_data, object_key, self.output_file.name)
 
-        logger.info(f"Job {job_id} completed successfully")
+        logger.info(f"Job {self.job_id} completed successfully")
 
-    except YTDLError as e:
-        logger.error(f"Job {job_id} failed: {e.code} - {e.message}")
-        update_job(
-            redis,
-            job_id,
-            status=JobStatus.ERROR.value,
-            error_code=e.code.value,
-            message=e.message,
-        )
+    def fail(self, e: Exception, retry: bool = True) -> None:
+        """Record a failed stage: schedule a retry (if `retry` allows) or mark the job as error."""
+        if isinstance(e, YTDLError):
+            code, message = e.code, e.message
+            logger.error(f"Job {self.job_id} failed: {code} - {message}")
+        else:
+            code, message = ErrorCode.INTERNAL_ERROR, str(e)
+            logger.error(f"Job {self.job_id} failed with unexpected error: {e}")
+        if self.job_data.get("prefetch"):
+            prefetch.abandon(self.redis, self.job_id, self.job_data, code, message)
+        else:
+            fail_job(self.redis, self.job_id, code, message, self.attempts, retry=retry)
 
-    except Exception as e:
-        logger.error(f"Job {job_id} failed with unexpected error: {e}")
-        update_job(
-            redis,
-            job_id,
-            status=JobStatus.ERROR.value,
-            error_code=ErrorCode.INTERNAL_ERROR.value,
-            message=str(e),
-        )
+    def finish(self) -> None:
+        """Export spans and clean up the work directory, keeping partials for a retry."""
+        final_data = get_job_data(self.redis, self.job_id)
+        if final_data:
+            export_spans(final_data)
+        done = bool(final_data) and final_data["status"] == JobStatus.DONE.value
 
-    finally:
-        # Clean up work directory
-        try:
-            shutil.rmtree(work_dir, ignore_errors=True)
-            logger.info(f"Cleaned up work directory: {work_dir}")
-        except Exception as e:
-            logger.warning(f"Failed to clean up work directory: {e}")
+        for path in {self.work_dir, self.work_area} - {None}:
+            # Keep a failed job's partial download so a retry can resume it;
+            # memory staging is always freed
+            if path == self.work_area and not done:
+                logger.info(f"Keeping partial download for retry: {path}")
+                continue
+            # Clean up work directory
+            try:
+                shutil.rmtree(path, ignore_errors=True)
+                logger.info(f"Cleaned up work directory: {path}")
+            except Exception as e:
+                logger.warning(f"Failed to clean up work directory: {e}")
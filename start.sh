@@ -9,7 +9,7 @@ echo "Storage mode: ${STORAGE_MODE:-local}"
 
 # Start worker in background
 echo "Starting worker..."
-uv run rq worker --url "$REDIS_URL" &
+uv run rq worker -w ytdl.worker.Worker --url "$REDIS_URL" fast default &
 WORKER_PID=$!
 
 # Start API server in foreground
@@ -0,0 +1,32 @@
+"""Shared fixtures: a fakeredis server standing in for Redis, and an API client."""
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+
+from ytdl import connections
+from ytdl.config import settings
+
+
+@pytest.fixture
+def redis(monkeypatch: pytest.MonkeyPatch) -> fakeredis.FakeRedis:
+    """Fresh in-memory Redis, handed out by get_redis() and queue_connections()."""
+    server = fakeredis.FakeServer()
+    clients = {
+        (settings.redis_url, False, True): fakeredis.FakeRedis(
+            server=server, decode_responses=True
+        ),
+        (settings.redis_url, False, False): fakeredis.FakeRedis(server=server),
+    }
+    monkeypatch.setattr(connections, "_clients", clients)
+    monkeypatch.setattr(settings, "redis_cluster", False)
+    monkeypatch.setattr(settings, "queue_urls", [])
+    return connections.get_redis()
+
+
+@pytest.fixture
+def client(redis: fakeredis.FakeRedis) -> TestClient:
+    """API client authenticated as the default tenant (lifespan tasks not started)."""
+    from ytdl.main import app
+
+    return TestClient(app, headers={"X-API-Token": settings.api_token})
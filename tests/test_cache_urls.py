@@ -0,0 +1,56 @@
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from ytdl.config import StorageMode, settings
+from ytdl.storage import _generate_cached_url, verify_signature
+
+OBJECT_KEY = "videos/abc/My Video.mp4"
+
+
+@pytest.fixture(autouse=True)
+def cache_tier(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "storage_mode", StorageMode.R2)
+    monkeypatch.setattr(settings, "cache_max_mb", 100)
+    monkeypatch.setattr(settings, "cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(settings, "url_signing_key", "signing-key")
+    monkeypatch.setattr(settings, "base_url", "https://dl.example.com/")
+
+
+def signed_query(object_key: str = OBJECT_KEY) -> tuple[str, int, str]:
+    url, _ = _generate_cached_url(object_key, expiry_minutes=5)
+    parts = urlsplit(url)
+    query = parse_qs(parts.query)
+    return parts.path, int(query["expires"][0]), query["sig"][0]
+
+
+def test_signed_url_verifies():
+    path, expires, sig = signed_query()
+    assert path == "/files/videos/abc/My%20Video.mp4"
+    assert verify_signature(OBJECT_KEY, expires, sig)
+
+
+def test_tampered_or_expired_signature_is_refused(monkeypatch):
+    _, expires, sig = signed_query()
+    assert not verify_signature("videos/abc/other.mp4", expires, sig)
+    assert not verify_signature(OBJECT_KEY, expires + 1, sig)
+    assert not verify_signature(OBJECT_KEY, expires, sig[:-1] + ("1" if sig[-1] == "0" else "0"))
+    assert not verify_signature(OBJECT_KEY, int(time.time()) - 1, sig)
+
+    monkeypatch.setattr(settings, "url_signing_key", "rotated")
+    assert not verify_signature(OBJECT_KEY, expires, sig)
+
+
+def test_files_endpoint_serves_cached_object(client, tmp_path):
+    cached = tmp_path / "cache" / OBJECT_KEY
+    cached.parent.mkdir(parents=True)
+    cached.write_bytes(b"video")
+    path, expires, sig = signed_query()
+
+    response = client.get(path, params={"expires": expires, "sig": sig})
+    assert response.status_code == 200
+    assert response.content == b"video"
+
+    forged = client.get(path, params={"expires": expires + 60, "sig": sig})
+    assert forged.status_code == 403
@@ -0,0 +1,74 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from ytdl.config import settings
+from ytdl.degrade import choose_quality, record_throughput, select_quality
+from ytdl.jobs import get_job_data, set_job_data
+
+# 100 s of video at 1 MB/s: best takes 375 s, 1080 takes 97.5 s, 720 takes 48 s
+DURATION = 100.0
+RATE = 1_000_000.0
+
+
+@pytest.fixture(autouse=True)
+def policy(monkeypatch, redis):
+    monkeypatch.setattr(settings, "quality_target_seconds", 300)
+    monkeypatch.setattr(settings, "node_bandwidth_mbps", 0)
+    record_throughput(redis, RATE)
+
+
+def job(waited: float = 0.0, **fields) -> dict:
+    created_at = datetime.now(UTC) - timedelta(seconds=waited)
+    return {
+        "job_id": "job-1",
+        "quality": "best",
+        "min_quality": "480",
+        "duration": DURATION,
+        "created_at": created_at.isoformat(),
+        **fields,
+    }
+
+
+@pytest.mark.parametrize(
+    ("waited", "expected"),
+    [(0, "1080"), (250, "720"), (295, "480"), (400, "480")],
+)
+def test_best_tier_that_fits_the_remaining_budget(redis, waited, expected):
+    assert choose_quality(redis, job(waited)) == expected
+
+
+def test_never_below_min_quality(redis):
+    assert choose_quality(redis, job(295, min_quality="1080")) == "1080"
+
+
+def test_fast_enough_node_keeps_requested_quality(redis):
+    for _ in range(50):
+        record_throughput(redis, 100 * RATE)
+    assert choose_quality(redis, job()) == "best"
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [{"min_quality": None}, {"duration": None}],
+    ids=["no min_quality", "unknown duration"],
+)
+def test_requested_quality_without_enough_to_go_on(redis, fields):
+    assert choose_quality(redis, job(**fields)) == "best"
+
+
+def test_policy_off_keeps_requested_quality(redis, monkeypatch):
+    monkeypatch.setattr(settings, "quality_target_seconds", 0)
+    assert choose_quality(redis, job(400)) == "best"
+
+
+def test_every_attempt_chooses_again_from_the_requested_quality(redis):
+    set_job_data(redis, "job-1", job(250))
+    degraded = select_quality(redis, "job-1", get_job_data(redis, "job-1"))
+    assert (degraded["quality"], degraded["requested_quality"]) == ("720", "best")
+
+    # A retry on a faster node goes back up
+    for _ in range(50):
+        record_throughput(redis, 100 * RATE)
+    retried = select_quality(redis, "job-1", get_job_data(redis, "job-1"))
+    assert (retried["quality"], retried["requested_quality"]) == ("best", "best")
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+from rq import Queue
+
+from ytdl.config import Tenant, settings
+from ytdl.connections import queue_connections
+from ytdl.jobs import DEFAULT_LANE, set_job_data
+from ytdl.scheduler import LOCK_KEY, dispatch, queue_key
+
+
+@pytest.fixture(autouse=True)
+def tenants(monkeypatch):
+    monkeypatch.setattr(
+        settings,
+        "tenants",
+        [Tenant(name="big", token="big-token", weight=2.0), Tenant(name="small", token="small")],
+    )
+    monkeypatch.setattr(settings, "prefetch_max_jobs", 0)
+
+
+def submit(redis, tenant: str, count: int) -> list[str]:
+    """Queue jobs for a tenant without dispatching them."""
+    job_ids = []
+    for i in range(count):
+        job_id = f"{tenant}-{i}"
+        set_job_data(
+            redis,
+            job_id,
+            {
+                "job_id": job_id,
+                "url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+                "quality": "720",
+                "status": "queued",
+                "tenant": tenant,
+            },
+        )
+        redis.zadd(queue_key(tenant), {job_id: time.time() + i})
+        job_ids.append(job_id)
+    return job_ids
+
+
+def enqueued() -> list[str]:
+    queue = Queue(DEFAULT_LANE, connection=queue_connections()[0])
+    return [job.args[0] for job in queue.jobs]
+
+
+def test_tenants_share_slots_by_weight(redis, monkeypatch):
+    submit(redis, "big", 10)
+    submit(redis, "small", 10)
+    # No workers: only DISPATCH_DEPTH jobs fit on the lane
+    monkeypatch.setattr(settings, "dispatch_depth", 6)
+
+    assert dispatch(redis) == 6
+
+    job_ids = enqueued()
+    assert sum(job_id.startswith("big") for job_id in job_ids) == 4
+    assert sum(job_id.startswith("small") for job_id in job_ids) == 2
+    # Each tenant's jobs go in submission order
+    assert [job_id for job_id in job_ids if job_id.startswith("big")] == [
+        f"big-{i}" for i in range(4)
+    ]
+    assert not redis.exists(LOCK_KEY)
+
+
+def test_job_taken_by_another_dispatcher_is_not_enqueued_again(redis, monkeypatch):
+    submit(redis, "small", 3)
+    monkeypatch.setattr(settings, "dispatch_depth", 3)
+
+    zrem = redis.zrem
+
+    def racing_zrem(key, *members):
+        if "small-0" in members and redis.zscore(key, "small-0") is not None:
+            # Another dispatcher gets there between our read and our removal
+            zrem(key, "small-0")
+            return 0
+        return zrem(key, *members)
+
+    monkeypatch.setattr(redis, "zrem", racing_zrem)
+
+    assert dispatch(redis) == 2
+    assert enqueued() == ["small-1", "small-2"]
+
+
+def test_dispatch_waits_for_the_lock_holder(redis, monkeypatch):
+    submit(redis, "small", 1)
+    monkeypatch.setattr(settings, "dispatch_depth", 1)
+    redis.set(LOCK_KEY, "someone-else", px=5000)
+
+    assert dispatch(redis) == 0
+    assert enqueued() == []
+    assert redis.get(LOCK_KEY) == "someone-else"
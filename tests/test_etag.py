@@ -0,0 +1,72 @@
+from datetime import UTC, datetime
+
+from ytdl.api import _etag, _etag_matches
+from ytdl.jobs import set_job_data, update_job
+from ytdl.scheduler import SEQUENCE_KEY
+
+
+def create_job(redis, job_id: str = "job-1", status: str = "queued") -> None:
+    set_job_data(
+        redis,
+        job_id,
+        {
+            "job_id": job_id,
+            "url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+            "quality": "720",
+            "status": status,
+            "tenant": "default",
+            "created_at": datetime.now(UTC).isoformat(),
+        },
+    )
+
+
+def test_etag_matching():
+    assert _etag_matches('"3"', '"3"')
+    assert _etag_matches('W/"3"', '"3"')
+    assert _etag_matches('"1", "3.7"', '"3.7"')
+    assert _etag_matches("*", '"3"')
+    assert not _etag_matches('"3"', '"3.7"')
+    assert _etag(3) == '"3"' and _etag(3, 7) == '"3.7"'
+
+
+def test_unchanged_job_answers_304(client, redis):
+    create_job(redis, status="done")
+    first = client.get("/jobs/job-1")
+    assert first.status_code == 200
+    assert first.headers["ETag"] == '"1"'
+
+    again = client.get("/jobs/job-1", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["ETag"] == '"1"'
+
+
+def test_update_changes_etag(client, redis):
+    create_job(redis)
+    etag = client.get("/jobs/job-1").headers["ETag"]
+
+    update_job(redis, "job-1", status="running")
+
+    changed = client.get("/jobs/job-1", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()["status"] == "running"
+
+
+def test_queued_etag_moves_with_dispatch(client, redis):
+    create_job(redis)
+    etag = client.get("/jobs/job-1").headers["ETag"]
+    assert client.get("/jobs/job-1", headers={"If-None-Match": etag}).status_code == 304
+
+    # Another job was dispatched: queue positions may have moved
+    redis.incr(SEQUENCE_KEY)
+
+    assert client.get("/jobs/job-1", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_other_tenants_job_is_not_found_even_with_etag(client, redis):
+    create_job(redis)
+    update_job(redis, "job-1", tenant="other")
+
+    response = client.get("/jobs/job-1", headers={"If-None-Match": "*"})
+    assert response.status_code == 404
@@ -0,0 +1,96 @@
+import struct
+
+import pytest
+
+from ytdl.faststart import (
+    FaststartError,
+    _patch_chunk_offsets,
+    _read_top_level_atoms,
+    ensure_faststart,
+    needs_faststart,
+)
+
+
+def atom(kind: bytes, body: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(body), kind) + body
+
+
+def stco(offsets: list[int]) -> bytes:
+    return atom(
+        b"stco",
+        struct.pack(">II", 0, len(offsets)) + b"".join(struct.pack(">I", o) for o in offsets),
+    )
+
+
+def co64(offsets: list[int]) -> bytes:
+    return atom(
+        b"co64",
+        struct.pack(">II", 0, len(offsets)) + b"".join(struct.pack(">Q", o) for o in offsets),
+    )
+
+
+def moov(table: bytes) -> bytes:
+    stbl = atom(b"stbl", table)
+    return atom(b"moov", atom(b"trak", atom(b"mdia", atom(b"minf", stbl))))
+
+
+def chunk_offsets(data: bytes, kind: bytes) -> list[int]:
+    pos = data.index(kind) + 4
+    count = struct.unpack_from(">I", data, pos + 4)[0]
+    width = 8 if kind == b"co64" else 4
+    fmt = ">Q" if kind == b"co64" else ">I"
+    return [struct.unpack_from(fmt, data, pos + 8 + i * width)[0] for i in range(count)]
+
+
+def write_tail_moov(path, table_for) -> tuple[bytes, list[int]]:
+    """ftyp, mdat with two chunks, then moov whose table points at them."""
+    ftyp = atom(b"ftyp", b"isom\0\0\0\0")
+    mdat = atom(b"mdat", b"A" * 100 + b"B" * 100)
+    chunks = [len(ftyp) + 8, len(ftyp) + 8 + 100]
+    path.write_bytes(ftyp + mdat + moov(table_for(chunks)))
+    return mdat, chunks
+
+
+def test_moov_after_mdat_is_moved_to_front_and_stco_patched(tmp_path):
+    path = tmp_path / "v.mp4"
+    mdat, chunks = write_tail_moov(path, stco)
+    assert needs_faststart(path)
+
+    ensure_faststart(path)
+
+    data = path.read_bytes()
+    assert [kind for kind, _, _ in _read_top_level_atoms(path)] == [b"ftyp", b"moov", b"mdat"]
+    offsets = chunk_offsets(data, b"stco")
+    moov_size = len(moov(stco(chunks)))
+    assert offsets == [offset + moov_size for offset in chunks]
+    assert data[offsets[0] : offsets[0] + 100] == b"A" * 100
+    assert data[offsets[1] : offsets[1] + 100] == b"B" * 100
+
+
+def test_co64_offsets_are_patched(tmp_path):
+    path = tmp_path / "v.mp4"
+    _, chunks = write_tail_moov(path, co64)
+
+    ensure_faststart(path)
+
+    data = path.read_bytes()
+    offsets = chunk_offsets(data, b"co64")
+    assert [data[o : o + 1] for o in offsets] == [b"A", b"B"]
+
+
+def test_file_with_moov_in_front_is_untouched(tmp_path):
+    path = tmp_path / "v.mp4"
+    write_tail_moov(path, stco)
+    ensure_faststart(path)
+    before = path.read_bytes()
+
+    assert not needs_faststart(path)
+    ensure_faststart(path)
+    assert path.read_bytes() == before
+
+
+def test_stco_overflow_is_refused():
+    data = bytearray(moov(stco([0xFFFFFF00])))
+
+    with pytest.raises(FaststartError, match="co64 required"):
+        _patch_chunk_offsets(data, 8, len(data), lambda offset: offset + 0x1000)
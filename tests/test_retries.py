@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from ytdl.config import settings
+from ytdl.errors import ErrorCode
+from ytdl.jobs import get_job_data, set_job_data
+from ytdl.retries import RETRY_KEY, fail_job, is_retriable, promote_due_retries, retry_delay
+from ytdl.scheduler import queue_key
+
+
+@pytest.fixture(autouse=True)
+def backoff(monkeypatch):
+    monkeypatch.setattr(settings, "retry_base_delay", 10.0)
+    monkeypatch.setattr(settings, "retry_max_delay", 60.0)
+    monkeypatch.setattr(settings, "max_job_attempts", 3)
+
+
+@pytest.mark.parametrize(
+    ("attempt", "ceiling"),
+    [(1, 10.0), (2, 20.0), (3, 40.0), (4, 60.0), (10, 60.0)],
+)
+def test_retry_delay_doubles_up_to_the_cap_with_jitter(attempt, ceiling):
+    delays = [retry_delay(attempt) for _ in range(200)]
+    assert all(ceiling / 2 <= delay <= ceiling for delay in delays)
+
+
+def test_only_transient_errors_are_retriable():
+    assert is_retriable(ErrorCode.DOWNLOAD_FAILED)
+    assert is_retriable(ErrorCode.WORKER_LOST)
+    assert not is_retriable(ErrorCode.INVALID_URL)
+
+
+@pytest.fixture
+def job(redis):
+    set_job_data(
+        redis,
+        "job-1",
+        {
+            "job_id": "job-1",
+            "url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+            "quality": "720",
+            "status": "running",
+            "tenant": "default",
+        },
+    )
+    return "job-1"
+
+
+def test_transient_failure_is_scheduled_for_retry(redis, job):
+    assert fail_job(redis, job, ErrorCode.DOWNLOAD_FAILED, "boom", attempts=1)
+
+    job_data = get_job_data(redis, job)
+    assert job_data["status"] == "queued"
+    assert job_data["error_code"] == ErrorCode.DOWNLOAD_FAILED
+    due = redis.zscore(RETRY_KEY, job)
+    assert time.time() + 4 <= due <= time.time() + 10
+
+
+@pytest.mark.parametrize(
+    ("code", "attempts", "retry"),
+    [
+        (ErrorCode.INVALID_URL, 1, True),
+        (ErrorCode.DOWNLOAD_FAILED, 3, True),
+        (ErrorCode.DOWNLOAD_FAILED, 1, False),
+    ],
+)
+def test_permanent_exhausted_or_unretriable_failure_is_final(redis, job, code, attempts, retry):
+    assert not fail_job(redis, job, code, "boom", attempts=attempts, retry=retry)
+
+    assert get_job_data(redis, job)["status"] == "error"
+    assert redis.zscore(RETRY_KEY, job) is None
+
+
+def test_due_retries_go_to_the_front_of_the_queue(redis, job, monkeypatch):
+    # Keep jobs in the tenant queue instead of handing them to RQ
+    monkeypatch.setattr("ytdl.scheduler.dispatch", lambda redis: None)
+    redis.zadd(queue_key("default"), {"waiting": 1})
+    fail_job(redis, job, ErrorCode.DOWNLOAD_FAILED, "boom", attempts=1)
+    assert promote_due_retries(redis) == 0
+
+    redis.zadd(RETRY_KEY, {job: time.time() - 1})
+    assert promote_due_retries(redis) == 1
+
+    assert redis.zrange(queue_key("default"), 0, -1) == [job, "waiting"]
+    assert get_job_data(redis, job)["next_retry_at"] is None
+    assert promote_due_retries(redis) == 0
@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import socket
+
+import httpx
+import pytest
+
+from ytdl import webhooks
+from ytdl.config import settings
+from ytdl.jobs import WEBHOOK_KEY, set_job_data
+from ytdl.models import CreateJobRequest
+
+PUBLIC_IP = "93.184.216.34"
+
+
+@pytest.fixture(autouse=True)
+def dns(monkeypatch):
+    """Resolve test host names without the network."""
+    table = {"hooks.example.com": PUBLIC_IP, "rebound.example.com": "169.254.169.254"}
+
+    async def getaddrinfo(self, host, port, **kwargs):
+        if host not in table:
+            raise socket.gaierror(f"unknown host {host}")
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (table[host], port))]
+
+    monkeypatch.setattr(asyncio.BaseEventLoop, "getaddrinfo", getaddrinfo)
+    monkeypatch.setattr(settings, "webhook_max_attempts", 3)
+
+
+def done_job(redis, callback_url: str) -> str:
+    set_job_data(
+        redis,
+        "job-1",
+        {
+            "job_id": "job-1",
+            "status": "done",
+            "tenant": "default",
+            "callback_url": callback_url,
+            "download_url": "https://dl.example.com/v.mp4",
+        },
+    )
+    return "job-1"
+
+
+def deliver(redis, job_id: str, respond) -> list[httpx.Request]:
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return respond(request)
+
+    async def run() -> None:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            await webhooks.deliver(client, redis, job_id)
+
+    asyncio.run(run())
+    return requests
+
+
+def test_signature_is_hmac_of_timestamp_and_body():
+    expected = hmac.new(b"token", b"1700000000.{}", hashlib.sha256).hexdigest()
+    assert webhooks.sign("token", 1700000000, b"{}") == f"sha256={expected}"
+
+
+def test_delivery_is_signed_and_pinned_to_the_resolved_address(redis):
+    job_id = done_job(redis, "https://hooks.example.com/ytdl")
+    redis.delete(WEBHOOK_KEY)
+
+    [request] = deliver(redis, job_id, lambda request: httpx.Response(204))
+
+    assert request.url.host == PUBLIC_IP
+    assert request.headers["Host"] == "hooks.example.com"
+    assert request.extensions["sni_hostname"] == "hooks.example.com"
+    timestamp = int(request.headers["X-Ytdl-Timestamp"])
+    assert request.headers["X-Ytdl-Signature"] == webhooks.sign(
+        settings.api_token, timestamp, request.content
+    )
+    assert json.loads(request.content)["status"] == "done"
+    assert not redis.zcard(WEBHOOK_KEY)
+
+
+@pytest.mark.parametrize(
+    ("status_code", "retried"),
+    [(500, True), (503, True), (429, True), (408, True), (404, False), (400, False)],
+)
+def test_retry_classification(redis, status_code, retried):
+    job_id = done_job(redis, "https://hooks.example.com/ytdl")
+    redis.delete(WEBHOOK_KEY)
+
+    deliver(redis, job_id, lambda request: httpx.Response(status_code))
+
+    assert (redis.zscore(WEBHOOK_KEY, job_id) is not None) == retried
+
+
+def test_network_errors_retry_until_max_attempts(redis):
+    job_id = done_job(redis, "https://hooks.example.com/ytdl")
+
+    def refuse(request):
+        raise httpx.ConnectError("refused")
+
+    for _ in range(settings.webhook_max_attempts - 1):
+        redis.delete(WEBHOOK_KEY)
+        deliver(redis, job_id, refuse)
+        assert redis.zscore(WEBHOOK_KEY, job_id) is not None
+
+    redis.delete(WEBHOOK_KEY)
+    deliver(redis, job_id, refuse)
+    assert redis.zscore(WEBHOOK_KEY, job_id) is None
+    assert redis.hget(webhooks.ATTEMPTS_KEY, job_id) is None
+
+
+def test_host_resolving_to_private_address_is_never_contacted(redis):
+    job_id = done_job(redis, "https://rebound.example.com/ytdl")
+    redis.delete(WEBHOOK_KEY)
+
+    assert deliver(redis, job_id, lambda request: httpx.Response(204)) == []
+    assert not redis.zcard(WEBHOOK_KEY)
+
+
+@pytest.mark.parametrize(
+    "callback_url",
+    [
+        "http://localhost:8080/hook",
+        "http://127.0.0.1/hook",
+        "http://169.254.169.254/latest/meta-data",
+        "http://10.0.0.1/hook",
+        "http://[::1]/hook",
+        "http://[::ffff:192.168.0.1]/hook",
+        "ftp://hooks.example.com/hook",
+    ],
+)
+def test_non_public_callback_urls_are_rejected(callback_url):
+    with pytest.raises(ValueError):
+        CreateJobRequest(url="https://youtu.be/dQw4w9WgXcQ", callback_url=callback_url)
+
+
+def test_public_callback_url_is_accepted():
+    request = CreateJobRequest(
+        url="https://youtu.be/dQw4w9WgXcQ", callback_url="https://hooks.example.com/ytdl"
+    )
+    assert request.callback_url == "https://hooks.example.com/ytdl"